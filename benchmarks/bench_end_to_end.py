@@ -0,0 +1,446 @@
+# benchmarks/bench_end_to_end.py
+#
+# Drives main.process_fire_data end to end against the local stand-ins in
+# benchmarks/fakes.py (FIRMS, WAQI, Nominatim, RSS and APRS-IS) and reports
+# per-stage wall time and peak memory, requests per service and APRS
+# packets per second. Every run happens in a fresh interpreter; results are
+# saved as JSON and can be compared with an earlier file.
+#
+#   python benchmarks/bench_end_to_end.py --rows 500000 --fires 200
+#   python benchmarks/bench_end_to_end.py --waqi-latency-ms 80 --waqi-error-rate 0.05
+#   python benchmarks/bench_end_to_end.py --compare old.json
+
+import argparse
+import datetime
+import functools
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+
+from fakes import FakeServices, ServiceBehaviour
+
+# Same box as the default config.ini
+REGION = {
+    'name': 'cyprus',
+    'latitude1': 35.844535,
+    'latitude2': 34.511083,
+    'longitude1': 31.816406,
+    'longitude2': 34.661865,
+}
+
+# Planted in every generated file; its packets are recognised by the FRP
+MAJOR_FIRE = (34.95, 33.35)
+MAJOR_FIRE_FRP = 999.0
+
+FIRMS_HEADER = "latitude,longitude,bright_ti4,scan,track,acq_date,acq_time,satellite,instrument,confidence,version,bright_ti5,frp,daynight\n"
+
+# Functions timed in the child, as (stage, module, owner, attribute)
+STAGES = [
+    ('ingest', 'fire_aprs_cli.sources', 'MultiSourceDownloader', 'run'),
+    ('download', 'fire_aprs_cli.downloader', 'VIIRSDownloader', 'download'),
+    ('parse_filter', 'fire_aprs_cli.downloader', 'VIIRSDownloader', 'process_csv'),
+    ('dedup', 'fire_aprs_cli.state_store', 'ReportedStore', 'filter_new'),
+    ('cluster', 'fire_aprs_cli.clustering', None, 'cluster_detections'),
+    ('aqi_stations', 'fire_aprs_cli.aqi_fetcher', 'AQIFetcher', 'load_stations'),
+    ('enrich_queue', 'fire_aprs_cli.pipeline', 'EnrichmentPipeline', 'run'),
+    ('mark_reported', 'fire_aprs_cli.state_store', 'ReportedStore', 'mark'),
+    ('aprs_drain', 'fire_aprs_cli.aprs_sender', 'APRSSender', 'disconnect'),
+]
+
+def generate_csv(path, rows, fires, pixels, seed=0, date=None):
+    # Background detections spread over the globe plus `fires` clusters of
+    # `pixels` detections each inside the benchmark region, all acquired on
+    # date (YYYY-MM-DD, default today)
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    today = date or datetime.datetime.utcnow().strftime('%Y-%m-%d')
+    lat_min, lat_max = sorted((REGION['latitude1'], REGION['latitude2']))
+    lon_min, lon_max = sorted((REGION['longitude1'], REGION['longitude2']))
+
+    def write(f, lat, lon, frp=None, confidence=None, minutes=None):
+        # minutes: minute of the day each detection was acquired (random by
+        # default)
+        n = len(lat)
+        ti4 = rng.uniform(295, 367, n)
+        frp = rng.gamma(1.5, 3.0, n) if frp is None else np.full(n, frp)
+        confidence = rng.choice(['l', 'n', 'h'], n, p=[0.2, 0.7, 0.1]) if confidence is None else [confidence] * n
+        minutes = rng.integers(0, 1440, n) if minutes is None else minutes
+        acq = minutes // 60 * 100 + minutes % 60
+        f.writelines(
+            f"{a:.5f},{o:.5f},{t:.2f},0.39,0.36,{today},{q:04d},N,VIIRS,{c},2.0NRT,290.1,{p:.2f},D\n"
+            for a, o, t, q, c, p in zip(lat, lon, ti4, acq, confidence, frp)
+        )
+
+    with open(path, 'w') as f:
+        f.write(FIRMS_HEADER)
+        block = 500000
+        for start in range(0, rows, block):
+            n = min(block, rows - start)
+            write(f, rng.uniform(-60, 70, n), rng.uniform(-180, 180, n))
+        centers_lat = rng.uniform(lat_min, lat_max, fires)
+        centers_lon = rng.uniform(lon_min, lon_max, fires)
+        # ~300 m spread and one overpass (pixels within 5 minutes of it),
+        # so each fire's pixels cluster into one incident
+        lat = np.repeat(centers_lat, pixels) + rng.normal(0, 0.003, fires * pixels)
+        lon = np.repeat(centers_lon, pixels) + rng.normal(0, 0.003, fires * pixels)
+        overpass = np.repeat(rng.integers(0, 1435, fires), pixels) + rng.integers(0, 6, fires * pixels)
+        write(f, lat, lon, minutes=overpass)
+        # One major fire last in the file, seen on the latest overpass, to
+        # time how soon it is reported
+        latest = overpass.max() if fires else 1434
+        write(f, rng.normal(MAJOR_FIRE[0], 0.003, pixels * 5), rng.normal(MAJOR_FIRE[1], 0.003, pixels * 5),
+              frp=MAJOR_FIRE_FRP, confidence='h', minutes=np.full(pixels * 5, latest))
+
+def write_config(path, workdir, fakes, args):
+    unlimited = args.service_limits == 'unlimited'
+    lines = [
+        "[viirs]",
+        f"url = {fakes.http_url}/firms/global_24h.csv",
+        f"filepath = {os.path.join(workdir, 'global_24h.csv')}",
+    ]
+    firms_mode = getattr(args, 'firms_mode', 'file')
+    if firms_mode != 'file':
+        # area-bad-key makes the area query fail so the global file is used
+        lines += [
+            "mode = area",
+            f"area_url = {fakes.http_url}/firms/api/area/csv",
+            f"map_key = {fakes.map_key if firms_mode == 'area' else 'wrong'}",
+        ]
+    lines += [
+        "",
+    ]
+    # Extra feeds serve the same file, so every detection has a duplicate
+    # from each of them for the cross-sensor dedup to remove
+    for index in range(2, getattr(args, 'sources', 1) + 1):
+        lines += [
+            f"[source:feed{index}]",
+            f"url = {fakes.http_url}/firms/feed{index}_24h.csv",
+            f"filepath = {os.path.join(workdir, f'feed{index}_24h.csv')}",
+            "",
+        ]
+    # Tenants all watch the benchmark region, each under its own callsign
+    for index in range(1, getattr(args, 'tenants', 0) + 1):
+        lines += [
+            f"[tenant:t{index}]",
+            f"regions = {REGION['name']}",
+            f"callsign = N0CALL-{index}",
+            f"state_path = {os.path.join(workdir, f'reported-t{index}.sqlite')}",
+            "",
+        ]
+    lines += [
+        f"[region:{REGION['name']}]",
+        *(f"{key} = {REGION[key]}" for key in ('latitude1', 'latitude2', 'longitude1', 'longitude2')),
+        "",
+        "[aprssend]",
+        "callsign = N0CALL",
+        "password = -1",
+        "comment = Fire Alert",
+        "symbol = T",
+        "host = 127.0.0.1",
+        f"port = {fakes.aprs_port}",
+        f"packets_per_minute = {args.aprs_rate}",
+        f"burst = {args.aprs_burst}",
+        f"position_format = {getattr(args, 'aprs_format', 'uncompressed')}",
+        f"report = {getattr(args, 'aprs_report', 'position')}",
+        "",
+        "[AQI]",
+        "authtoken = bench",
+        f"api_url = {fakes.http_url}/waqi",
+        f"batch = {'true' if args.aqi_mode == 'batch' else 'false'}",
+        "",
+        "[geocode]",
+        f"cache_path = {os.path.join(workdir, 'geocode_cache.sqlite')}",
+        f"nominatim_url = {fakes.http_url}/nominatim",
+        "",
+        "[newsfeed]",
+        f"link = {fakes.http_url}/rss/feed.xml",
+        "keyword = fire",
+        "",
+        "[state]",
+        f"path = {os.path.join(workdir, 'reported.sqlite')}",
+        "",
+        "[priority]",
+        f"enabled = {'false' if getattr(args, 'no_priority', False) else 'true'}",
+        f"max_packets_per_hour = {getattr(args, 'max_per_hour', 0)}",
+        "",
+        "[pipeline]",
+        f"workers = {args.workers}",
+    ]
+    if unlimited:
+        # Measure the code, not the providers' usage policies
+        for service in ('nominatim', 'waqi', 'rss'):
+            lines += [f"{service}_concurrency = {args.workers}", f"{service}_rate = 0"]
+    lines += [
+        "",
+        "[metrics]",
+        f"summary_path = {os.path.join(workdir, 'run_metrics.jsonl')}",
+        "",
+        "[logging]",
+        f"level = {args.log_level}",
+        f"log_file = {os.path.join(workdir, 'fire_aprs.log')}",
+    ]
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+    return maxrss / 1024
+
+def instrument(stats, stage, owner, attribute):
+    original = getattr(owner, attribute)
+    entry = stats.setdefault(stage, {'seconds': 0.0, 'calls': 0, 'peak_rss_mib': None})
+
+    def record(start):
+        entry['seconds'] += time.perf_counter() - start
+        entry['calls'] += 1
+        entry['peak_rss_mib'] = peak_rss_mib()
+
+    if stage == 'enrich_queue':
+        # A generator: time it until the caller has consumed every result
+        @functools.wraps(original)
+        def wrapper(*a, **kw):
+            start = time.perf_counter()
+            try:
+                yield from original(*a, **kw)
+            finally:
+                record(start)
+    else:
+        @functools.wraps(original)
+        def wrapper(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return original(*a, **kw)
+            finally:
+                record(start)
+    setattr(owner, attribute, wrapper)
+
+def run_child(config_path, args):
+    import importlib
+
+    baseline = peak_rss_mib()
+    import_start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - import_start
+
+    stats = {}
+    for stage, module_name, owner_name, attribute in STAGES:
+        module = importlib.import_module(module_name)
+        owner = getattr(module, owner_name) if owner_name else module
+        instrument(stats, stage, owner, attribute)
+
+    config = main.load_config(config_path)
+    logging.basicConfig(
+        level=getattr(logging, config['logging']['level'].upper(), logging.WARNING),
+        filename=config['logging']['log_file'],
+        format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
+    )
+    start = time.perf_counter()
+    start_monotonic = time.monotonic()
+    main.process_fire_data(
+        config,
+        enable_aqi=not args.no_aqi,
+        enable_news=not args.no_news,
+        reprocess=True,
+    )
+    total = time.perf_counter() - start
+    # The tool's own per-run summary, for the counters and cache ratios
+    with open(config['metrics']['summary_path']) as f:
+        summary = json.loads(f.readlines()[-1])
+    print(json.dumps({
+        'import_seconds': import_seconds,
+        'total_seconds': total,
+        'start_monotonic': start_monotonic,
+        'baseline_rss_mib': baseline,
+        'peak_rss_mib': peak_rss_mib(),
+        'stages': stats,
+        'metrics': summary,
+    }))
+
+def spawn(*argv):
+    # Every run gets a fresh interpreter: on Linux the peak RSS of a forked
+    # child starts at the parent's, so the parent must stay small too
+    out = subprocess.run([sys.executable, __file__, *argv], check=True, capture_output=True, text=True)
+    return out.stdout.strip().splitlines()[-1] if out.stdout.strip() else None
+
+def alert_times(fakes, child):
+    # The fake APRS server runs in this process; time.monotonic() is the same
+    # clock in the child on Linux and macOS
+    with fakes.lock:
+        packets = list(fakes.packets)
+    start = child['start_monotonic']
+    fire_packets = [(at, line) for at, line in packets if 'No fires' not in line]
+    marker = f"FRP {MAJOR_FIRE_FRP:.0f}MW"
+    major = next(((i, at) for i, (at, line) in enumerate(fire_packets, start=1) if marker in line), None)
+    return {
+        'first_packet_seconds': fire_packets[0][0] - start if fire_packets else None,
+        'major_fire_seconds': major[1] - start if major else None,
+        'major_fire_position': major[0] if major else None,
+    }
+
+def print_run(index, run):
+    child = run['child']
+    aprs = run['services']['aprs']
+    pps = aprs['packets_per_second']
+    print(f"\nrun {index}: {child['total_seconds']:.2f}s total, peak RSS {child['peak_rss_mib']:.1f} MiB, "
+          f"imports {child['import_seconds']:.2f}s")
+    print(f"  {'stage':<16}{'wall (s)':>10}{'calls':>7}{'peak RSS (MiB)':>16}")
+    for stage, _, _, _ in STAGES:
+        entry = child['stages'].get(stage)
+        if entry and entry['calls']:
+            print(f"  {stage:<16}{entry['seconds']:>10.3f}{entry['calls']:>7}{entry['peak_rss_mib']:>16.1f}")
+    requests = ", ".join(
+        f"{name} {c['requests']} ({c['errors']} err, {c['not_modified']} 304)"
+        for name, c in run['services']['requests'].items()
+    )
+    firms = run['services']['requests']['firms']
+    print(f"  FIRMS: {firms['bytes'] / 2**20:.2f} MiB transferred")
+    print(f"  requests: {requests}")
+    ratios = ", ".join(
+        f"{cache} {ratio:.0%}" for cache, ratio in child['metrics']['cache_hit_ratio'].items() if ratio is not None
+    )
+    if ratios:
+        print(f"  cache hit ratios: {ratios}")
+    alerts = run['alerts']
+    if alerts['first_packet_seconds'] is not None:
+        major = alerts['major_fire_seconds']
+        print(f"  time to first packet {alerts['first_packet_seconds']:.2f}s, to the major fire "
+              + (f"{major:.2f}s (packet {alerts['major_fire_position']})" if major is not None else "never"))
+    print(f"  APRS: {aprs['logins']} login(s), {aprs['packets']} packets, {aprs['bytes']} bytes"
+          + (f", {pps:.1f} packets/s" if pps else ""))
+
+def compare(previous_path, results):
+    with open(previous_path) as f:
+        previous = json.load(f)
+
+    def averages(doc):
+        runs = doc['runs']
+        totals = {'total': sum(r['child']['total_seconds'] for r in runs) / len(runs)}
+        for stage, _, _, _ in STAGES:
+            values = [r['child']['stages'].get(stage, {}).get('seconds', 0.0) for r in runs]
+            totals[stage] = sum(values) / len(values)
+        totals['peak_rss_mib'] = max(r['child']['peak_rss_mib'] for r in runs)
+        return totals
+
+    before, after = averages(previous), averages(results)
+    print(f"\nCompared with {previous_path} (mean over runs):")
+    print(f"  {'metric':<16}{'before':>10}{'after':>10}{'change':>9}")
+    for key in before:
+        change = f"{(after[key] - before[key]) / before[key]:+.0%}" if before[key] else ''
+        print(f"  {key:<16}{before[key]:>10.3f}{after[key]:>10.3f}{change:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local fake services")
+    parser.add_argument('--rows', type=int, default=500000, help='Global background detections in the FIRMS file')
+    parser.add_argument('--fires', type=int, default=200, help='Fires inside the benchmark region')
+    parser.add_argument('--pixels', type=int, default=4, help='Detections per fire')
+    parser.add_argument('--runs', type=int, default=1, help='Number of runs')
+    parser.add_argument('--sources', type=int, default=1,
+                        help='FIRMS feeds downloaded concurrently (extra ones serve the same file)')
+    parser.add_argument('--keep-caches', action='store_true',
+                        help='Keep the downloaded file and geocode cache between runs (only the reported store is reset)')
+    parser.add_argument('--workers', type=int, default=8, help='Enrichment pipeline workers')
+    parser.add_argument('--aqi-mode', choices=('batch', 'per-record'), default='batch',
+                        help='WAQI station batch query or one geocode + feed request per incident')
+    parser.add_argument('--service-limits', choices=('unlimited', 'default'), default='unlimited',
+                        help='Lift the per-service rate limits or keep the production defaults')
+    parser.add_argument('--aprs-rate', type=float, default=6000, help='APRS packets per minute')
+    parser.add_argument('--aprs-burst', type=int, default=10, help='APRS burst size')
+    parser.add_argument('--aprs-format', choices=('uncompressed', 'compressed'), default='uncompressed',
+                        help='APRS position encoding')
+    parser.add_argument('--aprs-report', choices=('position', 'object', 'item'), default='position',
+                        help='APRS report type per incident')
+    parser.add_argument('--firms-mode', choices=('file', 'area', 'area-bad-key'), default='file',
+                        help='Download the global file, query the FIRMS area API, or query it with a bad key (fallback)')
+    parser.add_argument('--tenants', type=int, default=0,
+                        help='Deliver to this many [tenant:*] sections (own callsign each) from one ingest')
+    parser.add_argument('--no-priority', action='store_true',
+                        help='Send incidents in file order instead of most important first')
+    parser.add_argument('--no-aqi', action='store_true', help='Disable AQI enrichment')
+    parser.add_argument('--no-news', action='store_true', help='Disable news enrichment')
+    for service in ('firms', 'waqi', 'nominatim', 'rss'):
+        parser.add_argument(f'--{service}-latency-ms', type=float, default=0.0, help=f'Added latency per {service} request')
+        parser.add_argument(f'--{service}-error-rate', type=float, default=0.0, help=f'Share of {service} requests answered with a 500')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Uniform +- jitter on every injected latency')
+    parser.add_argument('--log-level', default='WARNING', help='Log level of the benchmarked runs')
+    parser.add_argument('--output', help='Where to write the JSON results (default: bench_end_to_end-<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier JSON results to compare against')
+    parser.add_argument('--csv', help=argparse.SUPPRESS)
+    parser.add_argument('--generate', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_csv(args.csv, args.rows, args.fires, args.pixels)
+        return
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix='fireaprs-bench-')
+    try:
+        csv_path = os.path.join(tmpdir, 'firms.csv')
+        print(f"Generating {args.rows} background rows and {args.fires} fires x {args.pixels} pixels ...")
+        spawn('--generate', '--csv', csv_path, '--rows', str(args.rows),
+              '--fires', str(args.fires), '--pixels', str(args.pixels))
+        print(f"CSV size: {os.path.getsize(csv_path) / 2**20:.1f} MiB")
+
+        behaviour = {
+            service: ServiceBehaviour(
+                latency=getattr(args, f'{service}_latency_ms') / 1000,
+                jitter=args.jitter_ms / 1000,
+                error_rate=getattr(args, f'{service}_error_rate'),
+            )
+            for service in ('firms', 'waqi', 'nominatim', 'rss')
+        }
+        fakes = FakeServices(csv_path, places=[REGION['name']], behaviour=behaviour).start()
+
+        child_flags = [flag for flag, on in (('--no-aqi', args.no_aqi), ('--no-news', args.no_news)) if on]
+        runs = []
+        for index in range(1, args.runs + 1):
+            workdir = os.path.join(tmpdir, 'work' if args.keep_caches else f'run-{index}')
+            os.makedirs(workdir, exist_ok=True)
+            for name in os.listdir(workdir):
+                if name.startswith('reported'):
+                    os.remove(os.path.join(workdir, name))
+            config_path = os.path.join(workdir, 'config.ini')
+            write_config(config_path, workdir, fakes, args)
+
+            fakes.reset()
+            child = json.loads(spawn('--child', config_path, *child_flags))
+            run = {'child': child, 'services': fakes.snapshot(), 'alerts': alert_times(fakes, child)}
+            runs.append(run)
+            print_run(index, run)
+        fakes.stop()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    results = {
+        'created': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': sys.version.split()[0],
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('csv', 'generate', 'child', 'compare', 'output')},
+        'runs': runs,
+    }
+    output = args.output or f"bench_end_to_end-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main()
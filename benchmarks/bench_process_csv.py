@@ -0,0 +1,128 @@
+# benchmarks/bench_process_csv.py
+#
+# Compares peak RSS and wall time of filtering the global CSV with the
+# pandas parser loading it in one go (chunksize = 0) or streaming it in
+# chunks, and with the fast scanner, which ignores chunksize. Each mode runs
+# in its own subprocess so ru_maxrss is not shared.
+#
+#   python benchmarks/bench_process_csv.py --rows 3000000
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Same box as the default config.ini
+BBOX = {
+    'latitude1': 35.844535,
+    'latitude2': 34.511083,
+    'longitude1': 31.816406,
+    'longitude2': 34.661865,
+}
+
+FIRMS_HEADER = "latitude,longitude,bright_ti4,scan,track,acq_date,acq_time,satellite,instrument,confidence,version,bright_ti5,frp,daynight\n"
+
+def generate_csv(path, rows, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    block = 500000
+    with open(path, 'w') as f:
+        f.write(FIRMS_HEADER)
+        for start in range(0, rows, block):
+            n = min(block, rows - start)
+            lat = rng.uniform(-60, 70, n)
+            lon = rng.uniform(-180, 180, n)
+            ti4 = rng.uniform(295, 367, n)
+            frp = rng.gamma(1.5, 3.0, n)
+            acq = rng.integers(0, 2400, n)
+            lines = [
+                f"{a:.5f},{o:.5f},{t:.2f},0.39,0.36,2024-07-01,{q:04d},N,VIIRS,n,2.0NRT,290.1,{p:.2f},D\n"
+                for a, o, t, q, p in zip(lat, lon, ti4, acq, frp)
+            ]
+            f.writelines(lines)
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+    return maxrss / 1024
+
+def run_mode(path, parser, chunksize):
+    from fire_aprs_cli.downloader import VIIRSDownloader
+
+    config = dict(BBOX, url='file://' + path, filepath=path, parser=parser, chunksize=chunksize)
+    downloader = VIIRSDownloader(config)
+    baseline = peak_rss_mib()
+    start = time.perf_counter()
+    filtered = downloader.load_filtered()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'parser': parser,
+        'chunksize': chunksize,
+        'seconds': elapsed,
+        'baseline_rss_mib': baseline,
+        'peak_rss_mib': peak_rss_mib(),
+        'kept': len(filtered),
+    }))
+
+def run_child(*args):
+    # Every measurement gets a fresh interpreter: on Linux the peak RSS of a
+    # forked child starts at the parent's, so the parent must stay small too
+    out = subprocess.run([sys.executable, __file__, *args], check=True, capture_output=True, text=True)
+    return out.stdout.strip().splitlines()[-1] if out.stdout.strip() else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark whole-file vs streaming CSV filtering")
+    parser.add_argument('--rows', type=int, default=3000000, help='Rows in the synthetic FIRMS file')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Chunk size for the streaming mode')
+    parser.add_argument('--csv', help='Use an existing CSV instead of generating one')
+    parser.add_argument('--child', nargs=2, metavar=('PARSER', 'CHUNKSIZE'), help=argparse.SUPPRESS)
+    parser.add_argument('--generate', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_csv(args.csv, args.rows)
+        return
+    if args.child is not None:
+        logging.disable(logging.CRITICAL)
+        run_mode(args.csv, args.child[0], int(args.child[1]))
+        return
+
+    tmpdir = None
+    path = args.csv
+    if not path:
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, 'synthetic_global_24h.csv')
+        print(f"Generating {args.rows} rows into {path} ...")
+        run_child('--generate', '--csv', path, '--rows', str(args.rows))
+    print(f"CSV size: {os.path.getsize(path) / 2**20:.1f} MiB")
+
+    results = []
+    for parser_name, chunksize in (('pandas', 0), ('pandas', args.chunksize), ('fast', 0)):
+        results.append(json.loads(run_child('--csv', path, '--child', parser_name, str(chunksize))))
+
+    print(f"{'mode':<28}{'wall (s)':>10}{'peak RSS (MiB)':>16}{'over imports':>14}{'kept':>8}")
+    for r in results:
+        if r['parser'] == 'fast':
+            mode = 'fast scanner'
+        elif not r['chunksize']:
+            mode = 'pandas, whole file'
+        else:
+            mode = f"pandas, streaming ({r['chunksize']})"
+        growth = r['peak_rss_mib'] - r['baseline_rss_mib']
+        print(f"{mode:<28}{r['seconds']:>10.2f}{r['peak_rss_mib']:>16.1f}{growth:>14.1f}{r['kept']:>8}")
+
+    if tmpdir:
+        tmpdir.cleanup()
+
+if __name__ == "__main__":
+    main()
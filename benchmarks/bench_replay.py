@@ -0,0 +1,103 @@
+# benchmarks/bench_replay.py
+#
+# A fire season in a box: generates several days of archived FIRMS files
+# (global background detections plus fires in the benchmark region, with
+# the last day several times worse than the others) and replays them with
+# `main.py --replay` against the local fake services. Prints the replay
+# report: per-run timings, packets sent and the APRS backlog, which shows
+# whether the configured packet rate keeps up with a bad day.
+#
+# The files are dated well in the past by default, as real archives are, so
+# the replay's simulated clock has to carry incident ranking, the hourly
+# budget and retention; --start-date moves them.
+#
+#   python benchmarks/bench_replay.py --days 3 --bad-day 10 --aprs-rate 12 --speed 600
+#   python benchmarks/bench_replay.py --start-date today --speed 0
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+MAIN = os.path.join(ROOT, 'main.py')
+sys.path.insert(0, BENCH_DIR)
+
+from bench_end_to_end import MAJOR_FIRE_FRP, REGION, generate_csv, write_config
+from fakes import FakeServices
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay benchmark of several archived days")
+    parser.add_argument('--days', type=int, default=3, help='Archived days, one file each')
+    parser.add_argument('--start-date', default='2025-08-01',
+                        help="Date of the first archived day (YYYY-MM-DD, or 'today' for the days up to today)")
+    parser.add_argument('--rows', type=int, default=100000, help='Global background detections per day')
+    parser.add_argument('--fires', type=int, default=30, help='Fires inside the benchmark region per ordinary day')
+    parser.add_argument('--bad-day', type=float, default=10, help='How many times more fires the last day has')
+    parser.add_argument('--pixels', type=int, default=4, help='Detections per fire')
+    parser.add_argument('--interval', type=int, default=60, help='Simulated minutes between runs')
+    parser.add_argument('--speed', type=float, default=0, help='Multiple of real time (0: runs back to back)')
+    parser.add_argument('--aprs-rate', type=float, default=12, help='APRS packets per minute of simulated time')
+    parser.add_argument('--aprs-burst', type=int, default=1, help='APRS burst size')
+    parser.add_argument('--max-per-hour', type=int, default=0,
+                        help='Hourly packet budget, in simulated hours (0: no limit)')
+    parser.add_argument('--workers', type=int, default=8, help='Enrichment pipeline workers')
+    parser.add_argument('--no-aqi', action='store_true', help='Disable AQI enrichment')
+    parser.add_argument('--no-news', action='store_true', help='Disable news enrichment')
+    parser.add_argument('--log-level', default='WARNING', help='Log level of the replay')
+    parser.add_argument('--output', help='Write the replay report as JSON to this file')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='fireaprs-replay-bench-')
+    try:
+        if args.start_date == 'today':
+            first_day = datetime.date.today() - datetime.timedelta(days=args.days)
+        else:
+            first_day = datetime.date.fromisoformat(args.start_date)
+        archives = []
+        for day in range(args.days):
+            date = (first_day + datetime.timedelta(days=day)).isoformat()
+            fires = int(args.fires * (args.bad_day if day == args.days - 1 else 1))
+            path = os.path.join(tmpdir, f"firms_{date}.csv")
+            generate_csv(path, args.rows, fires, args.pixels, seed=day, date=date)
+            archives.append(path)
+            print(f"{date}: {fires} fires in the region, {os.path.getsize(path) / 2**20:.1f} MiB")
+
+        fakes = FakeServices(archives[-1], places=[REGION['name']]).start()
+        settings = argparse.Namespace(service_limits='unlimited', workers=args.workers, aqi_mode='batch',
+                                      aprs_rate=args.aprs_rate, aprs_burst=args.aprs_burst,
+                                      max_per_hour=args.max_per_hour, log_level=args.log_level)
+        # main.py reads config.ini from its working directory
+        write_config(os.path.join(tmpdir, 'config.ini'), tmpdir, fakes, settings)
+
+        sink = os.path.join(tmpdir, 'packets.txt')
+        report = os.path.join(tmpdir, 'report.json')
+        flags = [flag for flag, on in (('--no-aqi', args.no_aqi), ('--no-news', args.no_news)) if on]
+        subprocess.run([sys.executable, MAIN, '--replay', *archives, '--interval', str(args.interval),
+                        '--speed', str(args.speed), '--sink', f"file:{sink}", '--replay-report', report, *flags],
+                       cwd=tmpdir, check=True)
+        fakes.stop()
+
+        with open(sink) as f:
+            lines = f.readlines()
+        # Every day has one major fire; under a tight hourly budget it only
+        # gets through if it is ranked above the minor ones
+        major = sum(f"FRP {MAJOR_FIRE_FRP:.0f}MW" in line for line in lines)
+        print(f"Sink received {len(lines)} packets, {major} of them for the {args.days} major fire(s).")
+        if args.output:
+            shutil.copy(report, args.output)
+            print(f"Results written to {args.output}")
+        else:
+            with open(report) as f:
+                summary = json.load(f)['summary']
+            print(json.dumps({key: value for key, value in summary.items() if key != 'stages'}, indent=2))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
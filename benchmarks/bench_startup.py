@@ -0,0 +1,139 @@
+# benchmarks/bench_startup.py
+#
+# Cold-start cost of main.py. Reports `python -X importtime` for
+# `import main` (slowest top-level imports first), then times whole
+# `python main.py` processes in typical cron situations against the local
+# fake services, listing which heavy dependencies each one loaded.
+#
+#   python benchmarks/bench_startup.py --repeat 5
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+MAIN = os.path.join(ROOT, 'main.py')
+sys.path.insert(0, BENCH_DIR)
+
+from bench_end_to_end import REGION, write_config
+from fakes import FakeServices
+
+HEAVY_MODULES = ('pandas', 'numpy', 'requests', 'geopy', 'feedparser', 'aprslib', 'apscheduler')
+
+# (name, main.py flags, whether the cached FIRMS file is removed first)
+SCENARIOS = [
+    ('help', ['--help'], False),
+    ('unchanged upstream', [], False),
+    ('new file, no fires, --no-aqi --no-news', ['--no-aqi', '--no-news'], True),
+    ('new file with fires', [], True),
+]
+
+def parse_importtime(stderr):
+    # Lines look like "import time:   self [us] | cumulative | package";
+    # nesting is shown by indentation of the package name
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append({'module': name.strip(), 'depth': depth, 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+    return imports
+
+def loaded_heavy(imports):
+    names = {entry['module'] for entry in imports}
+    return [module for module in HEAVY_MODULES if module in names]
+
+def run_python(args, cwd):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, out
+
+def import_profile(top):
+    elapsed, out = run_python(['-c', 'import main'], ROOT)
+    imports = parse_importtime(out.stderr)
+    # Direct imports of main and of the fire_aprs_cli modules it pulls in
+    first_level = [entry for entry in imports if entry['depth'] <= 1]
+    first_level.sort(key=lambda entry: entry['cumulative_us'], reverse=True)
+    main_entry = next((entry for entry in imports if entry['module'] == 'main'), None)
+    return {
+        'process_seconds': elapsed,
+        'import_main_seconds': main_entry['cumulative_us'] / 1e6 if main_entry else None,
+        'heavy_modules': loaded_heavy(imports),
+        'slowest': first_level[:top],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark of main.py")
+    parser.add_argument('--repeat', type=int, default=5, help='Processes per scenario (the median is reported)')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    parser.add_argument('--rows', type=int, default=200000, help='Global background detections in the FIRMS file')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    profile = import_profile(args.top)
+    print(f"import main: {profile['import_main_seconds']:.3f}s "
+          f"(process {profile['process_seconds']:.3f}s), heavy modules: {', '.join(profile['heavy_modules']) or 'none'}")
+    print(f"  {'module':<44}{'cumulative (ms)':>16}")
+    for entry in profile['slowest']:
+        print(f"  {entry['module']:<44}{entry['cumulative_us'] / 1000:>16.1f}")
+
+    tmpdir = tempfile.mkdtemp(prefix='fireaprs-startup-')
+    results = {'import_profile': profile, 'scenarios': []}
+    try:
+        fires_csv = os.path.join(tmpdir, 'fires.csv')
+        empty_csv = os.path.join(tmpdir, 'no_fires.csv')
+        generator = os.path.join(BENCH_DIR, 'bench_end_to_end.py')
+        for path, fires in ((fires_csv, 50), (empty_csv, 0)):
+            subprocess.run([sys.executable, generator, '--generate', '--csv', path, '--rows', str(args.rows),
+                            '--fires', str(fires)], check=True)
+
+        settings = argparse.Namespace(service_limits='unlimited', workers=8, aqi_mode='batch',
+                                      aprs_rate=60000, aprs_burst=100, log_level='WARNING')
+        print(f"\n  {'scenario':<44}{'median (s)':>11}{'min (s)':>9}  heavy modules loaded")
+        for name, flags, fresh in SCENARIOS:
+            csv_path = empty_csv if 'no fires' in name else fires_csv
+            fakes = FakeServices(csv_path, places=[REGION['name']]).start()
+            workdir = os.path.join(tmpdir, name.split()[0])
+            os.makedirs(workdir, exist_ok=True)
+            # main.py reads config.ini from its working directory
+            write_config(os.path.join(workdir, 'config.ini'), workdir, fakes, settings)
+
+            timings = []
+            heavy = []
+            for _ in range(args.repeat):
+                # Prime or reset the cached FIRMS file and the reported store
+                for stale in os.listdir(workdir):
+                    if stale.startswith('reported.sqlite') or (fresh and stale.startswith('global_24h.csv')):
+                        os.remove(os.path.join(workdir, stale))
+                if not fresh and not os.path.exists(os.path.join(workdir, 'global_24h.csv')):
+                    subprocess.run([sys.executable, MAIN], cwd=workdir, capture_output=True)
+                start = time.perf_counter()
+                out = subprocess.run([sys.executable, '-X', 'importtime', MAIN, *flags], cwd=workdir,
+                                     capture_output=True, text=True)
+                timings.append(time.perf_counter() - start)
+                heavy = loaded_heavy(parse_importtime(out.stderr))
+            fakes.stop()
+
+            scenario = {'name': name, 'flags': flags, 'seconds': timings,
+                        'median_seconds': statistics.median(timings), 'heavy_modules': heavy}
+            results['scenarios'].append(scenario)
+            print(f"  {name:<44}{scenario['median_seconds']:>11.3f}{min(timings):>9.3f}  {', '.join(heavy) or 'none'}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
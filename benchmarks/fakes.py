@@ -0,0 +1,348 @@
+# benchmarks/fakes.py
+#
+# Local stand-ins for every service FireAPRS talks to, so whole runs can be
+# measured offline: one HTTP server with FIRMS, WAQI, Nominatim and RSS
+# routes, and a TCP server that speaks just enough APRS-IS to log in and
+# record packets. Stdlib only, so the process hosting them stays small.
+
+import gzip
+import json
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+SERVICES = ('firms', 'waqi', 'nominatim', 'rss')
+
+class ServiceBehaviour:
+    # Injected latency (seconds, uniformly jittered by +-jitter) and the share
+    # of requests answered with a 500
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+class FakeHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        service = parts[0] if parts else ''
+        fakes = self.server.fakes
+        fakes.log_request(self.path, self.headers)
+        if service not in SERVICES:
+            self.reply(404, b'not found', service=None)
+            return
+
+        behaviour = fakes.behaviour[service]
+        delay = behaviour.latency + fakes.uniform(-behaviour.jitter, behaviour.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if behaviour.error_rate and fakes.uniform(0, 1) < behaviour.error_rate:
+            self.reply(500, b'injected error', service=service, error=True)
+            return
+
+        handler = getattr(self, f"serve_{service}")
+        handler(parts[1:], parse_qs(url.query))
+
+    def reply(self, status, body, content_type='text/plain', headers=None, service=None, error=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        # Counted before the body goes out: a client can read the snapshot as
+        # soon as it has the last byte
+        if service:
+            self.server.fakes.count(service, sent=len(body), error=error)
+        self.wfile.write(body)
+
+    def reply_json(self, payload, service):
+        self.reply(200, json.dumps(payload).encode(), 'application/json', service=service)
+
+    def not_modified(self, etag, service):
+        self.server.fakes.count(service, not_modified=True)
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    # FIRMS: the synthetic CSV, with an ETag so conditional requests work,
+    # gzip when the client asks for it and byte ranges (bytes=<start>-) when
+    # If-Range matches; /firms/api/area/csv/<key>/<product>/
+    # <west,south,east,north>/<days> answers the rows inside the box
+    def serve_firms(self, parts, query):
+        fakes = self.server.fakes
+        if parts[:3] == ['api', 'area', 'csv']:
+            self.serve_firms_area(parts[3:])
+            return
+        path = fakes.firms_path
+        size = os.stat(path).st_size
+        etag = fakes.firms_etag()
+        if self.headers.get('If-None-Match') == etag:
+            self.not_modified(etag, 'firms')
+            return
+
+        # A range whose If-Range no longer matches gets the whole new file
+        start = 0
+        requested = self.headers.get('Range', '')
+        if requested.startswith('bytes=') and self.headers.get('If-Range', etag) == etag:
+            start = int(requested[len('bytes='):].split('-')[0])
+            if start >= size:
+                self.reply(416, b'', headers={'Content-Range': f"bytes */{size}"}, service='firms')
+                return
+        if not start and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = fakes.gzipped_firms(etag)
+            self.reply(200, body, 'text/csv', headers={'ETag': etag, 'Content-Encoding': 'gzip'}, service='firms')
+            return
+
+        if start:
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(size - start))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.server.fakes.count('firms', sent=size - start)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while True:
+                block = f.read(1 << 20)
+                if not block:
+                    break
+                self.wfile.write(block)
+
+    def serve_firms_area(self, parts):
+        fakes = self.server.fakes
+        if len(parts) < 4 or parts[0] != fakes.map_key:
+            self.reply(400, b'Invalid MAP_KEY.', service='firms')
+            return
+        west, south, east, north = (float(v) for v in parts[2].split(','))
+        body = fakes.area_csv(west, south, east, north)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            self.reply(200, gzip.compress(body), 'text/csv', headers={'Content-Encoding': 'gzip'}, service='firms')
+        else:
+            self.reply(200, body, 'text/csv', service='firms')
+
+    # WAQI: /feed/<city or @uid>/ and /map/bounds/?latlng=lat1,lon1,lat2,lon2
+    def serve_waqi(self, parts, query):
+        if parts[:1] == ['feed'] and len(parts) > 1:
+            name = unquote(parts[1])
+            temperature = 15 + (sum(map(ord, name)) % 200) / 10
+            self.reply_json({'status': 'ok', 'data': {'aqi': 42, 'iaqi': {'t': {'v': temperature}}}}, 'waqi')
+            return
+        if parts[:2] == ['map', 'bounds']:
+            lat1, lon1, lat2, lon2 = (float(v) for v in query['latlng'][0].split(','))
+            self.reply_json({'status': 'ok', 'data': self.server.fakes.stations(lat1, lon1, lat2, lon2)}, 'waqi')
+            return
+        self.reply(404, b'not found', service='waqi')
+
+    # Nominatim: /reverse?lat=..&lon=.. answers a city per 0.1 degree cell
+    def serve_nominatim(self, parts, query):
+        lat = float(query['lat'][0])
+        lon = float(query['lon'][0])
+        city = f"City {lat:.1f} {lon:.1f}"
+        self.reply_json({
+            'lat': str(lat),
+            'lon': str(lon),
+            'display_name': city,
+            'address': {'city': city},
+        }, 'nominatim')
+
+    # RSS: a fixed feed whose headlines mention the configured places
+    def serve_rss(self, parts, query):
+        body, etag = self.server.fakes.rss_document()
+        if self.headers.get('If-None-Match') == etag:
+            self.not_modified(etag, 'rss')
+            return
+        self.reply(200, body, 'application/rss+xml', headers={'ETag': etag}, service='rss')
+
+class FakeAPRSHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        fakes = self.server.fakes
+        self.wfile.write(b"# fakeaprsis 1.0\r\n")
+        login = self.rfile.readline().decode('latin-1').split()
+        callsign = login[1] if len(login) > 1 else 'N0CALL'
+        self.wfile.write(f"# logresp {callsign} verified, server FAKE\r\n".encode())
+        fakes.aprs_event('logins')
+        for line in self.rfile:
+            line = line.decode('latin-1').rstrip('\r\n')
+            if line.startswith('#'):
+                fakes.aprs_event('keepalives')
+            else:
+                fakes.aprs_packet(line)
+
+class FakeServices:
+    def __init__(self, firms_path, places=(), keyword='fire', rss_items=50, station_spacing=0.2, seed=0,
+                 behaviour=None, map_key='bench'):
+        self.firms_path = firms_path
+        self.map_key = map_key
+        self.gzip_cache = {}
+        self.area_cache = {}
+        self.places = list(places)
+        self.keyword = keyword
+        self.rss_items = rss_items
+        self.station_spacing = station_spacing
+        self.behaviour = {name: ServiceBehaviour() for name in SERVICES}
+        self.behaviour.update(behaviour or {})
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.rss_cache = None
+        self.reset()
+
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), FakeHTTPHandler)
+        self.http.daemon_threads = True
+        self.http.fakes = self
+        self.aprs = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeAPRSHandler)
+        self.aprs.daemon_threads = True
+        self.aprs.fakes = self
+
+    @property
+    def http_url(self):
+        return f"http://127.0.0.1:{self.http.server_address[1]}"
+
+    @property
+    def aprs_port(self):
+        return self.aprs.server_address[1]
+
+    def start(self):
+        for server in (self.http, self.aprs):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in (self.http, self.aprs):
+            server.shutdown()
+            server.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {
+                name: {'requests': 0, 'errors': 0, 'not_modified': 0, 'bytes': 0} for name in SERVICES
+            }
+            self.aprs_counters = {'logins': 0, 'keepalives': 0}
+            self.packets = []
+            # (path, headers) of every HTTP request, oldest first
+            self.requests = []
+
+    def uniform(self, low, high):
+        with self.lock:
+            return self.random.uniform(low, high)
+
+    def count(self, service, sent=0, error=False, not_modified=False):
+        with self.lock:
+            counter = self.counters[service]
+            counter['requests'] += 1
+            counter['bytes'] += sent
+            counter['errors'] += int(error)
+            counter['not_modified'] += int(not_modified)
+
+    def log_request(self, path, headers):
+        with self.lock:
+            self.requests.append((path, dict(headers)))
+
+    def aprs_event(self, name):
+        with self.lock:
+            self.aprs_counters[name] += 1
+
+    def aprs_packet(self, line):
+        with self.lock:
+            self.packets.append((time.monotonic(), line))
+
+    def firms_etag(self):
+        stat = os.stat(self.firms_path)
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def gzipped_firms(self, etag):
+        with self.lock:
+            if self.gzip_cache.get('etag') != etag:
+                with open(self.firms_path, 'rb') as f:
+                    self.gzip_cache = {'etag': etag, 'body': gzip.compress(f.read(), compresslevel=6)}
+            return self.gzip_cache['body']
+
+    def area_csv(self, west, south, east, north):
+        # The CSV lines are parsed once and kept as (lat, lon, line)
+        with self.lock:
+            if not self.area_cache:
+                with open(self.firms_path, 'rb') as f:
+                    header = f.readline()
+                    rows = []
+                    for line in f:
+                        lat, lon, _ = line.split(b',', 2)
+                        rows.append((float(lat), float(lon), line))
+                self.area_cache = {'header': header, 'rows': rows}
+            header, rows = self.area_cache['header'], self.area_cache['rows']
+        return header + b''.join(
+            line for lat, lon, line in rows if south <= lat <= north and west <= lon <= east
+        )
+
+    def stations(self, lat1, lon1, lat2, lon2):
+        # A regular grid of stations over the requested bounds
+        lat_min, lat_max = sorted((lat1, lat2))
+        lon_min, lon_max = sorted((lon1, lon2))
+        step = self.station_spacing
+        stations = []
+        lat = lat_min
+        while lat <= lat_max:
+            lon = lon_min
+            while lon <= lon_max:
+                uid = len(stations) + 1
+                stations.append({'uid': uid, 'lat': round(lat, 4), 'lon': round(lon, 4), 'aqi': '42',
+                                 'station': {'name': f"Station {uid}"}})
+                lon += step
+            lat += step
+        return stations
+
+    def rss_document(self):
+        if self.rss_cache is None:
+            places = self.places or ['somewhere']
+            items = []
+            for i in range(self.rss_items):
+                place = places[i % len(places)]
+                items.append(
+                    f"<item><title>{self.keyword.title()} near {place}, report {i}</title>"
+                    f"<link>http://news.invalid/{i}</link>"
+                    f"<description>Crews responding to a {self.keyword} near {place}.</description></item>"
+                )
+            body = (
+                '<?xml version="1.0"?><rss version="2.0"><channel><title>Fake news</title>'
+                + ''.join(items) + '</channel></rss>'
+            ).encode()
+            self.rss_cache = (body, f'"rss-{len(body):x}"')
+        return self.rss_cache
+
+    def snapshot(self):
+        with self.lock:
+            packets = list(self.packets)
+            snapshot = {
+                'requests': {name: dict(counter) for name, counter in self.counters.items()},
+                'aprs': dict(self.aprs_counters, packets=len(packets),
+                             bytes=sum(len(line.encode('latin-1')) for _, line in packets)),
+            }
+        if len(packets) > 1:
+            span = packets[-1][0] - packets[0][0]
+            snapshot['aprs']['packets_per_second'] = (len(packets) - 1) / span if span > 0 else None
+        else:
+            snapshot['aprs']['packets_per_second'] = None
+        return snapshot
+
+def wait_for_port(port, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
@@ -0,0 +1,146 @@
+# fire_aprs_cli/aprs_packets.py
+
+import re
+import time
+
+import numpy as np
+
+from fire_aprs_cli.metrics import metrics
+
+# Destination and path every FireAPRS packet is sent with
+PATH = 'APDR15,TCPIP*,qAC,T2STRAS'
+
+POSITION_FORMATS = ('uncompressed', 'compressed')
+REPORTS = ('position', 'object', 'item')
+
+# Longest information field APRS allows (APRS101, chapter 3)
+MAX_INFO_LENGTH = 256
+
+# Primary table, ':' is the fire symbol
+SYMBOL_TABLE = '/'
+FIRE_SYMBOL = ':'
+
+# Incident objects are named FIRE plus five base-36 characters from the
+# 0.01 degree cell of the incident, so the same fire keeps its name (and
+# aprs.fi updates it in place) across runs. Cells only share a code when
+# they are more than ~16 degrees of latitude apart.
+OBJECT_PREFIX = 'FIRE'
+BASE36 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+LINK_PATTERN = re.compile(r'https?://\S+')
+
+def coordinate_arrays(latitudes, longitudes):
+    lat = np.clip(np.asarray(latitudes, dtype=float), -90.0, 90.0)
+    lon = np.clip(np.asarray(longitudes, dtype=float), -180.0, 180.0)
+    return lat, lon
+
+def degrees_minutes(values):
+    # Whole degrees and hundredths of minutes of |value|, rounded once so that
+    # 59.999' carries into the next degree instead of printing as 60.00'. The
+    # hemisphere comes from the sign, so -0.5 is 00 30.00 S, not N.
+    hundredths = np.rint(np.abs(values) * 6000).astype(np.int64)
+    return hundredths // 6000, hundredths % 6000
+
+# DDMM.mmN / DDDMM.mmE strings for arrays of coordinates
+def uncompressed_coordinates(latitudes, longitudes):
+    lat, lon = coordinate_arrays(latitudes, longitudes)
+    lat_deg, lat_min = degrees_minutes(lat)
+    lon_deg, lon_min = degrees_minutes(lon)
+    lat_hemi = np.where(lat < 0, 'S', 'N')
+    lon_hemi = np.where(lon < 0, 'W', 'E')
+    return (
+        [f"{d:02d}{m // 100:02d}.{m % 100:02d}{h}" for d, m, h in zip(lat_deg.tolist(), lat_min.tolist(), lat_hemi)],
+        [f"{d:03d}{m // 100:02d}.{m % 100:02d}{h}" for d, m, h in zip(lon_deg.tolist(), lon_min.tolist(), lon_hemi)],
+    )
+
+def base91(values):
+    # Four base-91 digits per value, as printable ASCII (APRS101, chapter 9)
+    values = np.clip(values, 0, 91 ** 4 - 1).astype(np.int64)
+    digits = np.stack([(values // 91 ** power) % 91 for power in (3, 2, 1, 0)], axis=1) + 33
+    return digits.astype(np.uint8).view('S4').ravel()
+
+def compressed_positions(latitudes, longitudes, symbol_table=SYMBOL_TABLE, symbol=FIRE_SYMBOL):
+    # /YYYYXXXX:  sT -- 13 bytes instead of 19, with ~0.3 m resolution. The
+    # trailing " sT" says "no course, speed or altitude".
+    lat, lon = coordinate_arrays(latitudes, longitudes)
+    y = base91(np.floor(380926 * (90 - lat)))
+    x = base91(np.floor(190463 * (180 + lon)))
+    return [f"{symbol_table}{yy.decode()}{xx.decode()}{symbol} sT" for yy, xx in zip(y, x)]
+
+def uncompressed_positions(latitudes, longitudes, symbol_table=SYMBOL_TABLE, symbol=FIRE_SYMBOL):
+    lats, lons = uncompressed_coordinates(latitudes, longitudes)
+    return [f"{a}{symbol_table}{o}{symbol}" for a, o in zip(lats, lons)]
+
+def object_names(latitudes, longitudes):
+    lat, lon = coordinate_arrays(latitudes, longitudes)
+    cells = (np.rint(lat * 100).astype(np.int64) + 9000) * 36001 + np.rint(lon * 100).astype(np.int64) + 18000
+    cells %= 36 ** 5
+    chars = np.stack([(cells // 36 ** power) % 36 for power in (4, 3, 2, 1, 0)], axis=1)
+    alphabet = np.frombuffer(BASE36.encode(), dtype=np.uint8)
+    codes = alphabet[chars].view('S5').ravel()
+    return [OBJECT_PREFIX + code.decode() for code in codes]
+
+def shorten_link(link):
+    # Query strings, fragments, the scheme and "www." rarely matter to a
+    # reader, and news links often spend half their length on tracking
+    link = link.split('#', 1)[0].split('?', 1)[0]
+    link = re.sub(r'^https?://', '', link)
+    return re.sub(r'^www\.', '', link)
+
+def truncate_bytes(text, limit):
+    encoded = text.encode('utf-8')
+    if len(encoded) <= limit:
+        return text
+    return encoded[:limit].decode('utf-8', errors='ignore').rstrip(' ,')
+
+# Fits a comment into budget bytes, in steps that lose the least: shorten
+# links, then drop them, then cut the text. Returns (comment, step taken).
+def fit_comment(comment, budget):
+    if len(comment.encode('utf-8')) <= budget:
+        return comment, None
+    shortened = LINK_PATTERN.sub(lambda match: shorten_link(match.group(0)), comment)
+    if len(shortened.encode('utf-8')) <= budget:
+        return shortened, 'links_shortened'
+    without_links = re.sub(r'\s*,?\s*News:\s*$', '', LINK_PATTERN.sub('', comment).rstrip())
+    if len(without_links.encode('utf-8')) <= budget:
+        return without_links, 'links_dropped'
+    return truncate_bytes(without_links, budget), 'truncated'
+
+# Builds APRS information fields. Positions (and object names) for a whole
+# batch of incidents are computed in one numpy pass by prefixes(); finish()
+# then only appends each incident's comment within the length budget.
+class PacketEncoder:
+    def __init__(self, position_format='uncompressed', report='position', max_info_length=MAX_INFO_LENGTH,
+                 symbol_table=SYMBOL_TABLE, symbol=FIRE_SYMBOL):
+        if position_format not in POSITION_FORMATS:
+            raise ValueError(f"Unknown position format '{position_format}'; expected one of {', '.join(POSITION_FORMATS)}.")
+        if report not in REPORTS:
+            raise ValueError(f"Unknown report type '{report}'; expected one of {', '.join(REPORTS)}.")
+        self.position_format = position_format
+        self.report = report
+        self.max_info_length = min(max_info_length, MAX_INFO_LENGTH)
+        self.symbol_table = symbol_table
+        self.symbol = symbol
+
+    def positions(self, latitudes, longitudes):
+        if self.position_format == 'compressed':
+            return compressed_positions(latitudes, longitudes, self.symbol_table, self.symbol)
+        return uncompressed_positions(latitudes, longitudes, self.symbol_table, self.symbol)
+
+    # Information field up to the comment, one per incident
+    def prefixes(self, latitudes, longitudes):
+        positions = self.positions(latitudes, longitudes)
+        if self.report == 'position':
+            return [f"={position}" for position in positions]
+        names = object_names(latitudes, longitudes)
+        if self.report == 'item':
+            return [f"){name}!{position}" for name, position in zip(names, positions)]
+        # Objects carry the time of the report; names are padded to 9 characters
+        timestamp = time.strftime('%d%H%Mz', time.gmtime())
+        return [f";{name:<9}*{timestamp}{position}" for name, position in zip(names, positions)]
+
+    def finish(self, prefix, comment):
+        comment, step = fit_comment(comment, self.max_info_length - len(prefix.encode('utf-8')))
+        if step:
+            metrics.inc('fireaprs_aprs_comments_shortened_total', step=step)
+        return prefix + comment
@@ -1,72 +1,346 @@
 # fire_aprs_cli/aprs_sender.py
 
+import heapq
+import itertools
 import logging
+import os
+import socket
+import threading
 import time
 
 import aprslib
 
+from fire_aprs_cli.aprs_packets import PATH, PacketEncoder, uncompressed_coordinates
+from fire_aprs_cli.metrics import external_call, metrics
+from fire_aprs_cli.ratelimit import TokenBucket
+
+# SSIDs of position reports: each run starts at FIRST_SSID and counts up,
+# wrapping after MAX_SSID, the largest two-character SSID APRS-IS accepts
+FIRST_SSID = 11
+MAX_SSID = 99
+
+# Stand-ins for the APRS-IS connection with the calls APRSSender makes of
+# aprslib.IS, for replays and dry runs: packets are appended to a file, or
+# written to a plain TCP listener, one line each, without logging in.
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def sendall(self, line):
+        with self.lock:
+            self.file.write(line.rstrip('\r\n') + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class TCPSink:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.sock = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=10)
+
+    def sendall(self, line):
+        self.sock.sendall((line.rstrip('\r\n') + '\r\n').encode('utf-8'))
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+# APRS-IS, or the sink named by 'sink': file:<path> or tcp:<host>:<port>
+def open_connection(config):
+    sink = config.get('sink') or ''
+    if sink.startswith('file:'):
+        return FileSink(sink[len('file:'):])
+    if sink.startswith('tcp:'):
+        host, _, port = sink[len('tcp:'):].rpartition(':')
+        if host and port.isdigit():
+            return TCPSink(host, int(port))
+    if sink:
+        raise ValueError(f"Unknown APRS sink '{sink}'; expected file:<path> or tcp:<host>:<port>.")
+    return aprslib.IS(config['callsign'], passwd=config['password'], host=config.get('host', 'rotate.aprs.net'),
+                      port=config['port'])
+
 class APRSSender:
     def __init__(self, config):
         self.callsign = config['callsign']
         self.password = config['password']
         self.comment = config['comment']
         self.symbol = config['symbol']
+        self.host = config.get('host', 'rotate.aprs.net')
         self.port = config['port']
-        self.suffix = 11  # Starting suffix
+        self.suffix = FIRST_SSID
+        self.encoder = PacketEncoder(
+            position_format=config.get('position_format', 'uncompressed'),
+            report=config.get('report', 'position'),
+            max_info_length=config.get('max_info_length', 256),
+        )
+
+        # Transmit pacing: one packet every 5 seconds unless configured otherwise
+        self.packets_per_minute = config.get('packets_per_minute', 12)
+        self.bucket = TokenBucket(self.packets_per_minute / 60.0, config.get('burst', 1))
+        self.keepalive = config.get('keepalive_seconds', 120)
+        self.max_retries = config.get('max_retries', 5)
+        self.max_backoff = config.get('max_backoff_seconds', 300)
+        self.flush_timeout = config.get('flush_timeout_seconds', 600)
+
+        # Packets waiting to go out, as a heap of [-priority, sequence,
+        # packet, enqueued_at, attempts, on_done]: highest priority first,
+        # then first in, first out
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.connected = False
+        self.last_sent = time.monotonic()
 
+        self.sent = 0
+        self.dropped = 0
+        self.retries = 0
+        self.reconnects = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+        self.ais = open_connection(config)
         try:
-            self.ais = aprslib.IS(self.callsign, passwd=self.password, port=self.port)
             self.ais.connect()
-            logging.info("Connected to APRS.")
+            self.connected = True
+            logging.info(f"Connected to APRS sink {config['sink']}." if config.get('sink') else "Connected to APRS.")
         except Exception as e:
             logging.error(f"Failed to connect to APRS: {e}")
             raise
 
+        self.worker = threading.Thread(target=self.transmit_loop, name="aprs-transmit", daemon=True)
+        self.worker.start()
+
     def format_coordinates(self, latitude, longitude):
-        # Convert decimal degrees to degrees and minutes
-        lat_deg = int(latitude)
-        lat_min = (latitude - lat_deg) * 60
-        lon_deg = int(longitude)
-        lon_min = (longitude - lon_deg) * 60
+        # Degrees and minutes, e.g. ("3430.00N", "03315.00E")
+        lats, lons = uncompressed_coordinates([latitude], [longitude])
+        return lats[0], lons[0]
 
-        # Format with leading zeros and two decimal places
-        formatted_lat = f"{lat_deg:02d}{lat_min:05.2f}N" if lat_deg >= 0 else f"{abs(lat_deg):02d}{lat_min:05.2f}S"
-        formatted_lon = f"{lon_deg:03d}{lon_min:05.2f}E" if lon_deg >= 0 else f"{abs(lon_deg):03d}{lon_min:05.2f}W"
+    def source(self):
+        # Position reports use a new SSID per fire so each shows up as its own
+        # station; objects and items are named per incident and sent from the
+        # configured callsign
+        if self.encoder.report == 'position':
+            return self.position_source()
+        return self.callsign
 
-        return formatted_lat, formatted_lon
+    def position_source(self):
+        # The per-fire SSID replaces one the callsign already has (N0CALL-1
+        # sends from N0CALL-11, ...)
+        return f"{self.callsign.split('-')[0]}-{self.suffix}"
 
+    # A long-lived sender starts every run at the first SSID again
+    def start_run(self):
+        self.suffix = FIRST_SSID
 
-    def send_message(self, latitude, longitude, message):
+    # Information-field prefixes for a batch of incidents, computed in one
+    # pass; pass them back to send_message() one by one
+    def prepare(self, latitudes, longitudes):
+        return self.encoder.prefixes(latitudes, longitudes)
+
+    # on_done, if given, is called on the transmit thread with True once the
+    # packet is sent, or with False if it is dropped or still queued at
+    # disconnect
+    def enqueue(self, packet, priority=0.0, on_done=None):
+        # Never blocks the producer; pacing happens on the transmit thread
+        with self.condition:
+            heapq.heappush(self.queue, [-priority, next(self.sequence), packet, time.monotonic(), 0, on_done])
+            metrics.set('fireaprs_aprs_queue_depth', len(self.queue))
+            self.condition.notify()
+        self.suffix = self.suffix % MAX_SSID + 1
+
+    def send_message(self, latitude, longitude, message, prefix=None, priority=0.0, on_done=None):
         try:
-            formatted_lat, formatted_lon = self.format_coordinates(latitude, longitude)
-            full_message = f"{self.callsign}-{self.suffix}>APDR15,TCPIP*,qAC,T2STRAS:={formatted_lat}/{formatted_lon}:{message}"
-            self.ais.sendall(full_message)
-            logging.info(f"Sent APRS message: {full_message}")
-            self.suffix += 1
-            time.sleep(5)  # Respecting APRS rate limits
+            if prefix is None:
+                prefix = self.prepare([latitude], [longitude])[0]
+            full_message = f"{self.source()}>{PATH}:{self.encoder.finish(prefix, message)}"
+            self.enqueue(full_message, priority, on_done)
+            logging.info(f"Queued APRS message: {full_message}")
         except Exception as e:
-            logging.error(f"Failed to send APRS message: {e}")
+            logging.error(f"Failed to queue APRS message: {e}")
+            self.done(on_done, False)
 
     def send_no_fire_message(self):
         try:
-            # Coordinates for a specific location or central point
-            default_lat = "34.0000N"  # Replace with desired latitude
-            default_lon = "31.0000E"  # Replace with desired longitude
+            # Always a plain position report at a fixed central point
+            default_lat = 34.0  # Replace with desired latitude
+            default_lon = 31.0  # Replace with desired longitude
+            position = self.encoder.positions([default_lat], [default_lon])[0]
             # Use APRS symbol 'T' for tree
             message = f"T No fires today"
-            full_message = f"{self.callsign}-{self.suffix}>APDR15,TCPIP*,qAC,T2STRAS:={default_lat}/{default_lon}:{message}"
-            self.ais.sendall(full_message)
-            logging.info(f"Sent APRS no-fire message: {full_message}")
-            self.suffix += 1
-            time.sleep(5)  # Respecting APRS rate limits
+            full_message = f"{self.position_source()}>{PATH}:={position}{message}"
+            self.enqueue(full_message)
+            logging.info(f"Queued APRS no-fire message: {full_message}")
         except Exception as e:
-            logging.error(f"Failed to send no-fire APRS message: {e}")
+            logging.error(f"Failed to queue no-fire APRS message: {e}")
+
+    def reconnect(self):
+        # Exponential backoff between attempts, until connected or stopping
+        delay = 1
+        while not self.stopping:
+            try:
+                self.ais.close()
+                self.ais.connect()
+                self.connected = True
+                self.reconnects += 1
+                metrics.inc('fireaprs_aprs_reconnects_total')
+                logging.info("Reconnected to APRS.")
+                return True
+            except Exception as e:
+                logging.warning(f"APRS reconnect failed: {e}. Retrying in {delay}s.")
+                with self.condition:
+                    self.condition.wait(timeout=delay)
+                delay = min(delay * 2, self.max_backoff)
+        return False
+
+    @staticmethod
+    def done(on_done, sent):
+        if on_done is None:
+            return
+        try:
+            on_done(sent)
+        except Exception as e:
+            logging.error(f"APRS message callback failed: {e}")
+
+    def transmit(self, line):
+        try:
+            with external_call('aprs'):
+                self.ais.sendall(line)
+            self.last_sent = time.monotonic()
+            return True
+        except Exception as e:
+            # aprslib closes the socket itself on send errors
+            self.connected = False
+            logging.error(f"Failed to send APRS message: {e}")
+            return False
+
+    def remove(self, item):
+        # The item may no longer be at the head if something more urgent
+        # was queued while it was being sent
+        with self.condition:
+            if self.queue and self.queue[0] is item:
+                heapq.heappop(self.queue)
+            else:
+                self.queue.remove(item)
+                heapq.heapify(self.queue)
+            metrics.set('fireaprs_aprs_queue_depth', len(self.queue))
+            self.condition.notify_all()
+
+    def transmit_loop(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopping:
+                    idle = time.monotonic() - self.last_sent
+                    if idle >= self.keepalive:
+                        break
+                    self.condition.wait(timeout=self.keepalive - idle)
+                if self.stopping and not self.queue:
+                    return
+                pending = bool(self.queue)
+
+            if not self.connected and not self.reconnect():
+                return
+
+            # Idle: a server-ignored comment line keeps the session alive
+            if not pending:
+                if self.transmit("# keepalive"):
+                    logging.debug("Sent APRS keepalive.")
+                continue
+
+            # Wait for the pacing token first and only then pick the packet,
+            # so one queued meanwhile with a higher priority goes out next
+            self.bucket.acquire()
+            with self.condition:
+                item = self.queue[0]
+            _, _, packet, enqueued_at, attempts, on_done = item
+            if self.transmit(packet):
+                latency = time.monotonic() - enqueued_at
+                self.sent += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                metrics.inc('fireaprs_aprs_packets_total', result='sent')
+                metrics.observe('fireaprs_aprs_queue_seconds', latency)
+                logging.info(f"Sent APRS message: {packet} (queued {latency:.1f}s)")
+                self.remove(item)
+                self.done(on_done, True)
+                continue
+
+            # Leave the packet in the queue for the retry, unless it has used
+            # up its attempts
+            item[4] = attempts + 1
+            self.retries += 1
+            metrics.inc('fireaprs_aprs_packets_total', result='retried')
+            if item[4] > self.max_retries:
+                logging.error(f"Dropping APRS message after {self.max_retries} retries: {packet}")
+                self.dropped += 1
+                metrics.inc('fireaprs_aprs_packets_total', result='dropped')
+                self.remove(item)
+                self.done(on_done, False)
+
+    def queue_depth(self):
+        with self.condition:
+            return len(self.queue)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth(),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'retries': self.retries,
+            'reconnects': self.reconnects,
+            'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+            'latency_max': self.latency_max,
+        }
+
+    # Blocks until everything queued so far has been sent or dropped
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.queue and self.worker.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(timeout=remaining)
+        return not self.queue
+
+    def disconnect(self, timeout=None):
+        with metrics.stage('aprs_flush'):
+            self.flush(self.flush_timeout if timeout is None else timeout)
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.worker.join(timeout=5)
+
+        if self.queue:
+            logging.warning(f"Disconnecting with {len(self.queue)} unsent APRS message(s).")
+            if not self.worker.is_alive():
+                for item in self.queue:
+                    self.done(item[5], False)
+        stats = self.stats()
+        logging.info(
+            f"APRS transmit stats: {stats['sent']} sent, {stats['dropped']} dropped, "
+            f"{stats['retries']} retries, {stats['reconnects']} reconnects, "
+            f"latency avg {stats['latency_avg']:.1f}s / max {stats['latency_max']:.1f}s."
+        )
 
-    def disconnect(self):
         try:
-            self.ais.disconnect()
+            self.ais.close()
+            self.connected = False
             logging.info("Disconnected from APRS.")
-        except AttributeError:
-            logging.error("The 'IS' object does not have a 'disconnect' method.")
         except Exception as e:
             logging.error(f"Error disconnecting from APRS: {e}")
@@ -1,20 +1,137 @@
 # fire_aprs_cli/aqi_fetcher.py
 
 import logging
+import math
+import threading
+from urllib.parse import urlsplit
 
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderServiceError, GeocoderUnavailable
+import numpy as np
 import requests
 
+from fire_aprs_cli.breaker import ServiceUnavailable, available, guarded, timeout
+from fire_aprs_cli.metrics import external_call, metrics
+from fire_aprs_cli.ratelimit import limit
+
+EARTH_RADIUS_KM = 6371.0
+
+# Grid-bucketed nearest-neighbour index over WAQI stations
+class StationIndex:
+    def __init__(self, stations, cell_size=0.5):
+        self.stations = stations
+        self.cell_size = cell_size
+        self.lat = np.array([s['lat'] for s in stations], dtype=float)
+        self.lon = np.array([s['lon'] for s in stations], dtype=float)
+        self.cells = {}
+        for idx, station in enumerate(stations):
+            self.cells.setdefault(self.cell(station['lat'], station['lon']), []).append(idx)
+
+    def cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_size)), int(math.floor(longitude / self.cell_size))
+
+    def distances_km(self, latitude, longitude, idx):
+        lat1, lon1 = math.radians(latitude), math.radians(longitude)
+        lat2, lon2 = np.radians(self.lat[idx]), np.radians(self.lon[idx])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    # Returns (station, distance_km) for the closest station within max_km,
+    # or (None, None)
+    def nearest(self, latitude, longitude, max_km):
+        if not self.stations:
+            return None, None
+        row, col = self.cell(latitude, longitude)
+
+        # Narrowest side of a cell in km; anything in ring r+1 is at least
+        # r * cell_km away, which tells us when the search can stop
+        cell_km = self.cell_size * 111.0 * max(math.cos(math.radians(latitude)), 0.01)
+        max_rings = int(math.ceil(max_km / cell_km)) + 1
+
+        best, best_distance = None, None
+        for ring in range(max_rings + 1):
+            ring_idx = [
+                idx
+                for r in range(row - ring, row + ring + 1)
+                for c in range(col - ring, col + ring + 1)
+                if max(abs(r - row), abs(c - col)) == ring
+                for idx in self.cells.get((r, c), ())
+            ]
+            if ring_idx:
+                distances = self.distances_km(latitude, longitude, np.array(ring_idx))
+                closest = int(np.argmin(distances))
+                if best_distance is None or distances[closest] < best_distance:
+                    best, best_distance = ring_idx[closest], float(distances[closest])
+            if best_distance is not None and ring * cell_km >= best_distance:
+                break
+
+        if best is None or best_distance > max_km:
+            return None, None
+        return self.stations[best], best_distance
+
 class AQIFetcher:
-    def __init__(self, authtoken, user_agent="fire_aprs_cli"):
+    def __init__(self, authtoken, user_agent="fire_aprs_cli", geocode_cache=None, max_station_km=50,
+                 limiters=None, guards=None, pool_size=10, session=None, api_url="https://api.waqi.info",
+                 nominatim_url="https://nominatim.openstreetmap.org"):
         self.authtoken = authtoken
-        self.geolocator = Nominatim(user_agent=user_agent)
-        self.session = requests.Session()
+        self.api_url = api_url.rstrip('/')
+        # A path prefix is kept, so a Nominatim behind a reverse proxy works too
+        nominatim = urlsplit(nominatim_url)
+        self.geolocator = Nominatim(
+            user_agent=user_agent,
+            domain=nominatim.netloc + nominatim.path.rstrip('/'),
+            scheme=nominatim.scheme or 'https',
+        )
+        # Fetchers for several WAQI tokens can share one session
+        self.session = session
+        if session is None:
+            self.session = requests.Session()
+            # Enough pooled connections for every pipeline worker
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        self.geocode_cache = geocode_cache
+        # Optional per-service ServiceLimiters and ServiceGuards ('nominatim', 'waqi')
+        self.limiters = limiters
+        self.guards = guards
+
+        # Batch mode state, filled in by load_stations()
+        self.max_station_km = max_station_km
+        self.station_index = None
+        self.station_feeds = {}
+        self.station_locks = {}
+        self.station_lock = threading.Lock()
+
+    # False while the WAQI circuit is open: every AQI lookup would fail fast,
+    # so records are better sent without one
+    def available(self):
+        return available(self.guards, 'waqi')
 
     def get_location_name(self, latitude, longitude):
+        if self.geocode_cache:
+            found, city = self.geocode_cache.get(latitude, longitude)
+            metrics.inc('fireaprs_cache_requests_total', cache='geocode', result='hit' if found else 'miss')
+            if found:
+                logging.debug(f"Geocode cache hit for coordinates: {latitude}, {longitude} -> {city}")
+                return city
+
+        city = self.reverse_geocode(latitude, longitude)
+        # Service errors are not cached, only real answers (including "no city")
+        if self.geocode_cache and city is not False:
+            self.geocode_cache.set(latitude, longitude, city)
+        return city or None
+
+    # Returns the city name, None when Nominatim has no city for the location,
+    # or False when the lookup itself failed.
+    def reverse_geocode(self, latitude, longitude):
+        def lookup():
+            with limit(self.limiters, 'nominatim'), external_call('nominatim'):
+                return self.geolocator.reverse(
+                    f"{latitude}, {longitude}", exactly_one=True, timeout=timeout(self.guards, 'nominatim'),
+                )
+
         try:
-            location = self.geolocator.reverse(f"{latitude}, {longitude}", exactly_one=True, timeout=10)
+            location = guarded(self.guards, 'nominatim', lookup, (GeocoderServiceError,))
             if not location:
                 logging.warning(f"No location found for coordinates: {latitude}, {longitude}")
                 return None
@@ -27,14 +144,29 @@ class AQIFetcher:
             return city
         except (GeocoderServiceError, GeocoderUnavailable) as e:
             logging.error(f"Geocoding error for coordinates {latitude}, {longitude}: {e}")
-            return None
+            return False
+        except ServiceUnavailable:
+            logging.debug(f"Nominatim unavailable; no city for coordinates {latitude}, {longitude}")
+            return False
+
+    # GET url on the WAQI API, retried and failed fast by the 'waqi' guard;
+    # the JSON answer is returned whatever its status
+    def waqi_request(self, url):
+        def request():
+            with limit(self.limiters, 'waqi'), external_call('waqi') as call:
+                response = self.session.get(url, timeout=timeout(self.guards, 'waqi'))
+                response.raise_for_status()
+                data = response.json()
+                if data.get('status') != 'ok':
+                    call.fail()
+            return data
+
+        return guarded(self.guards, 'waqi', request, (requests.RequestException,))
 
     def fetch_aqi(self, city):
-        url = f"http://api.waqi.info/feed/{city}/?token={self.authtoken}"
+        url = f"{self.api_url}/feed/{city}/?token={self.authtoken}"
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self.waqi_request(url)
             if data.get('status') != 'ok':
                 logging.error(f"API response error for city '{city}': {data.get('data')}")
                 return None
@@ -46,11 +178,72 @@ class AQIFetcher:
         except requests.RequestException as e:
             logging.error(f"HTTP request failed for city '{city}': {e}")
             return None
+        except ServiceUnavailable:
+            logging.debug(f"WAQI unavailable; no AQI for city '{city}'")
+            return None
         except (KeyError, TypeError, ValueError) as e:
             logging.error(f"Error parsing API response for city '{city}': {e}")
             return None
 
+    def load_stations(self, bounds):
+        # One map/bounds query for every station around this run's regions,
+        # padded so fires near the edge still see stations just outside it.
+        # The previous run's stations and feeds are dropped first, so if the
+        # query fails this run really falls back to per-record lookups.
+        self.station_index = None
+        self.station_feeds = {}
+        lat_min, lat_max, lon_min, lon_max = bounds
+        pad = self.max_station_km / 111.0
+        latlng = f"{lat_min - pad},{lon_min - pad},{lat_max + pad},{lon_max + pad}"
+        url = f"{self.api_url}/map/bounds/?latlng={latlng}&token={self.authtoken}"
+        try:
+            data = self.waqi_request(url)
+            if data.get('status') != 'ok':
+                logging.error(f"API response error for station bounds {latlng}: {data.get('data')}")
+                return False
+            stations = [
+                {
+                    'uid': entry['uid'],
+                    'lat': float(entry['lat']),
+                    'lon': float(entry['lon']),
+                    'aqi': entry.get('aqi'),
+                    'name': (entry.get('station') or {}).get('name'),
+                }
+                for entry in data.get('data', [])
+            ]
+        except (requests.RequestException, ServiceUnavailable) as e:
+            logging.error(f"HTTP request failed for station bounds {latlng}: {e}")
+            return False
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error(f"Error parsing station bounds response: {e}")
+            return False
+
+        self.station_index = StationIndex(stations)
+        logging.info(f"Loaded {len(stations)} AQI stations within {latlng}.")
+        return True
+
+    def fetch_station_temperature(self, station):
+        # Each station's feed is requested at most once per run, even when
+        # several workers ask for the same station at the same time
+        uid = station['uid']
+        with self.station_lock:
+            uid_lock = self.station_locks.setdefault(uid, threading.Lock())
+        with uid_lock:
+            cached = uid in self.station_feeds
+            metrics.inc('fireaprs_cache_requests_total', cache='station_feed', result='hit' if cached else 'miss')
+            if not cached:
+                self.station_feeds[uid] = self.fetch_aqi(f"@{uid}")
+            return self.station_feeds[uid]
+
     def get_aqi_temperature(self, latitude, longitude):
+        if self.station_index is not None:
+            station, distance = self.station_index.nearest(latitude, longitude, self.max_station_km)
+            if station is None:
+                logging.error(f"No AQI station within {self.max_station_km} km of coordinates: {latitude}, {longitude}")
+                return None
+            logging.debug(f"Nearest AQI station to {latitude}, {longitude}: {station['name']} ({distance:.1f} km)")
+            return self.fetch_station_temperature(station)
+
         city = self.get_location_name(latitude, longitude)
         if not city:
             logging.error(f"Could not determine city for coordinates: {latitude}, {longitude}")
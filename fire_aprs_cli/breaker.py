@@ -0,0 +1,192 @@
+# fire_aprs_cli/breaker.py
+
+import logging
+import random
+import threading
+import time
+
+from fire_aprs_cli.metrics import metrics
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+# Gauge values of fireaprs_circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class ServiceUnavailable(Exception):
+    pass
+
+# Opens after failure_threshold consecutive failures; calls then fail fast
+# without touching the network. After reset_seconds a single probe call is
+# let through (half-open): success closes the circuit, failure opens it for
+# another reset_seconds.
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, reset_seconds=60):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+        metrics.set('fireaprs_circuit_state', STATE_VALUES[CLOSED], service=name)
+
+    def transition(self, state):
+        # Called with the lock held
+        self.state = state
+        metrics.set('fireaprs_circuit_state', STATE_VALUES[state], service=self.name)
+        metrics.inc('fireaprs_circuit_transitions_total', service=self.name, state=state)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            logging.warning(
+                f"Circuit for {self.name} opened after {self.failures} consecutive failure(s); "
+                f"calls fail fast for {self.reset_seconds:g}s."
+            )
+        elif state == HALF_OPEN:
+            logging.info(f"Circuit for {self.name} half-open; probing with one call.")
+        else:
+            logging.info(f"Circuit for {self.name} closed; {self.name} is answering again.")
+
+    # Whether a call may go out now
+    def allow(self):
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def is_open(self):
+        with self.lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def success(self):
+        # Calls that went out before the circuit opened don't close it
+        with self.lock:
+            if self.state == OPEN:
+                return
+            self.failures = 0
+            self.probing = False
+            if self.state == HALF_OPEN:
+                self.transition(CLOSED)
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.transition(OPEN)
+
+# Seconds of retrying every service together may spend in one run. A retry
+# is only made while its wait fits in what is left; the wait and the
+# retried attempt itself are then charged against the budget.
+class RetryBudget:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.remaining = self.seconds
+
+    def take(self, seconds):
+        with self.lock:
+            if seconds > self.remaining:
+                return False
+            self.remaining -= seconds
+            return True
+
+    def spend(self, seconds):
+        with self.lock:
+            self.remaining -= seconds
+
+def backoff_delay(attempt, base_seconds, max_seconds):
+    # "Full jitter": uniform over [0, base * 2^attempt], capped
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+# Circuit breaker, retries and timeout of one external service
+class ServiceGuard:
+    def __init__(self, name, breaker, budget, timeout=10, attempts=2, base_seconds=0.5, max_seconds=5):
+        self.name = name
+        self.breaker = breaker
+        self.budget = budget
+        self.timeout = timeout
+        self.attempts = max(attempts, 1)
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+
+    def available(self):
+        return not self.breaker.is_open()
+
+    # Returns func(), retrying the exceptions in failures with jittered
+    # exponential backoff while the circuit, the attempts and the run's retry
+    # budget allow. Raises ServiceUnavailable when the circuit is open, or
+    # the last failure once retries are used up.
+    def call(self, func, failures):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                metrics.inc('fireaprs_circuit_rejected_total', service=self.name)
+                raise ServiceUnavailable(f"{self.name} circuit is open")
+            start = time.monotonic()
+            try:
+                result = func()
+            except failures as e:
+                self.breaker.failure()
+                error = e
+            except Exception:
+                # Anything else means the service did answer
+                self.breaker.success()
+                raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                if attempt:
+                    self.budget.spend(time.monotonic() - start)
+
+            attempt += 1
+            if attempt >= self.attempts or self.breaker.is_open():
+                raise error
+            delay = backoff_delay(attempt - 1, self.base_seconds, self.max_seconds)
+            if not self.budget.take(delay):
+                metrics.inc('fireaprs_retries_total', service=self.name, result='budget_exhausted')
+                logging.debug(f"Retry budget used up; not retrying {self.name}.")
+                raise error
+            metrics.inc('fireaprs_retries_total', service=self.name, result='retried')
+            time.sleep(delay)
+
+def build_guards(services, retry, budget):
+    # One guard for each service with breaker settings, all sharing budget
+    return {
+        name: ServiceGuard(
+            name,
+            CircuitBreaker(name, settings['failure_threshold'], settings['reset_seconds']),
+            budget,
+            timeout=settings['timeout'],
+            attempts=retry['attempts'],
+            base_seconds=retry['base_seconds'],
+            max_seconds=retry['max_seconds'],
+        )
+        for name, settings in services.items()
+        if 'failure_threshold' in settings
+    }
+
+# Conveniences for classes that may or may not have been given guards
+def guarded(guards, service, func, failures):
+    guard = (guards or {}).get(service)
+    return guard.call(func, failures) if guard else func()
+
+def available(guards, service):
+    guard = (guards or {}).get(service)
+    return guard.available() if guard else True
+
+def timeout(guards, service, default=10):
+    guard = (guards or {}).get(service)
+    return guard.timeout if guard else default
@@ -0,0 +1,131 @@
+# fire_aprs_cli/clustering.py
+
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+from fire_aprs_cli.metrics import metrics
+
+EARTH_RADIUS_KM = 6371.0
+
+# Cell offsets that cover every neighbouring pair exactly once: the cell
+# itself plus the four "forward" neighbours of its 3x3 block
+NEIGHBOUR_OFFSETS = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def acquisition_minutes(df):
+    # Minutes since the epoch from FIRMS acq_date (YYYY-MM-DD) and acq_time
+    # (HHMM, UTC). Missing columns mean "all at the same time".
+    if 'acq_date' not in df or 'acq_time' not in df:
+        return np.zeros(len(df))
+    hhmm = df['acq_time'].fillna(0).astype(int).to_numpy()
+    dates = pd.to_datetime(df['acq_date'], errors='coerce')
+    days = (dates - pd.Timestamp('1970-01-01')).dt.days.fillna(0).to_numpy()
+    return days * 1440 + (hhmm // 100) * 60 + hhmm % 100
+
+def neighbour_pairs(df, radius_km, time_window_minutes, minutes):
+    # Bucket detections into cells at least radius_km wide, so any two
+    # detections within the radius are in the same or adjacent cells
+    max_abs_lat = min(float(np.abs(df['latitude']).max()), 89.0)
+    cell_lat = radius_km / 111.0
+    cell_lon = radius_km / (111.0 * math.cos(math.radians(max_abs_lat)))
+
+    cells = pd.DataFrame({
+        'point': np.arange(len(df)),
+        'group': pd.factorize(df['region'])[0] if 'region' in df else 0,
+        'row': np.floor(df['latitude'].to_numpy() / cell_lat).astype(np.int64),
+        'col': np.floor(df['longitude'].to_numpy() / cell_lon).astype(np.int64),
+    })
+
+    lat = df['latitude'].to_numpy()
+    lon = df['longitude'].to_numpy()
+    pairs_a, pairs_b = [], []
+    for d_row, d_col in NEIGHBOUR_OFFSETS:
+        shifted = cells.assign(row=cells['row'] + d_row, col=cells['col'] + d_col)
+        joined = shifted.merge(cells, on=['group', 'row', 'col'], suffixes=('_a', '_b'))
+        a = joined['point_a'].to_numpy()
+        b = joined['point_b'].to_numpy()
+        if (d_row, d_col) == (0, 0):
+            keep = a < b
+            a, b = a[keep], b[keep]
+        close = (
+            (haversine_km(lat[a], lon[a], lat[b], lon[b]) <= radius_km) &
+            (np.abs(minutes[a] - minutes[b]) <= time_window_minutes)
+        )
+        pairs_a.append(a[close])
+        pairs_b.append(b[close])
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+def connected_labels(count, a, b):
+    # Connected components by min-label propagation with pointer jumping,
+    # all in numpy; converges in a handful of passes
+    labels = np.arange(count)
+    if not len(a):
+        return labels
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, low)
+        np.minimum.at(updated, b, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def cluster_detections(df, radius_km=1.0, time_window_minutes=360):
+    # Groups neighbouring detections (within radius_km of another member and
+    # time_window_minutes of it) into incidents. Detections never merge across
+    # regions. Returns one row per incident with its centroid, pixel count,
+    # max FRP and latest acquisition, plus the reported-store keys of its
+    # members as 'detection_keys' when the detections carry 'detection_key'.
+    if df.empty:
+        return df.assign(pixel_count=pd.Series(dtype='int64'))
+
+    df = df.reset_index(drop=True)
+    minutes = acquisition_minutes(df)
+    a, b = neighbour_pairs(df, radius_km, time_window_minutes, minutes)
+    labels = connected_labels(len(df), a, b)
+
+    df = df.assign(incident=labels, _minutes=minutes)
+    aggregations = {
+        'latitude': ('latitude', 'mean'),
+        'longitude': ('longitude', 'mean'),
+        'pixel_count': ('latitude', 'size'),
+    }
+    if 'region' in df:
+        aggregations['region'] = ('region', 'first')
+    if 'frp' in df:
+        aggregations['frp'] = ('frp', 'max')
+    if 'bright_ti4' in df:
+        aggregations['bright_ti4'] = ('bright_ti4', 'max')
+    if 'detection_key' in df:
+        aggregations['detection_keys'] = ('detection_key', list)
+
+    incidents = df.groupby('incident', sort=True).agg(**aggregations)
+
+    # Confidence of the most confident member
+    if 'confidence' in df:
+        from fire_aprs_cli.priority import confidence_scores
+
+        df['_confidence'] = confidence_scores(df['confidence'])
+        best = df.loc[df.groupby('incident')['_confidence'].idxmax(), ['incident', 'confidence']]
+        incidents = incidents.join(best.set_index('incident'))
+
+    # Latest acquisition of each incident
+    if 'acq_date' in df and 'acq_time' in df:
+        latest = df.loc[df.groupby('incident')['_minutes'].idxmax(), ['incident', 'acq_date', 'acq_time']]
+        incidents = incidents.join(latest.set_index('incident'))
+
+    incidents = incidents.reset_index(drop=True)
+    metrics.inc('fireaprs_incidents_total', len(incidents))
+    logging.info(
+        f"Clustered {len(df)} detections into {len(incidents)} incidents "
+        f"(radius {radius_km} km, window {time_window_minutes} min)."
+    )
+    return incidents
@@ -0,0 +1,143 @@
+# fire_aprs_cli/columnar.py
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+# On-disk encoding of each FIRMS column: raw little-endian arrays that can be
+# memory-mapped. Strings and dates become fixed-width bytes and day numbers,
+# missing values become -1.
+def _encode_date(series):
+    days = pd.to_datetime(series, errors='coerce').to_numpy('datetime64[D]')
+    out = (days - EPOCH).astype('int64')
+    out[np.isnat(days)] = -1
+    return out.astype('<i4')
+
+def _decode_date(values):
+    values = np.asarray(values)
+    dates = (EPOCH + values.astype('timedelta64[D]')).astype(str).astype(object)
+    dates[values < 0] = None
+    return dates
+
+def _encode_int(series):
+    return series.fillna(-1).astype('int64').to_numpy().astype('<i4')
+
+def _decode_int(values):
+    values = np.asarray(values)
+    decoded = pd.array(values, dtype='Int64')
+    decoded[values < 0] = pd.NA
+    return decoded
+
+def _encode_text(width):
+    return lambda s: s.fillna('').astype(str).to_numpy(f'S{width}')
+
+def _decode_text(values):
+    return np.char.decode(np.asarray(values), 'ascii').astype(object)
+
+COLUMN_ENCODINGS = {
+    'latitude': ('<f8', lambda s: s.to_numpy('<f8'), np.asarray),
+    'longitude': ('<f8', lambda s: s.to_numpy('<f8'), np.asarray),
+    'frp': ('<f4', lambda s: s.to_numpy('<f4'), lambda v: np.asarray(v, dtype=float)),
+    'acq_time': ('<i4', _encode_int, _decode_int),
+    'acq_date': ('<i4', _encode_date, _decode_date),
+    'satellite': ('S8', _encode_text(8), _decode_text),
+    'confidence': ('S8', _encode_text(8), _decode_text),
+    'bright_ti4': ('<f4', lambda s: s.to_numpy('<f4'), lambda v: np.asarray(v, dtype=float)),
+}
+
+# Bumped whenever the set of cached columns or their encoding changes, so
+# caches written by an older version are rebuilt
+FORMAT_VERSION = 2
+
+class ColumnarWriter:
+    def __init__(self, cache):
+        self.cache = cache
+        self.tmp_dir = Path(f"{cache.directory}.tmp")
+        if self.tmp_dir.exists():
+            shutil.rmtree(self.tmp_dir)
+        self.tmp_dir.mkdir(parents=True)
+        self.columns = None
+        self.rows = 0
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = [c for c in df.columns if c in COLUMN_ENCODINGS]
+        for column in self.columns:
+            dtype, encode, _ = COLUMN_ENCODINGS[column]
+            with open(self.tmp_dir / f"{column}.bin", 'ab') as f:
+                np.asarray(encode(df[column]), dtype=dtype).tofile(f)
+        self.rows += len(df)
+
+    def commit(self, stamp):
+        meta = {'rows': self.rows, 'columns': self.columns or [], 'stamp': stamp, 'version': FORMAT_VERSION}
+        with open(self.tmp_dir / 'meta.json', 'w') as f:
+            json.dump(meta, f)
+        # Swap the finished directory in; readers never see a partial cache
+        if Path(self.cache.directory).exists():
+            shutil.rmtree(self.cache.directory)
+        os.replace(self.tmp_dir, self.cache.directory)
+        logging.info(f"Columnar cache '{self.cache.directory}' written with {self.rows} rows.")
+
+    def abort(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+# A parsed copy of the global FIRMS file as one memory-mappable array per
+# column, so reprocessing, replays and new regions skip CSV parsing entirely
+class ColumnarCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def source_stamp(path):
+        # Ties the cache to the exact CSV it was parsed from
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def meta(self):
+        try:
+            with open(Path(self.directory) / 'meta.json', 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_valid(self, source_path):
+        meta = self.meta()
+        try:
+            return (
+                meta is not None
+                and meta.get('version') == FORMAT_VERSION
+                and meta['stamp'] == self.source_stamp(source_path)
+            )
+        except OSError:
+            return False
+
+    def writer(self):
+        return ColumnarWriter(self)
+
+    def columns(self):
+        meta = self.meta()
+        arrays = {}
+        for column in meta['columns']:
+            dtype = COLUMN_ENCODINGS[column][0]
+            path = Path(self.directory) / f"{column}.bin"
+            if meta['rows'] == 0:
+                arrays[column] = np.empty(0, dtype=dtype)
+            else:
+                arrays[column] = np.memmap(path, dtype=dtype, mode='r', shape=(meta['rows'],))
+        return arrays
+
+    # Decodes the selected rows (by integer index) back into a DataFrame with
+    # the same columns and dtypes the CSV reader produces
+    def frame(self, arrays, rows):
+        data = {}
+        for column, values in arrays.items():
+            decode = COLUMN_ENCODINGS[column][2]
+            data[column] = decode(values[rows])
+        return pd.DataFrame(data)
@@ -17,9 +17,27 @@ class Config:
         config.read(config_path)
         return config
 
+    def region_sections(self):
+        return [section for section in self.config.sections() if section.startswith('region:')]
+
+    def source_sections(self):
+        return [section for section in self.config.sections() if section.startswith('source:')]
+
+    def tenant_sections(self):
+        return [section for section in self.config.sections() if section.startswith('tenant:')]
+
+    @staticmethod
+    def split_names(value):
+        return [name.strip() for name in value.split(',') if name.strip()]
+
     def validate_config(self):
+        # The [viirs] box is only mandatory when no [region:*] sections are defined
+        viirs_keys = ['url', 'filepath']
+        if not self.region_sections():
+            viirs_keys += ['latitude1', 'latitude2', 'longitude1', 'longitude2']
+
         required_sections = {
-            'viirs': ['url', 'filepath', 'latitude1', 'latitude2', 'longitude1', 'longitude2'],
+            'viirs': viirs_keys,
             'aprssend': ['callsign', 'password', 'comment', 'symbol', 'port'],
             'AQI': ['authtoken'],
             'newsfeed': ['link', 'keyword'],
@@ -33,15 +51,177 @@ class Config:
                 if not self.config.has_option(section, key):
                     raise ValueError(f"Missing option '{key}' in section '{section}' of config.ini")
 
+        box_keys = ['latitude1', 'latitude2', 'longitude1', 'longitude2']
+        for section in self.region_sections():
+            if not section.split(':', 1)[1].strip():
+                raise ValueError(f"Region section '{section}' needs a name, e.g. [region:cyprus]")
+            has_box = all(self.config.has_option(section, key) for key in box_keys)
+            if not has_box and not self.config.has_option(section, 'polygon'):
+                raise ValueError(f"Section '{section}' needs either 'polygon' or all of {box_keys} in config.ini")
+
+        # Every feed needs a cached file of its own
+        filepaths = [self.config.get('viirs', 'filepath')]
+        for section in self.source_sections():
+            if not section.split(':', 1)[1].strip():
+                raise ValueError(f"Source section '{section}' needs a name, e.g. [source:noaa20]")
+            for key in ('url', 'filepath'):
+                if not self.config.has_option(section, key):
+                    raise ValueError(f"Missing option '{key}' in section '{section}' of config.ini")
+            if self.config.get(section, 'filepath') in filepaths:
+                raise ValueError(f"Section '{section}' reuses filepath '{self.config.get(section, 'filepath')}'; every source needs its own")
+            filepaths.append(self.config.get(section, 'filepath'))
+
+        # Tenants pick their regions by name, and APRS-IS drops all but one
+        # login per callsign, so no two tenants may share one
+        region_names = {section.split(':', 1)[1].strip() for section in self.region_sections()}
+        callsigns = {}
+        for section in self.tenant_sections():
+            if not section.split(':', 1)[1].strip():
+                raise ValueError(f"Tenant section '{section}' needs a name, e.g. [tenant:cyprus]")
+            if not self.config.has_option(section, 'regions'):
+                raise ValueError(f"Missing option 'regions' in section '{section}' of config.ini")
+            names = self.split_names(self.config.get(section, 'regions'))
+            if not names:
+                raise ValueError(f"Section '{section}' lists no regions")
+            unknown = [name for name in names if name not in region_names]
+            if unknown:
+                raise ValueError(f"Section '{section}' names unknown region(s) {unknown}; define them as [region:<name>] sections")
+            callsign = self.config.get(section, 'callsign', fallback=self.config.get('aprssend', 'callsign')).upper()
+            if callsign in callsigns:
+                raise ValueError(f"Sections '{callsigns[callsign]}' and '{section}' both log in as {callsign}; give each tenant its own callsign or SSID")
+            callsigns[callsign] = section
+
     def get_viirs_config(self):
-        return {
+        viirs = {
             'url': self.config.get('viirs', 'url'),
             'filepath': self.config.get('viirs', 'filepath'),
-            'latitude1': self.config.getfloat('viirs', 'latitude1'),
-            'latitude2': self.config.getfloat('viirs', 'latitude2'),
-            'longitude1': self.config.getfloat('viirs', 'longitude1'),
-            'longitude2': self.config.getfloat('viirs', 'longitude2'),
+            'chunksize': self.config.getint('viirs', 'chunksize', fallback=100000),
+            'columnar_cache': self.config.getboolean('viirs', 'columnar_cache', fallback=False),
+            'parser': self.config.get('viirs', 'parser', fallback='fast'),
+            'mode': self.config.get('viirs', 'mode', fallback='file'),
+            'map_key': self.config.get('viirs', 'map_key', fallback=''),
+            'area_url': self.config.get('viirs', 'area_url', fallback='https://firms.modaps.eosdis.nasa.gov/api/area/csv'),
+            'product': self.config.get('viirs', 'product', fallback='VIIRS_SNPP_NRT'),
+            'day_range': self.config.getint('viirs', 'day_range', fallback=2),
+            'fallback': self.config.getboolean('viirs', 'fallback', fallback=True),
+            'max_area_queries': self.config.getint('viirs', 'max_area_queries', fallback=4),
+            'cross_sensor_radius_km': self.config.getfloat('viirs', 'cross_sensor_radius_km', fallback=1.0),
+            'cross_sensor_window_minutes': self.config.getfloat('viirs', 'cross_sensor_window_minutes', fallback=60),
         }
+        for key in ('latitude1', 'latitude2', 'longitude1', 'longitude2'):
+            if self.config.has_option('viirs', key):
+                viirs[key] = self.config.getfloat('viirs', key)
+        return viirs
+
+    @staticmethod
+    def parse_polygon(value):
+        # "lat lon; lat lon; ..." -> [(lat, lon), ...]
+        vertices = []
+        for pair in value.split(';'):
+            if not pair.strip():
+                continue
+            lat, lon = pair.replace(',', ' ').split()
+            vertices.append((float(lat), float(lon)))
+        return vertices
+
+    def get_region_configs(self):
+        # One entry per [region:<name>] section. Empty when the legacy [viirs]
+        # box is used instead.
+        regions = []
+        for section in self.region_sections():
+            region = {'name': section.split(':', 1)[1].strip(), 'box': None, 'polygon': None}
+            if self.config.has_option(section, 'polygon'):
+                region['polygon'] = self.parse_polygon(self.config.get(section, 'polygon'))
+            else:
+                region['box'] = tuple(
+                    self.config.getfloat(section, key)
+                    for key in ('latitude1', 'latitude2', 'longitude1', 'longitude2')
+                )
+
+            # Per-region downstream settings; anything left out falls back to
+            # the global sections and command-line flags
+            settings = {}
+            for key in ('aqi', 'news'):
+                if self.config.has_option(section, key):
+                    settings[key] = self.config.getboolean(section, key)
+            for key in ('link', 'keyword', 'comment'):
+                if self.config.has_option(section, key):
+                    settings[key] = self.config.get(section, key)
+            region['settings'] = settings
+            regions.append(region)
+        return regions
+
+    @staticmethod
+    def guess_sensor(url):
+        return 'MODIS' if 'modis' in url.lower() else 'VIIRS'
+
+    def get_source_configs(self):
+        # Extra FIRMS feeds from [source:<name>] sections, downloaded together
+        # with the [viirs] one. Empty when there are none, so a single feed
+        # keeps the plain downloader. The [viirs] feed comes first and wins
+        # cross-sensor duplicates, then the sections in file order.
+        sections = self.source_sections()
+        if not sections:
+            return []
+        url = self.config.get('viirs', 'url')
+        sources = [{
+            'name': 'viirs',
+            'url': url,
+            'filepath': self.config.get('viirs', 'filepath'),
+            'sensor': self.config.get('viirs', 'sensor', fallback=self.guess_sensor(url)),
+        }]
+        for section in sections:
+            url = self.config.get(section, 'url')
+            sources.append({
+                'name': section.split(':', 1)[1].strip(),
+                'url': url,
+                'filepath': self.config.get(section, 'filepath'),
+                'sensor': self.config.get(section, 'sensor', fallback=self.guess_sensor(url)),
+                # FIRMS area API product, e.g. VIIRS_NOAA20_NRT, with mode = area
+                'product': self.config.get(section, 'product', fallback=None),
+            })
+        return sources
+
+    def tenant_values(self, section, base):
+        # base with every key the tenant section sets, read as the same type
+        values = dict(base)
+        for key, value in base.items():
+            if not self.config.has_option(section, key):
+                continue
+            if isinstance(value, bool):
+                values[key] = self.config.getboolean(section, key)
+            elif isinstance(value, int):
+                values[key] = self.config.getint(section, key)
+            elif isinstance(value, float):
+                values[key] = self.config.getfloat(section, key)
+            else:
+                values[key] = self.config.get(section, key)
+        return values
+
+    def get_tenant_configs(self):
+        # One entry per [tenant:<name>] section: the regions it reports on and
+        # its own [aprssend], [AQI], [newsfeed] and [priority] settings, where
+        # any key of those sections can be overridden. Each tenant remembers
+        # what it reported in a database of its own. Empty without tenant
+        # sections.
+        tenants = []
+        state = self.get_state_config()
+        stem, dot, extension = state['path'].rpartition('.')
+        for section in self.tenant_sections():
+            name = section.split(':', 1)[1].strip()
+            default_path = ''
+            if state['path']:
+                default_path = f"{stem}-{name}.{extension}" if dot else f"{state['path']}-{name}"
+            tenants.append({
+                'name': name,
+                'regions': self.split_names(self.config.get(section, 'regions')),
+                'aprssend': self.tenant_values(section, self.get_aprs_config()),
+                'aqi': self.tenant_values(section, self.get_aqi_config()),
+                'newsfeed': self.tenant_values(section, self.get_newsfeed_config()),
+                'priority': self.tenant_values(section, self.get_priority_config()),
+                'state': dict(state, path=self.config.get(section, 'state_path', fallback=default_path)),
+            })
+        return tenants
 
     def get_aprs_config(self):
         return {
@@ -49,18 +229,120 @@ class Config:
             'password': self.config.get('aprssend', 'password'),
             'comment': self.config.get('aprssend', 'comment'),
             'symbol': self.config.get('aprssend', 'symbol'),
+            'host': self.config.get('aprssend', 'host', fallback='rotate.aprs.net'),
             'port': self.config.getint('aprssend', 'port'),
+            'packets_per_minute': self.config.getfloat('aprssend', 'packets_per_minute', fallback=12),
+            'burst': self.config.getint('aprssend', 'burst', fallback=1),
+            'keepalive_seconds': self.config.getfloat('aprssend', 'keepalive_seconds', fallback=120),
+            'max_retries': self.config.getint('aprssend', 'max_retries', fallback=5),
+            'max_backoff_seconds': self.config.getfloat('aprssend', 'max_backoff_seconds', fallback=300),
+            'flush_timeout_seconds': self.config.getfloat('aprssend', 'flush_timeout_seconds', fallback=600),
+            'position_format': self.config.get('aprssend', 'position_format', fallback='uncompressed'),
+            'report': self.config.get('aprssend', 'report', fallback='position'),
+            'max_info_length': self.config.getint('aprssend', 'max_info_length', fallback=256),
+            # file:<path> or tcp:<host>:<port> writes packets there instead of
+            # logging in to APRS-IS
+            'sink': self.config.get('aprssend', 'sink', fallback=''),
         }
 
     def get_aqi_config(self):
         return {
             'authtoken': self.config.get('AQI', 'authtoken'),
+            'api_url': self.config.get('AQI', 'api_url', fallback='https://api.waqi.info'),
+            'batch': self.config.getboolean('AQI', 'batch', fallback=True),
+            'max_station_km': self.config.getfloat('AQI', 'max_station_km', fallback=50),
+        }
+
+    def get_geocode_config(self):
+        # Optional section; the cache is on by default
+        return {
+            'cache_path': self.config.get('geocode', 'cache_path', fallback='data/geocode_cache.sqlite'),
+            'precision': self.config.getint('geocode', 'precision', fallback=2),
+            'ttl_days': self.config.getfloat('geocode', 'ttl_days', fallback=30),
+            'max_entries': self.config.getint('geocode', 'max_entries', fallback=50000),
+            'nominatim_url': self.config.get('geocode', 'nominatim_url', fallback='https://nominatim.openstreetmap.org'),
         }
 
     def get_newsfeed_config(self):
         return {
             'link': self.config.get('newsfeed', 'link'),
             'keyword': self.config.get('newsfeed', 'keyword'),
+            'ttl_minutes': self.config.getfloat('newsfeed', 'ttl_minutes', fallback=15),
+        }
+
+    def get_state_config(self):
+        # Optional section; detections already reported are remembered for
+        # retention_hours so scheduled runs only send new ones
+        return {
+            'path': self.config.get('state', 'path', fallback='data/reported.sqlite'),
+            'retention_hours': self.config.getfloat('state', 'retention_hours', fallback=48),
+            'precision': self.config.getint('state', 'precision', fallback=3),
+        }
+
+    def get_clustering_config(self):
+        # Optional section; adjacent VIIRS pixels are merged by default
+        return {
+            'enabled': self.config.getboolean('clustering', 'enabled', fallback=True),
+            'radius_km': self.config.getfloat('clustering', 'radius_km', fallback=1.0),
+            'time_window_minutes': self.config.getfloat('clustering', 'time_window_minutes', fallback=360),
+        }
+
+    def get_priority_config(self):
+        # Optional section; incidents are sent most important first, and the
+        # packet budgets are off (0) by default
+        return {
+            'enabled': self.config.getboolean('priority', 'enabled', fallback=True),
+            'half_life_hours': self.config.getfloat('priority', 'half_life_hours', fallback=6),
+            'max_packets_per_run': self.config.getint('priority', 'max_packets_per_run', fallback=0),
+            'max_packets_per_hour': self.config.getint('priority', 'max_packets_per_hour', fallback=0),
+        }
+
+    def get_pipeline_config(self):
+        # Optional section. Per-service limits default to the providers' usage
+        # policies (Nominatim: 1 request/second, single connection). The
+        # per-record lookups also get a timeout and a circuit breaker that
+        # opens after failure_threshold failures in a row for reset_seconds.
+        defaults = {
+            'nominatim': {'concurrency': 1, 'rate': 1.0, 'burst': 1},
+            'waqi': {'concurrency': 4, 'rate': 10.0, 'burst': 5},
+            'rss': {'concurrency': 4, 'rate': 5.0, 'burst': 5},
+        }
+        services = {}
+        for name, default in defaults.items():
+            services[name] = {
+                'concurrency': self.config.getint('pipeline', f'{name}_concurrency', fallback=default['concurrency']),
+                'rate': self.config.getfloat('pipeline', f'{name}_rate', fallback=default['rate']),
+                'burst': self.config.getint('pipeline', f'{name}_burst', fallback=default['burst']),
+            }
+        for name in ('nominatim', 'waqi'):
+            services[name].update({
+                'timeout': self.config.getfloat('pipeline', f'{name}_timeout', fallback=5),
+                'failure_threshold': self.config.getint('pipeline', f'{name}_failure_threshold', fallback=3),
+                'reset_seconds': self.config.getfloat('pipeline', f'{name}_reset_seconds', fallback=60),
+            })
+        return {
+            'workers': self.config.getint('pipeline', 'workers', fallback=8),
+            'services': services,
+            # Failed lookups are retried with jittered exponential backoff, up
+            # to retry_attempts tries each and retry_budget_seconds per run
+            'retry': {
+                'attempts': self.config.getint('pipeline', 'retry_attempts', fallback=2),
+                'base_seconds': self.config.getfloat('pipeline', 'retry_base_seconds', fallback=0.5),
+                'max_seconds': self.config.getfloat('pipeline', 'retry_max_seconds', fallback=5),
+                'budget_seconds': self.config.getfloat('pipeline', 'retry_budget_seconds', fallback=30),
+            },
+        }
+
+    def get_metrics_config(self):
+        # Optional section. The daemon serves metrics on host:port (port 0
+        # turns the endpoint off); single runs append a JSON summary per run
+        # to summary_path (empty turns it off), trimmed to its newest lines
+        # once it grows past summary_max_kb (0: never).
+        return {
+            'host': self.config.get('metrics', 'host', fallback='127.0.0.1'),
+            'port': self.config.getint('metrics', 'port', fallback=9464),
+            'summary_path': self.config.get('metrics', 'summary_path', fallback='data/run_metrics.jsonl'),
+            'summary_max_kb': self.config.getint('metrics', 'summary_max_kb', fallback=1024),
         }
 
     def get_logging_config(self):
@@ -0,0 +1,73 @@
+# fire_aprs_cli/csvscan.py
+
+import csv
+import math
+import re
+
+BLOCK_SIZE = 1 << 24
+
+def integer_prefixes(lat_ranges):
+    # Integer parts a latitude inside any of the ranges can be written with,
+    # e.g. (34.5, 35.8) -> "34", "35". Zero appears both signed and unsigned.
+    prefixes = set()
+    for low, high in lat_ranges:
+        for k in range(math.floor(low), math.ceil(high) + 1):
+            if k >= 0:
+                prefixes.add(str(k))
+            if k <= 0:
+                prefixes.add(f"-{-k}")
+    # Longest first, so "35" is tried before "3"
+    return sorted(prefixes, key=len, reverse=True)
+
+def candidate_pattern(column, lat_ranges):
+    # Matches whole lines whose latitude field starts with one of the integer
+    # prefixes. Anchoring on the newline lets the regex engine skip through
+    # each block in C instead of touching every row from Python.
+    alternatives = '|'.join(re.escape(p) for p in integer_prefixes(lat_ranges))
+    return re.compile(rf"\n((?:[^,\n]*,){{{column}}}(?:{alternatives})[.,\r\n][^\n]*)".encode())
+
+def split_line(line):
+    line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+    if '"' in line:
+        return next(csv.reader([line]))
+    return line.split(',')
+
+# Scans a FIRMS-style CSV for rows inside (lat_min, lat_max, lon_min,
+# lon_max), looking only at rows in the integer latitude bands of
+# lat_ranges. Returns (header, rows scanned, matching rows as lists of
+# strings) without pandas; the matches are usually a tiny share of the file.
+def scan_bbox(path, bounds, lat_ranges=None, block_size=BLOCK_SIZE):
+    lat_min, lat_max, lon_min, lon_max = bounds
+    with open(path, 'rb') as f:
+        header = split_line(f.readline())
+        if 'latitude' not in header or 'longitude' not in header:
+            raise ValueError(f"CSV file '{path}' has no latitude/longitude columns.")
+        lat_col = header.index('latitude')
+        lon_col = header.index('longitude')
+        pattern = candidate_pattern(lat_col, lat_ranges or [(lat_min, lat_max)])
+
+        total = 0
+        matches = []
+        # Every block starts with the newline that ended the previous one
+        rest = b"\n"
+        while True:
+            block = f.read(block_size)
+            data = rest + block
+            if block:
+                cut = data.rfind(b"\n")
+                data, rest = data[:cut], data[cut:]
+            # One newline per row; the final "\n" after the last row is no row
+            if block or data.strip():
+                total += data.count(b"\n")
+            for match in pattern.finditer(data):
+                fields = split_line(match.group(1))
+                try:
+                    lat = float(fields[lat_col])
+                    lon = float(fields[lon_col])
+                except (IndexError, ValueError):
+                    continue
+                if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max:
+                    matches.append(fields)
+            if not block:
+                break
+    return header, total, matches
@@ -0,0 +1,114 @@
+# fire_aprs_cli/daemon.py
+
+import logging
+import signal
+import threading
+
+from fire_aprs_cli.metrics_server import MetricsServer
+from fire_aprs_cli.runtime import Runtime
+from fire_aprs_cli.scheduler import Scheduler
+
+# Long-lived mode behind --autoschedule. One Runtime stays warm between runs
+# (pooled HTTP sessions, the APRS-IS login, geocode/news/station caches and
+# the reported-detection store). SIGHUP reloads config.ini in place; SIGINT
+# and SIGTERM let the current run finish, drain the APRS queue and exit.
+class Daemon:
+    def __init__(self, load_config, job_func, interval_minutes, config=None, enable_aqi=True, enable_news=True):
+        self.load_config = load_config
+        self.job_func = job_func
+        self.enable_aqi = enable_aqi
+        self.enable_news = enable_news
+        self.config = config if config is not None else load_config()
+        self.runtime = self.build_runtime(self.config)
+
+        # Runs and reloads never overlap
+        self.run_lock = threading.Lock()
+        self.reload_requested = threading.Event()
+        self.reprocess_next = False
+        self.scheduler = Scheduler(interval_minutes, self.run)
+        self.metrics_server = None
+
+    def build_runtime(self, config):
+        return Runtime(config, enable_aqi=self.enable_aqi, enable_news=self.enable_news, persistent=True)
+
+    def run(self, **kwargs):
+        with self.run_lock:
+            # After a reload the cached FIRMS file is filtered again, so edited
+            # regions take effect without waiting for new upstream data
+            if self.reprocess_next:
+                kwargs['reprocess'] = True
+                self.reprocess_next = False
+            try:
+                self.job_func(
+                    self.config,
+                    enable_aqi=self.enable_aqi,
+                    enable_news=self.enable_news,
+                    runtime=self.runtime,
+                    **kwargs
+                )
+            except Exception as e:
+                # A failed run must not take the daemon down; the next one retries
+                logging.error(f"Error during fire data processing: {e}")
+
+    def request_reload(self, signum=None, frame=None):
+        self.reload_requested.set()
+
+    def check_reload(self):
+        if self.reload_requested.is_set():
+            self.reload_requested.clear()
+            self.reload()
+
+    def reload(self):
+        logging.info("Reloading configuration...")
+        try:
+            config = self.load_config()
+        except Exception as e:
+            logging.error(f"Configuration reload failed, keeping the current configuration: {e}")
+            return
+
+        with self.run_lock:
+            # The new runtime is built before the old one is closed, so a
+            # failure leaves the daemon running on the current one. This
+            # doesn't log in twice: the new runtime only connects to APRS-IS
+            # when its first run has something to send, and APRS-IS drops
+            # duplicate logins of the same callsign.
+            try:
+                runtime = self.build_runtime(config)
+            except Exception as e:
+                logging.error(f"Could not apply the reloaded configuration, keeping the current one: {e}")
+                return
+            try:
+                self.runtime.close()
+            except Exception as e:
+                logging.error(f"Error closing the previous runtime: {e}")
+            self.runtime = runtime
+            self.config = config
+            self.reprocess_next = True
+
+        level = getattr(logging, self.config['logging']['level'].upper(), logging.INFO)
+        logging.getLogger().setLevel(level)
+        logging.info("Configuration reloaded.")
+
+    # Runs the job now and then every interval until a shutdown is requested
+    def serve(self, **first_run_kwargs):
+        # The metrics endpoint is bound once; its address is not reloaded
+        if self.config['metrics']['port']:
+            try:
+                self.metrics_server = MetricsServer(self.config['metrics']['host'], self.config['metrics']['port']).start()
+            except OSError as e:
+                logging.error(f"Could not start the metrics endpoint: {e}")
+        self.scheduler.start()
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+
+        self.run(**first_run_kwargs)
+        self.scheduler.wait(on_tick=self.check_reload)
+        self.shutdown()
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+        with self.run_lock:
+            self.runtime.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        logging.info("Daemon stopped.")
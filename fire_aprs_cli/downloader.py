@@ -1,85 +1,471 @@
 # fire_aprs_cli/downloader.py
 
+import hashlib
+import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import pandas as pd
+import numpy as np
 import requests
 
+from fire_aprs_cli.csvscan import scan_bbox
+from fire_aprs_cli.metrics import external_call, metrics
+from fire_aprs_cli.regions import Region, RegionIndex
+
+DEFAULT_CHUNKSIZE = 100000
+
+# FIRMS columns carried through to the pipeline; only latitude and longitude
+# are required, the rest are kept when the file has them
+CSV_COLUMNS = {
+    'latitude': float,
+    'longitude': float,
+    'acq_date': str,
+    'acq_time': 'Int64',
+    'satellite': str,
+    'frp': float,
+    'confidence': str,
+    'bright_ti4': float,
+}
+
+PARSERS = ('fast', 'pandas')
+
+# 'file' downloads url, the global 24h file or a regional extract; 'area'
+# asks the FIRMS area API for the regions' boxes only
+MODES = ('file', 'area')
+AREA_URL = 'https://firms.modaps.eosdis.nasa.gov/api/area/csv'
+# Each area query costs map key quota
+DEFAULT_MAX_AREA_QUERIES = 4
+
 class VIIRSDownloader:
-    def __init__(self, config):
+    def __init__(self, config, regions=None, session=None, region_index=None):
         self.url = config['url']
         self.file_path = config['filepath']
-        self.latitude_pos_1 = config['latitude1']
-        self.latitude_pos_2 = config['latitude2']
-        self.longitude_pos_1 = config['longitude1']
-        self.longitude_pos_2 = config['longitude2']
+
+        # Without [region:*] sections the [viirs] box is the only region.
+        # Several downloaders of one run can share a prebuilt index.
+        if region_index is None:
+            if regions:
+                regions = [Region.from_config(region) for region in regions]
+            else:
+                regions = [Region.from_viirs_config(config)]
+            region_index = RegionIndex(regions)
+        self.region_index = region_index
+        # Rows parsed per chunk when streaming; 0 loads the whole file at once
+        self.chunksize = config.get('chunksize', DEFAULT_CHUNKSIZE)
+        # 'fast' scans the file for in-region rows without pandas; 'pandas'
+        # parses every row with read_csv
+        self.parser = config.get('parser', 'fast')
+        if self.parser not in PARSERS:
+            raise ValueError(f"Unknown parser '{self.parser}'; expected one of {', '.join(PARSERS)}.")
+        self.mode = config.get('mode', 'file')
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown mode '{self.mode}'; expected one of {', '.join(MODES)}.")
+        self.area_url = config.get('area_url', AREA_URL).rstrip('/')
+        self.map_key = config.get('map_key', '')
+        self.product = config.get('product', 'VIIRS_SNPP_NRT')
+        self.day_range = config.get('day_range', 2)
+        # Whether a failed area query falls back to downloading url
+        self.fallback = config.get('fallback', True)
+        self.max_area_queries = config.get('max_area_queries', DEFAULT_MAX_AREA_QUERIES)
+        if self.mode == 'area' and not self.map_key:
+            raise ValueError("mode = area needs a FIRMS map_key.")
+        if self.max_area_queries < 1:
+            raise ValueError(f"max_area_queries must be at least 1, got {self.max_area_queries}.")
+        self.session = session or requests.Session()
+
+        # Cache bookkeeping lives next to the CSV itself
+        self.meta_path = f"{self.file_path}.meta.json"
+        self.part_path = f"{self.file_path}.part"
+        self.columnar_cache = None
+        if config.get('columnar_cache'):
+            from fire_aprs_cli.columnar import ColumnarCache
+
+            self.columnar_cache = ColumnarCache(f"{self.file_path}.columns")
 
     def remove_existing_file(self):
         try:
-            if Path(self.file_path).is_file():
-                Path(self.file_path).unlink()
-                logging.info(f"Removed existing file at {self.file_path}.")
+            for path in (self.file_path, self.meta_path, self.part_path):
+                if Path(path).is_file():
+                    Path(path).unlink()
+                    logging.info(f"Removed existing file at {path}.")
         except OSError as e:
             logging.error(f"Error removing file {self.file_path}: {e}")
             raise
 
+    # url identifies what the metadata describes: the file URL, or the area
+    # query signature
+    def load_metadata(self, url=None):
+        try:
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Validators recorded for a different URL say nothing about this one
+        if meta.get('url') != (url or self.url):
+            return {}
+        return meta
+
+    def save_metadata(self, meta, url=None):
+        meta['url'] = url or self.url
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    @staticmethod
+    def validators(response):
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    def build_request_headers(self, meta):
+        headers = {}
+
+        # Conditional request for the complete file we already have
+        if Path(self.file_path).is_file():
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        # Resume a previously interrupted transfer, but only if it is still
+        # the same upstream version (If-Range falls back to a full 200 otherwise)
+        partial = meta.get('partial') or {}
+        part_size = Path(self.part_path).stat().st_size if Path(self.part_path).is_file() else 0
+        if part_size and (partial.get('etag') or partial.get('last_modified')):
+            headers['Range'] = f"bytes={part_size}-"
+            headers['If-Range'] = partial.get('etag') or partial.get('last_modified')
+
+        # Compressed transfers are several times smaller, but byte ranges of
+        # a gzip stream don't line up with the decoded .part file, so a resume
+        # asks for the identity encoding it started with
+        headers['Accept-Encoding'] = 'identity' if 'Range' in headers else 'gzip'
+        return headers
+
+    # Returns True when a new version was written to filepath and False when
+    # the server reported the cached copy as current.
     def download_file(self):
+        meta = self.load_metadata()
+        headers = self.build_request_headers(meta)
+
         try:
-            response = requests.get(self.url, stream=True, timeout=60)
+            with external_call('firms') as call:
+                response = self.session.get(self.url, headers=headers, stream=True, timeout=60)
+                if response.status_code == 304:
+                    call.not_modified()
+                elif response.status_code >= 400 and response.status_code != 416:
+                    call.fail()
+
+            if response.status_code == 304:
+                response.close()
+                if Path(self.part_path).is_file():
+                    Path(self.part_path).unlink()
+                meta.pop('partial', None)
+                self.save_metadata(meta)
+                logging.info(f"Upstream file at {self.url} not modified; using cached {self.file_path}.")
+                return False
+
+            if response.status_code == 416:
+                # Our partial file no longer lines up with the upstream one
+                response.close()
+                logging.warning(f"Range not satisfiable for {self.url}; restarting download.")
+                Path(self.part_path).unlink(missing_ok=True)
+                meta.pop('partial', None)
+                self.save_metadata(meta)
+                return self.download_file()
+
             response.raise_for_status()
-            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-            with open(self.file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
+            validators = self.validators(response)
+
+            resuming = response.status_code == 206
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+
+            # Record the validator of the partial before streaming so that an
+            # interrupted transfer can be resumed on the next run. Compressed
+            # transfers can't be resumed and start over instead.
+            encoded = response.headers.get('Content-Encoding', 'identity').lower() not in ('', 'identity')
+            meta['partial'] = {} if encoded else validators
+            self.save_metadata(meta)
+
+            written = 0
+            transferred = 0
+            with open(self.part_path, 'ab' if resuming else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=65536):
                     f.write(chunk)
-            logging.info(f"Successfully downloaded file from {self.url} to {self.file_path}.")
+                    written += len(chunk)
+                    # Bytes on the wire, before gzip decoding
+                    wire = response.raw.tell()
+                    metrics.inc('fireaprs_download_bytes_total', wire - transferred)
+                    transferred = wire
+            logging.info(f"Transferred {transferred} bytes for {written} bytes of CSV{' (gzip)' if encoded else ''}.")
+
+            # Atomic swap: readers never see a half-written CSV
+            os.replace(self.part_path, self.file_path)
+            meta = dict(validators)
+            self.save_metadata(meta)
+
+            if resuming:
+                logging.info(f"Resumed download from {self.url} to {self.file_path}.")
+            else:
+                logging.info(f"Successfully downloaded file from {self.url} to {self.file_path}.")
+            return True
         except requests.RequestException as e:
             logging.error(f"Failed to download file from {self.url}: {e}")
             raise
 
-    def process_csv(self):
+    @staticmethod
+    def union(a, b):
+        return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+    @staticmethod
+    def area(box):
+        return (box[2] - box[0]) * (box[3] - box[1])
+
+    def area_boxes(self):
+        # The regions' boxes as west,south,east,north. Overlapping or touching
+        # boxes become one query, then the pair whose union adds the least
+        # area is merged until at most max_area_queries are left. Rows of a
+        # merged box outside every region are dropped when the file is
+        # filtered, like those of the global file.
+        boxes = [(region.lon_min, region.lat_min, region.lon_max, region.lat_max)
+                 for region in self.region_index.regions]
+        while True:
+            pairs = [(i, j) for i in range(len(boxes)) for j in range(i + 1, len(boxes))]
+            touching = [(i, j) for i, j in pairs
+                        if boxes[i][0] <= boxes[j][2] and boxes[j][0] <= boxes[i][2]
+                        and boxes[i][1] <= boxes[j][3] and boxes[j][1] <= boxes[i][3]]
+            if touching:
+                i, j = touching[0]
+            elif len(boxes) > self.max_area_queries:
+                i, j = min(pairs, key=lambda pair: self.area(self.union(boxes[pair[0]], boxes[pair[1]]))
+                           - self.area(boxes[pair[0]]) - self.area(boxes[pair[1]]))
+            else:
+                break
+            boxes[i] = self.union(boxes[i], boxes[j])
+            del boxes[j]
+        return [f"{west:.4f},{south:.4f},{east:.4f},{north:.4f}" for west, south, east, north in boxes]
+
+    def area_request_url(self, box, redact=False):
+        key = '***' if redact else self.map_key
+        return f"{self.area_url}/{key}/{self.product}/{box}/{self.day_range}"
+
+    def fetch_area(self, box):
+        # Returns the header line and the rest of one box's answer
+        with external_call('firms') as call:
+            response = self.session.get(self.area_request_url(box), headers={'Accept-Encoding': 'gzip'}, timeout=60)
+            if response.status_code >= 400:
+                call.fail()
+            response.raise_for_status()
+            body = response.content
+            metrics.inc('fireaprs_download_bytes_total', response.raw.tell() or len(body))
+            # Errors such as an invalid map key come back as plain text
+            first, _, rest = body.partition(b"\n")
+            if b"latitude" not in first:
+                raise ValueError(f"FIRMS area API did not return CSV for {self.area_request_url(box, redact=True)}: {first[:100]!r}")
+        return first.rstrip(b"\r"), rest
+
+    # Area API answers carry no validators, so an unchanged answer is spotted
+    # by its digest. The boxes are queried concurrently and their answers
+    # joined in box order; a row in several answers is written once.
+    # Returns True when the file changed.
+    def download_area(self):
+        header = None
+        rows = []
+        seen = set()
+        boxes = self.area_boxes()
+        if len(boxes) == 1:
+            answers = [self.fetch_area(boxes[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(boxes), thread_name_prefix="firms-area") as executor:
+                answers = list(executor.map(self.fetch_area, boxes))
+        for first, rest in answers:
+            header = header or first
+            for line in rest.splitlines():
+                if line and line not in seen:
+                    seen.add(line)
+                    rows.append(line)
+        logging.info(f"FIRMS area API returned {len(rows)} rows for {len(boxes)} box(es).")
+
+        content = header + b"\n" + b"".join(row + b"\n" for row in rows)
+        digest = hashlib.sha256(content).hexdigest()
+        signature = f"area:{self.product}:{self.day_range}:{';'.join(boxes)}"
+        if Path(self.file_path).is_file() and self.load_metadata(signature).get('sha256') == digest:
+            logging.info(f"FIRMS area answer unchanged; using cached {self.file_path}.")
+            return False
+
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+        with open(self.part_path, 'wb') as f:
+            f.write(content)
+        os.replace(self.part_path, self.file_path)
+        self.save_metadata({'sha256': digest}, url=signature)
+        logging.info(f"Wrote FIRMS area answer to {self.file_path}.")
+        return True
+
+    # Fetches the configured source. Returns True when filepath holds new
+    # data and False when it is unchanged.
+    def download(self):
+        if self.mode != 'area':
+            return self.download_file()
         try:
-            df = pd.read_csv(
-                self.file_path,
-                usecols=['latitude', 'longitude'],
-                dtype={'latitude': float, 'longitude': float}
-            )
-            logging.info(f"CSV file '{self.file_path}' loaded successfully with {len(df)} records.")
-        except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
-            logging.error(f"Error reading CSV file '{self.file_path}': {e}")
+            return self.download_area()
+        except (requests.RequestException, ValueError) as e:
+            if not self.fallback:
+                raise
+            logging.warning(f"FIRMS area query failed ({e}); falling back to {self.url}.")
+            return self.download_file()
+
+    def assign_regions(self, df):
+        # Cheap union-of-boxes prefilter, then one vectorized pass through the
+        # grid index. Detections inside several regions appear once per region.
+        df = df[self.region_index.bounds_mask(df['latitude'].to_numpy(), df['longitude'].to_numpy())]
+        point_idx, region_idx = self.region_index.assign(df['latitude'].to_numpy(), df['longitude'].to_numpy())
+        assigned = df.iloc[point_idx].reset_index(drop=True)
+        assigned['region'] = self.region_index.names(region_idx)
+        return assigned
+
+    def read_csv(self, **kwargs):
+        import pandas as pd
+
+        return pd.read_csv(
+            self.file_path,
+            usecols=lambda column: column in CSV_COLUMNS,
+            dtype=CSV_COLUMNS,
+            **kwargs
+        )
+
+    @staticmethod
+    def empty_frame():
+        import pandas as pd
+
+        empty = {column: pd.Series(dtype=dtype) for column, dtype in CSV_COLUMNS.items()}
+        empty['region'] = pd.Series(dtype=object)
+        return pd.DataFrame(empty)
+
+    def load_filtered_columnar(self):
+        # Only the latitude/longitude pages are touched to find candidates;
+        # the other columns are read for the matching rows alone
+        arrays = self.columnar_cache.columns()
+        metrics.inc('fireaprs_rows_parsed_total', len(arrays['latitude']))
+        candidates = np.flatnonzero(self.region_index.bounds_mask(arrays['latitude'], arrays['longitude']))
+        logging.info(f"Columnar cache '{self.columnar_cache.directory}' mapped with {len(arrays['latitude'])} records.")
+        return self.assign_regions(self.columnar_cache.frame(arrays, candidates))
+
+    def load_filtered(self):
+        if self.columnar_cache:
+            valid = self.columnar_cache.is_valid(self.file_path)
+            metrics.inc('fireaprs_cache_requests_total', cache='columnar', result='hit' if valid else 'miss')
+            if valid:
+                return self.load_filtered_columnar()
+
+        # Parsing the CSV anyway, so keep a columnar copy of it on the side
+        writer = self.columnar_cache.writer() if self.columnar_cache else None
+        try:
+            filtered = self.parse_filtered(writer)
+        except Exception:
+            if writer:
+                writer.abort()
             raise
+        if writer:
+            writer.commit(self.columnar_cache.source_stamp(self.file_path))
+        return filtered
 
-        # Apply filtering
-        filtered_df = df[
-            (df['latitude'] <= self.latitude_pos_1) & 
-            (df['latitude'] >= self.latitude_pos_2) &
-            (df['longitude'] >= self.longitude_pos_1) & 
-            (df['longitude'] <= self.longitude_pos_2)
-        ]
+    @staticmethod
+    def frame_from_rows(header, rows):
+        # Typed DataFrame from scanned string fields, with the same columns
+        # and dtypes read_csv produces; empty fields become missing values
+        import pandas as pd
 
-        logging.info(f"Filtered data contains {len(filtered_df)} records.")
-        print(filtered_df)  # Optional: Remove or redirect to logging if not needed
+        data = {}
+        for position, column in enumerate(header):
+            if column not in CSV_COLUMNS or column in data:
+                continue
+            dtype = CSV_COLUMNS[column]
+            values = [row[position] if position < len(row) else '' for row in rows]
+            if dtype is float:
+                values = [float(v) if v else float('nan') for v in values]
+            elif dtype == 'Int64':
+                values = [int(v) if v else None for v in values]
+            else:
+                values = [v if v else None for v in values]
+            data[column] = pd.Series(values, dtype=dtype)
+        return pd.DataFrame(data)
+
+    def scan_filtered(self):
+        # Only rows in the regions' latitude bands are split and converted;
+        # pandas just wraps the few rows that match
+        lat_ranges = [(region.lat_min, region.lat_max) for region in self.region_index.regions]
+        header, total, rows = scan_bbox(self.file_path, self.region_index.bounds, lat_ranges)
+        metrics.inc('fireaprs_rows_parsed_total', total)
+        logging.info(f"CSV file '{self.file_path}' scanned successfully with {total} records.")
+        if not rows:
+            return self.empty_frame()
+        return self.assign_regions(self.frame_from_rows(header, rows))
+
+    def parse_filtered(self, writer=None):
+        # The columnar cache needs every row parsed, so it always uses pandas
+        if self.parser == 'fast' and writer is None:
+            return self.scan_filtered()
+
+        # Whole-file path: peak memory follows the size of the global file
+        if not self.chunksize:
+            df = self.read_csv()
+            metrics.inc('fireaprs_rows_parsed_total', len(df))
+            logging.info(f"CSV file '{self.file_path}' loaded successfully with {len(df)} records.")
+            if writer:
+                writer.append(df)
+            return self.assign_regions(df)
+
+        # Streaming path: out-of-region rows are dropped chunk by chunk, so we
+        # only ever hold one chunk plus the rows that matched
+        total = 0
+        matches = []
+        with self.read_csv(chunksize=self.chunksize) as reader:
+            for chunk in reader:
+                total += len(chunk)
+                metrics.inc('fireaprs_rows_parsed_total', len(chunk))
+                if writer:
+                    writer.append(chunk)
+                kept = self.assign_regions(chunk)
+                if len(kept):
+                    matches.append(kept)
+        logging.info(f"CSV file '{self.file_path}' streamed successfully with {total} records.")
+        if not matches:
+            return self.empty_frame()
+        import pandas as pd
 
-        # Save to JSON
+        return pd.concat(matches, ignore_index=True)
+
+    # Returns the detections inside the configured regions as a DataFrame,
+    # handed straight to the pipeline without a round-trip through disk
+    def process_csv(self):
         try:
-            filtered_df.to_json(
-                "viirs.json",
-                orient="records",
-                date_format="epoch",
-                double_precision=10,
-                force_ascii=True,
-                date_unit="ms",
-                default_handler=None
-            )
-            logging.info("Filtered data saved to 'viirs.json'.")
-        except (TypeError, ValueError) as e:
-            logging.error(f"Error saving filtered data to JSON: {e}")
+            filtered_df = self.load_filtered()
+        except (ValueError, OSError) as e:
+            # pandas' EmptyDataError and ParserError are ValueErrors too
+            logging.error(f"Error reading CSV file '{self.file_path}': {e}")
             raise
 
-    def run(self):
+        metrics.inc('fireaprs_rows_kept_total', len(filtered_df))
+        logging.info(f"Filtered data contains {len(filtered_df)} records.")
+        logging.debug(f"Filtered detections:\n{filtered_df}")
+        return filtered_df
+
+    # Returns the filtered detections, or None when upstream is unchanged so
+    # callers can skip the rest of the pipeline. reprocess filters the cached
+    # file again even when it is unchanged, e.g. after editing the regions.
+    def run(self, force=False, reprocess=False):
         logging.info("VIIRS Downloader started.")
-        self.remove_existing_file()
-        self.download_file()
-        self.process_csv()
+        if force:
+            self.remove_existing_file()
+        with metrics.stage('download'):
+            downloaded = self.download()
+        if not downloaded and not reprocess:
+            logging.info("VIIRS Downloader finished: no new data upstream.")
+            return None
+        with metrics.stage('parse'):
+            detections = self.process_csv()
         logging.info("VIIRS Downloader finished successfully.")
+        return detections
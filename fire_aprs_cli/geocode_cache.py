@@ -0,0 +1,96 @@
+# fire_aprs_cli/geocode_cache.py
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+class GeocodeCache:
+    def __init__(self, path, precision=2, ttl_days=30, max_entries=50000):
+        self.path = path
+        # Decimal places kept from each coordinate; 2 places is roughly 1 km
+        self.precision = precision
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            " key TEXT PRIMARY KEY,"
+            " city TEXT,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS geocode_last_used ON geocode (last_used)")
+        self.purge_expired()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+        logging.info(f"Geocode cache '{path}' opened with {self.size} entries.")
+
+    def key(self, latitude, longitude):
+        return f"{round(float(latitude), self.precision):.{self.precision}f},{round(float(longitude), self.precision):.{self.precision}f}"
+
+    def purge_expired(self):
+        with self.lock, self.conn:
+            cursor = self.conn.execute("DELETE FROM geocode WHERE created < ?", (time.time() - self.ttl,))
+        if cursor.rowcount:
+            logging.info(f"Geocode cache: purged {cursor.rowcount} expired entries.")
+
+    # Returns (found, city). A cached None means the location was looked up
+    # before and had no city, which is worth remembering too.
+    def get(self, latitude, longitude):
+        key = self.key(latitude, longitude)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT city, created FROM geocode WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now - self.ttl:
+                self.misses += 1
+                return False, None
+            with self.conn:
+                self.conn.execute("UPDATE geocode SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return True, row[0]
+
+    def set(self, latitude, longitude, city):
+        key = self.key(latitude, longitude)
+        now = time.time()
+        with self.lock, self.conn:
+            existed = self.conn.execute("SELECT 1 FROM geocode WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO geocode (key, city, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, city, now, now)
+            )
+            if not existed:
+                self.size += 1
+            if self.size > self.max_entries:
+                self.evict()
+
+    def evict(self):
+        # Drop the least recently used entries down to 90% of the limit so we
+        # don't evict on every insert once full. Caller holds the lock.
+        target = int(self.max_entries * 0.9)
+        self.conn.execute(
+            "DELETE FROM geocode WHERE key IN (SELECT key FROM geocode ORDER BY last_used LIMIT ?)",
+            (self.size - target,)
+        )
+        logging.info(f"Geocode cache: evicted {self.size - target} least recently used entries.")
+        self.size = target
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': self.size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
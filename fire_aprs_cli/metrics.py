@@ -0,0 +1,222 @@
+# fire_aprs_cli/metrics.py
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Every metric the tool records, as name -> (type, help). Recording an
+# undeclared name raises, so typos don't silently create new series.
+DEFINITIONS = {
+    'fireaprs_runs_total': ('counter', 'Runs of process_fire_data by result'),
+    'fireaprs_tenant_runs_total': ('counter', 'Deliveries to each tenant by result'),
+    'fireaprs_run_seconds': ('histogram', 'Wall time of a whole run'),
+    'fireaprs_last_run_timestamp_seconds': ('gauge', 'Unix time the last run finished'),
+    'fireaprs_stage_seconds': ('histogram', 'Wall time of each pipeline stage'),
+    'fireaprs_external_requests_total': ('counter', 'Calls to external services by outcome'),
+    'fireaprs_external_request_seconds': ('histogram', 'Latency of calls to external services'),
+    'fireaprs_download_bytes_total': ('counter', 'Bytes downloaded from FIRMS'),
+    'fireaprs_rows_parsed_total': ('counter', 'FIRMS rows parsed'),
+    'fireaprs_rows_kept_total': ('counter', 'FIRMS rows inside a monitored region'),
+    'fireaprs_detections_total': ('counter', 'Detections checked against the reported store'),
+    'fireaprs_cross_sensor_duplicates_total': ('counter', 'Detections dropped because a preferred source saw the same fire'),
+    'fireaprs_incidents_total': ('counter', 'Incidents after clustering'),
+    'fireaprs_incidents_skipped_total': ('counter', 'Lowest-priority incidents deferred to a later run by the packet budget'),
+    'fireaprs_circuit_state': ('gauge', 'Circuit breaker state per external service (0 closed, 1 half-open, 2 open)'),
+    'fireaprs_circuit_transitions_total': ('counter', 'Circuit breaker state changes by service and new state'),
+    'fireaprs_circuit_rejected_total': ('counter', 'Calls failed fast because the service circuit was open'),
+    'fireaprs_retries_total': ('counter', 'Retries of external calls by service and result'),
+    'fireaprs_degraded_records_total': ('counter', 'Records sent without an enrichment because its service was unavailable'),
+    'fireaprs_cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'fireaprs_enrich_record_seconds': ('histogram', 'Enrichment time per record'),
+    'fireaprs_aprs_packets_total': ('counter', 'APRS packets by result'),
+    'fireaprs_aprs_comments_shortened_total': ('counter', 'APRS comments cut down to fit the packet length budget, by step'),
+    'fireaprs_aprs_reconnects_total': ('counter', 'APRS-IS reconnects'),
+    'fireaprs_aprs_queue_seconds': ('histogram', 'Time APRS packets spent queued before transmission'),
+    'fireaprs_aprs_queue_depth': ('gauge', 'APRS packets waiting to be sent'),
+}
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+class Metrics:
+    def __init__(self, definitions=DEFINITIONS, buckets=DEFAULT_BUCKETS):
+        self.definitions = definitions
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # name -> {label key: value}; histogram values are
+            # [per-bucket counts, sum, count]
+            self.values = {name: {} for name in self.definitions}
+
+    def kind(self, name, expected):
+        kind = self.definitions[name][0]
+        if kind != expected:
+            raise ValueError(f"Metric '{name}' is a {kind}, not a {expected}")
+
+    def inc(self, name, amount=1, **labels):
+        self.kind(name, 'counter')
+        key = label_key(labels)
+        with self.lock:
+            series = self.values[name]
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self.kind(name, 'gauge')
+        with self.lock:
+            self.values[name][label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        self.kind(name, 'histogram')
+        key = label_key(labels)
+        with self.lock:
+            series = self.values[name]
+            if key not in series:
+                series[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry = series[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def stage(self, stage):
+        return self.timer('fireaprs_stage_seconds', stage=stage)
+
+    # Prometheus text exposition format, version 0.0.4
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in self.definitions.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self.values[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f"{name}{format_labels(key)} {value}")
+                        continue
+                    counts, total, count = value
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        lines.append(f"{name}_bucket{format_labels(key, [('le', bound)])} {bucket_count}")
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{format_labels(key)} {total}")
+                    lines.append(f"{name}_count{format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def get(self, name, **labels):
+        with self.lock:
+            return self.values[name].get(label_key(labels))
+
+    # Plain-dict view for the per-run JSON summary: counters and gauges by
+    # "name{labels}", histograms as count/sum, plus stage times and cache
+    # hit ratios pulled out for quick reading
+    def summary(self):
+        with self.lock:
+            values = {name: dict(series) for name, series in self.values.items()}
+        summary = {'stages': {}, 'cache_hit_ratio': {}, 'counters': {}, 'gauges': {}, 'histograms': {}}
+        for name, series in values.items():
+            kind = self.definitions[name][0]
+            for key, value in sorted(series.items()):
+                series_name = f"{name}{format_labels(key)}"
+                if kind == 'histogram':
+                    summary['histograms'][series_name] = {'count': value[2], 'sum': value[1]}
+                else:
+                    summary[f"{kind}s"][series_name] = value
+
+        for key, value in values['fireaprs_stage_seconds'].items():
+            summary['stages'][dict(key)['stage']] = value[1]
+
+        lookups = {}
+        for key, value in values['fireaprs_cache_requests_total'].items():
+            labels = dict(key)
+            counts = lookups.setdefault(labels['cache'], {'hit': 0, 'miss': 0})
+            counts[labels['result']] = counts.get(labels['result'], 0) + value
+        for cache, counts in lookups.items():
+            total = counts['hit'] + counts['miss']
+            summary['cache_hit_ratio'][cache] = counts['hit'] / total if total else None
+        return summary
+
+# The process-wide registry every module records into
+metrics = Metrics()
+
+class ExternalCall:
+    def __init__(self):
+        self.outcome = 'ok'
+
+    def fail(self):
+        self.outcome = 'error'
+
+    def not_modified(self):
+        self.outcome = 'not_modified'
+
+# Counts and times one call to an external service. Exceptions leaving the
+# block count as errors; the block can also mark the call failed or
+# not-modified itself.
+@contextmanager
+def external_call(service):
+    call = ExternalCall()
+    start = time.monotonic()
+    try:
+        yield call
+    except BaseException:
+        call.fail()
+        raise
+    finally:
+        metrics.observe('fireaprs_external_request_seconds', time.monotonic() - start, service=service)
+        metrics.inc('fireaprs_external_requests_total', service=service, outcome=call.outcome)
+
+# Once the file is over max_bytes, only the newest lines that fit in half of
+# it are kept, so trimming happens every few hundred runs rather than every run
+def trim_summary(path, max_bytes):
+    if not max_bytes or os.path.getsize(path) <= max_bytes:
+        return
+    with open(path, 'rb') as f:
+        f.seek(-(max_bytes // 2), os.SEEK_END)
+        tail = f.read()
+    # Drop the line the cut landed in
+    tail = tail[tail.find(b"\n") + 1:]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(tail)
+    os.replace(tmp_path, path)
+    logging.info(f"Run metrics file {path} trimmed to {len(tail)} bytes.")
+
+def write_summary(path, result, duration, registry=None, max_bytes=0):
+    # One JSON object per run, appended as a line
+    registry = registry or metrics
+    record = {
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'result': result,
+        'duration_seconds': duration,
+    }
+    record.update(registry.summary())
+    try:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+        logging.info(f"Run metrics appended to {path}.")
+        trim_summary(path, max_bytes)
+    except OSError as e:
+        logging.error(f"Could not write run metrics to {path}: {e}")
@@ -1,35 +1,139 @@
 # fire_aprs_cli/news_fetcher.py
 
 import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import feedparser
 
+from fire_aprs_cli.metrics import external_call, metrics
+from fire_aprs_cli.ratelimit import limit
+
+NO_LINK = "No link found"
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
 class NewsFetcher:
-    def __init__(self, rss_url, keyword):
-        self.rss_url = rss_url
-        self.keyword = keyword.lower()
+    def __init__(self, rss_url, keyword, ttl_seconds=900, max_workers=4, limiters=None):
+        # Several feeds can be given whitespace-separated, several keywords
+        # comma-separated; plain single values keep working as before
+        self.rss_urls = rss_url.split() if isinstance(rss_url, str) else list(rss_url)
+        if isinstance(keyword, str):
+            keyword = keyword.split(',')
+        self.keywords = [k.strip().lower() for k in keyword if k.strip()]
+        self.keyword = ', '.join(self.keywords)
+        self.ttl = ttl_seconds
+        self.max_workers = max_workers
+        self.limiters = limiters
+        self.lock = threading.Lock()
 
-    def fetch_feed(self):
+        # Per-feed validators and entries kept between refreshes
+        self.feeds = {url: {'etag': None, 'modified': None, 'entries': [], 'fetched_at': None} for url in self.rss_urls}
+        self.entries = []
+        self.token_index = {}
+        self.keyword_entry = None
+
+    def fetch_feed(self, url):
+        state = self.feeds[url]
         try:
-            feed = feedparser.parse(self.rss_url)
+            with limit(self.limiters, 'rss'), external_call('rss') as call:
+                feed = feedparser.parse(url, etag=state['etag'], modified=state['modified'])
+                if feed.get('status') == 304:
+                    call.not_modified()
+                elif feed.get('status', 200) >= 400 or (feed.bozo and not feed.get('entries')):
+                    call.fail()
+            if feed.get('status') == 304:
+                logging.info(f"RSS feed {url} not modified.")
+                return url, None
             if feed.bozo:
                 logging.warning(f"Encountered issues parsing the RSS feed: {feed.bozo_exception}")
-            return feed
+            return url, feed
         except Exception as e:
             logging.error(f"Failed to fetch or parse RSS feed: {e}")
+            return url, None
+
+    def refresh(self, force=False):
+        # Only feeds older than the TTL are fetched, all of them concurrently
+        now = time.monotonic()
+        with self.lock:
+            stale = [
+                url for url, state in self.feeds.items()
+                if force or state['fetched_at'] is None or now - state['fetched_at'] >= self.ttl
+            ]
+            if len(stale) < len(self.feeds):
+                metrics.inc('fireaprs_cache_requests_total', len(self.feeds) - len(stale), cache='news_feed', result='hit')
+            if not stale:
+                return
+            metrics.inc('fireaprs_cache_requests_total', len(stale), cache='news_feed', result='miss')
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stale))) as executor:
+                results = list(executor.map(self.fetch_feed, stale))
+
+            for url, feed in results:
+                state = self.feeds[url]
+                state['fetched_at'] = now
+                if feed is None:
+                    continue
+                state['etag'] = feed.get('etag')
+                state['modified'] = feed.get('modified')
+                state['entries'] = [
+                    {'title': entry.get('title', ''), 'link': entry.get('link', NO_LINK)}
+                    for entry in feed.get('entries', [])
+                ]
+
+            self.build_index()
+
+    def build_index(self):
+        # Entries in feed order (feeds in configured order) plus an inverted
+        # index from title word to entry positions
+        self.entries = [entry for url in self.rss_urls for entry in self.feeds[url]['entries']]
+        self.token_index = {}
+        for pos, entry in enumerate(self.entries):
+            entry['title_lower'] = entry['title'].lower()
+            for token in set(tokenize(entry['title'])):
+                self.token_index.setdefault(token, []).append(pos)
+        self.keyword_entry = next(
+            (entry for entry in self.entries if any(k in entry['title_lower'] for k in self.keywords)),
+            None
+        )
+        logging.info(f"Indexed {len(self.entries)} news entries from {len(self.rss_urls)} feed(s).")
+
+    def match_place(self, place):
+        # First entry whose title contains every word of the place name and
+        # one of the keywords
+        tokens = tokenize(place)
+        if not tokens:
+            return None
+        matches = set(self.token_index.get(tokens[0], ()))
+        for token in tokens[1:]:
+            matches &= set(self.token_index.get(token, ()))
+        if not matches:
             return None
+        for pos in sorted(matches):
+            if any(k in self.entries[pos]['title_lower'] for k in self.keywords):
+                return self.entries[pos]
+        return None
 
-    def find_news_link(self):
-        feed = self.fetch_feed()
-        if not feed or 'entries' not in feed:
+    def find_news_link(self, place=None):
+        self.refresh()
+        if not self.entries:
             logging.error("No entries found in the RSS feed.")
-            return "No link found"
+            return NO_LINK
+
+        if place:
+            entry = self.match_place(place)
+            if entry:
+                logging.info(f"Place '{place}' found in title: '{entry['title']}'. Link: {entry['link']}")
+                return entry['link']
 
-        for entry in feed.entries:
-            title = entry.get('title', '').lower()
-            if self.keyword in title:
-                newslink = entry.get('link', 'No link found')
-                logging.info(f"Keyword '{self.keyword}' found in title: '{entry.get('title', '')}'. Link: {newslink}")
-                return newslink
+        entry = self.keyword_entry
+        if entry:
+            newslink = entry['link']
+            logging.info(f"Keyword '{self.keyword}' found in title: '{entry['title']}'. Link: {newslink}")
+            return newslink
 
         logging.info(f"Keyword '{self.keyword}' not found in any entry titles.")
-        return "No link found"
+        return NO_LINK
@@ -0,0 +1,109 @@
+# fire_aprs_cli/priority.py
+
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from fire_aprs_cli.clustering import acquisition_minutes
+from fire_aprs_cli.metrics import metrics
+
+# VIIRS reports confidence as low/nominal/high, MODIS as a 0-100 percentage;
+# both map onto 0..1
+VIIRS_CONFIDENCE = {'l': 0.3, 'low': 0.3, 'n': 0.6, 'nominal': 0.6, 'h': 0.9, 'high': 0.9}
+
+def confidence_scores(confidence):
+    text = confidence.astype('string').str.strip().str.lower()
+    scores = text.map(VIIRS_CONFIDENCE).astype(float)
+    percent = pd.to_numeric(text, errors='coerce') / 100
+    return scores.fillna(percent).fillna(0.5).clip(0, 1).to_numpy()
+
+# Severity grows with fire radiative power, the number of pixels in the
+# incident, detection confidence and how far the I4 brightness temperature
+# is above a typical background (~300 K). Each term is about 0..1 for a
+# marginal pixel and a few units for a large fire.
+def severity(df):
+    score = np.zeros(len(df))
+    if 'frp' in df:
+        score += np.log1p(df['frp'].astype(float).fillna(0).clip(lower=0).to_numpy())
+    if 'pixel_count' in df:
+        score += np.log1p(df['pixel_count'].astype(float).fillna(1).to_numpy())
+    if 'confidence' in df:
+        score += confidence_scores(df['confidence'])
+    if 'bright_ti4' in df:
+        score += ((df['bright_ti4'].astype(float).fillna(300).to_numpy() - 300) / 50).clip(0, 2)
+    return score
+
+# Priority = severity, halved for every half_life_hours since acquisition.
+# Missing acquisition times count as "now".
+def priorities(df, half_life_hours=6.0, now=None):
+    minutes = acquisition_minutes(df)
+    if 'acq_date' in df and 'acq_time' in df:
+        now_minutes = (time.time() if now is None else now) / 60
+        age_hours = np.clip(now_minutes - minutes, 0, None) / 60
+    else:
+        age_hours = np.zeros(len(df))
+    return (1 + severity(df)) * 0.5 ** (age_hours / half_life_hours)
+
+# Sorts incidents most important first and adds a 'priority' column
+def rank_incidents(df, half_life_hours=6.0, now=None):
+    if df.empty:
+        return df.assign(priority=pd.Series(dtype=float))
+    df = df.assign(priority=priorities(df, half_life_hours, now))
+    return df.sort_values('priority', ascending=False, kind='stable').reset_index(drop=True)
+
+# Packet budget per run and per rolling hour (0 means no limit). The hour is
+# tracked in the reported store when there is one, so cron runs share it,
+# and otherwise in memory for the life of the process. clock gives the
+# current Unix time, simulated during a replay.
+class PacketBudget:
+    def __init__(self, per_run=0, per_hour=0, store=None, clock=time.time):
+        self.per_run = per_run
+        self.per_hour = per_hour
+        self.store = store
+        self.clock = clock
+        self.sent = deque()
+        self.lock = threading.Lock()
+
+    def sent_last_hour(self):
+        since = self.clock() - 3600
+        if self.store:
+            return self.store.transmissions_since(since)
+        with self.lock:
+            while self.sent and self.sent[0] < since:
+                self.sent.popleft()
+            return len(self.sent)
+
+    # Packets this run may queue, or None when unlimited
+    def allowance(self):
+        limits = []
+        if self.per_run > 0:
+            limits.append(self.per_run)
+        if self.per_hour > 0:
+            limits.append(max(self.per_hour - self.sent_last_hour(), 0))
+        return min(limits) if limits else None
+
+    def spend(self, count):
+        if not count:
+            return
+        if self.store:
+            self.store.record_transmissions(count)
+        else:
+            with self.lock:
+                self.sent.extend([self.clock()] * count)
+
+    # Keeps the incidents the budget allows; df must already be ranked
+    def apply(self, df):
+        allowed = self.allowance()
+        if allowed is None or len(df) <= allowed:
+            return df
+        skipped = len(df) - allowed
+        metrics.inc('fireaprs_incidents_skipped_total', skipped)
+        logging.warning(
+            f"Packet budget allows {allowed} of {len(df)} incidents this run; "
+            f"deferring the {skipped} lowest-priority ones."
+        )
+        return df.head(allowed)
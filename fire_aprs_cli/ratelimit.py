@@ -0,0 +1,65 @@
+# fire_aprs_cli/ratelimit.py
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        # rate is tokens per second; 0 or less disables limiting
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            self.refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    # Seconds until the requested tokens are available (0 if they are now)
+    def wait_time(self, tokens=1):
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            self.refill()
+            return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def acquire(self, tokens=1):
+        while not self.try_acquire(tokens):
+            time.sleep(max(self.wait_time(tokens), 0.001))
+
+class ServiceLimiter:
+    def __init__(self, name, concurrency=1, rate=0, burst=1):
+        self.name = name
+        self.semaphore = threading.BoundedSemaphore(max(concurrency, 1))
+        self.bucket = TokenBucket(rate, burst)
+
+    # Hold a concurrency slot and spend one token for the duration of a call
+    @contextmanager
+    def limit(self):
+        with self.semaphore:
+            self.bucket.acquire()
+            yield
+
+def limit(limiters, service):
+    # Convenience for classes that may or may not have been given limiters
+    limiter = (limiters or {}).get(service)
+    return limiter.limit() if limiter else nullcontext()
+
+def build_limiters(services):
+    return {
+        name: ServiceLimiter(name, settings['concurrency'], settings['rate'], settings['burst'])
+        for name, settings in services.items()
+    }
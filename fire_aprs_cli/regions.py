@@ -0,0 +1,164 @@
+# fire_aprs_cli/regions.py
+
+import logging
+import math
+
+import numpy as np
+
+DEFAULT_REGION = 'default'
+
+class Region:
+    def __init__(self, name, box=None, polygon=None, settings=None):
+        if box is None and not polygon:
+            raise ValueError(f"Region '{name}' needs either a box or a polygon.")
+        self.name = name
+        self.settings = settings or {}
+
+        if polygon:
+            if len(polygon) < 3:
+                raise ValueError(f"Region '{name}' polygon needs at least 3 vertices.")
+            self.polygon = np.asarray(polygon, dtype=float)
+            lats, lons = self.polygon[:, 0], self.polygon[:, 1]
+            self.lat_min, self.lat_max = float(lats.min()), float(lats.max())
+            self.lon_min, self.lon_max = float(lons.min()), float(lons.max())
+        else:
+            self.polygon = None
+            latitude1, latitude2, longitude1, longitude2 = box
+            self.lat_min, self.lat_max = min(latitude1, latitude2), max(latitude1, latitude2)
+            self.lon_min, self.lon_max = min(longitude1, longitude2), max(longitude1, longitude2)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['name'],
+            box=config.get('box'),
+            polygon=config.get('polygon'),
+            settings=config.get('settings'),
+        )
+
+    @classmethod
+    def from_viirs_config(cls, config, name=DEFAULT_REGION):
+        # The legacy single [viirs] box
+        return cls(name, box=(config['latitude1'], config['latitude2'], config['longitude1'], config['longitude2']))
+
+    def contains(self, lat, lon):
+        # Vectorized membership test for arrays of coordinates
+        mask = (lat >= self.lat_min) & (lat <= self.lat_max) & (lon >= self.lon_min) & (lon <= self.lon_max)
+        if self.polygon is None or not mask.any():
+            return mask
+
+        # Even-odd ray casting, vectorized over points and looped over edges
+        inside = np.zeros(len(lat), dtype=bool)
+        vertices = self.polygon
+        for (lat1, lon1), (lat2, lon2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+            if lat1 == lat2:
+                continue
+            crosses = (lat1 > lat) != (lat2 > lat)
+            lon_at_lat = lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+            inside ^= crosses & (lon < lon_at_lat)
+        return mask & inside
+
+# Grid index mapping detections to the regions that contain them. Each cell of
+# a regular lat/lon grid lists the regions whose bounding box overlaps it, so a
+# detection is only tested against the few regions near it and the cost of
+# assign() stays flat as the number of regions grows.
+class RegionIndex:
+    def __init__(self, regions, cell_size=1.0):
+        if not regions:
+            raise ValueError("At least one region is required.")
+        names = [region.name for region in regions]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate region names: {names}")
+
+        self.regions = list(regions)
+        self.by_name = {region.name: region for region in self.regions}
+        self.region_names = np.array(names, dtype=object)
+        self.cell_size = cell_size
+
+        self.lat_min = np.array([r.lat_min for r in self.regions])
+        self.lat_max = np.array([r.lat_max for r in self.regions])
+        self.lon_min = np.array([r.lon_min for r in self.regions])
+        self.lon_max = np.array([r.lon_max for r in self.regions])
+        self.is_polygon = np.array([r.polygon is not None for r in self.regions])
+
+        # Union of every region's box, cheap to test before assignment
+        self.bounds = (
+            float(self.lat_min.min()), float(self.lat_max.max()),
+            float(self.lon_min.min()), float(self.lon_max.max()),
+        )
+
+        cells = {}
+        for idx, region in enumerate(self.regions):
+            for row in range(self.cell_row(region.lat_min), self.cell_row(region.lat_max) + 1):
+                for col in range(self.cell_col(region.lon_min), self.cell_col(region.lon_max) + 1):
+                    cells.setdefault(self.cell_key(row, col), []).append(idx)
+
+        # CSR layout: sorted cell keys, with offsets into a flat candidate array
+        keys = np.array(sorted(cells), dtype=np.int64)
+        self.cell_keys = keys
+        self.cell_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        self.cell_offsets[1:] = np.cumsum([len(cells[k]) for k in keys])
+        self.cell_candidates = np.array([idx for k in keys for idx in cells[k]], dtype=np.int64)
+
+        logging.info(f"Region index built with {len(self.regions)} region(s) over {len(keys)} grid cell(s).")
+
+    def cell_row(self, lat):
+        return int(math.floor((lat + 90.0) / self.cell_size))
+
+    def cell_col(self, lon):
+        return int(math.floor((lon + 180.0) / self.cell_size))
+
+    @staticmethod
+    def cell_key(row, col):
+        return row * 100000 + col
+
+    def bounds_mask(self, lat, lon):
+        lat_min, lat_max, lon_min, lon_max = self.bounds
+        return (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+
+    # Returns (point_idx, region_idx) pairs, one per containing region
+    def assign(self, lat, lon):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        if not len(lat):
+            return empty
+
+        rows = np.floor((lat + 90.0) / self.cell_size).astype(np.int64)
+        cols = np.floor((lon + 180.0) / self.cell_size).astype(np.int64)
+        keys = rows * 100000 + cols
+
+        # Look up each point's cell and its run of candidate regions
+        pos = np.searchsorted(self.cell_keys, keys)
+        pos_clipped = np.minimum(pos, len(self.cell_keys) - 1)
+        hit = self.cell_keys[pos_clipped] == keys
+        starts = np.where(hit, self.cell_offsets[pos_clipped], 0)
+        counts = np.where(hit, self.cell_offsets[pos_clipped + 1] - starts, 0)
+        if not counts.any():
+            return empty
+
+        # Expand to one (point, candidate) pair per row
+        point_idx = np.repeat(np.arange(len(lat)), counts)
+        run_offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        region_idx = self.cell_candidates[np.repeat(starts, counts) + np.arange(len(point_idx)) - run_offsets]
+
+        # Box test for every pair at once
+        plat, plon = lat[point_idx], lon[point_idx]
+        keep = (
+            (plat >= self.lat_min[region_idx]) & (plat <= self.lat_max[region_idx]) &
+            (plon >= self.lon_min[region_idx]) & (plon <= self.lon_max[region_idx])
+        )
+
+        # Polygons refine the pairs that survived their bounding box
+        for idx in np.unique(region_idx[keep & self.is_polygon[region_idx]]):
+            pairs = np.flatnonzero(keep & (region_idx == idx))
+            keep[pairs] = self.regions[idx].contains(plat[pairs], plon[pairs])
+
+        return point_idx[keep], region_idx[keep]
+
+    def names(self, region_idx):
+        return self.region_names[region_idx]
+
+    def settings(self, name):
+        region = self.by_name.get(name)
+        return region.settings if region else {}
@@ -0,0 +1,244 @@
+# fire_aprs_cli/replay.py
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from fire_aprs_cli.metrics import metrics
+from fire_aprs_cli.runtime import Runtime, ingest_regions
+
+# Stands in for the downloader during a replay. The archived CSVs (e.g.
+# several days from the FIRMS archive download) are parsed and filtered to
+# the regions once, with the [viirs] parser. After that, each run gets the
+# detections acquired in the window_hours before the simulated time, like
+# the rolling 24h file at that moment. A run whose window has no new
+# detection counts as unchanged upstream.
+class ReplaySource:
+    def __init__(self, viirs_config, paths, regions=None, window_hours=24):
+        from fire_aprs_cli.clustering import acquisition_minutes
+        from fire_aprs_cli.downloader import VIIRSDownloader
+
+        import pandas as pd
+
+        frames = []
+        self.region_index = None
+        for path in paths:
+            downloader = VIIRSDownloader(
+                dict(viirs_config, filepath=path, columnar_cache=False),
+                regions=regions, region_index=self.region_index,
+            )
+            self.region_index = downloader.region_index
+            with metrics.stage('parse'):
+                frames.append(downloader.process_csv())
+
+        # Archives that overlap in time list the same detections twice
+        detections = pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+        minutes = acquisition_minutes(detections)
+        order = np.argsort(minutes, kind='stable')
+        self.detections = detections.iloc[order].reset_index(drop=True)
+        self.minutes = minutes[order]
+        self.window = window_hours * 60
+        # The simulated time, in minutes since the epoch
+        self.now = self.first_minute()
+        self.last_span = None
+        logging.info(f"Replay loaded {len(self.detections)} detections in the regions from {len(paths)} file(s).")
+
+    # Simulated times, in minutes since the epoch
+    def first_minute(self):
+        return int(self.minutes[0]) if len(self.minutes) else 0
+
+    def last_minute(self):
+        return int(self.minutes[-1]) if len(self.minutes) else 0
+
+    # Same contract as VIIRSDownloader.run
+    def run(self, force=False, reprocess=False):
+        start = np.searchsorted(self.minutes, self.now - self.window, side='right')
+        end = np.searchsorted(self.minutes, self.now, side='right')
+        span = (start, end)
+        if span == self.last_span and not reprocess:
+            return None
+        newest = self.last_span[1] if self.last_span else start
+        self.last_span = span
+        logging.info(f"Replay window: {end - start} detections, {max(end - newest, 0)} acquired since the last run.")
+        return self.detections.iloc[start:end].reset_index(drop=True)
+
+# The replay's persistent runtime. Incident ages, the hourly packet budget
+# and the reported store's retention follow the simulated clock, so a file
+# from months ago ranks and expires as it did at the time.
+class ReplayRuntime(Runtime):
+    def now(self):
+        return self.downloader.now * 60
+
+def minute_label(minute):
+    return datetime.datetime.fromtimestamp(minute * 60, datetime.timezone.utc).strftime('%Y-%m-%d %H:%MZ')
+
+def sink_config(aprs_config, sink, speed):
+    # Pacing is sped up with the clock so the transmit backlog builds up as
+    # it would in real time; --speed 0 turns pacing off
+    config = dict(aprs_config, sink=sink)
+    config['packets_per_minute'] = aprs_config['packets_per_minute'] * speed if speed > 0 else 0
+    return config
+
+# Runs the pipeline once per interval_minutes of simulated time, over the
+# archived detections, at speed x real time (0: every run right after the
+# previous one). APRS packets go to sink, never to APRS-IS, and the reported
+# stores start empty in a scratch directory so the live ones are untouched.
+# Reports what a scheduler at this interval would have seen: throughput,
+# stage latency per run and the transmit backlog over time.
+class Replay:
+    def __init__(self, config, paths, interval_minutes=60, speed=1.0, sink='file:data/replay_aprs.txt',
+                 enable_aqi=True, enable_news=True, report_path=None):
+        self.interval = interval_minutes
+        self.speed = speed
+        self.report_path = report_path
+        self.state_dir = tempfile.mkdtemp(prefix='fireaprs-replay-')
+
+        config = dict(config)
+        config['aprssend'] = sink_config(config['aprssend'], sink, speed)
+        config['state'] = dict(config['state'], path=os.path.join(self.state_dir, 'reported.sqlite'))
+        config['tenants'] = [
+            dict(tenant, aprssend=sink_config(tenant['aprssend'], sink, speed),
+                 state=dict(tenant['state'], path=os.path.join(self.state_dir, f"reported-{tenant['name']}.sqlite")))
+            for tenant in config.get('tenants') or []
+        ]
+        self.config = config
+        self.parameters = {'files': list(paths), 'interval_minutes': interval_minutes, 'speed': speed, 'sink': sink}
+
+        self.source = ReplaySource(config['viirs'], paths, regions=ingest_regions(config))
+        self.runtime = ReplayRuntime(config, enable_aqi=enable_aqi, enable_news=enable_news, persistent=True,
+                                     downloader=self.source)
+        self.runs = []
+
+    def senders(self):
+        return [runtime.aprs_sender for runtime in [self.runtime] + self.runtime.tenants if runtime.aprs_sender]
+
+    def backlog(self):
+        return sum(sender.queue_depth() for sender in self.senders())
+
+    def sent(self):
+        return sum(sender.sent for sender in self.senders())
+
+    def run(self, job_func):
+        first, last = self.source.first_minute(), self.source.last_minute()
+        if not len(self.source.detections):
+            logging.warning("Replay has no detections in the configured regions.")
+        start_wall = time.monotonic()
+        now = first
+        try:
+            while now <= last + self.interval:
+                # Real-time pacing: the run for simulated time now is due
+                # (now - first) / speed after the start
+                due = start_wall + (now - first) * 60 / self.speed if self.speed > 0 else time.monotonic()
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.run_at(job_func, now, due)
+                now += self.interval
+            # What is still queued goes out at the sped-up pace
+            backlog = self.backlog()
+            drain_start = time.monotonic()
+            for sender in self.senders():
+                sender.flush(sender.flush_timeout)
+            drain_seconds = time.monotonic() - drain_start
+            stats = [sender.stats() for sender in self.senders()]
+        finally:
+            self.runtime.close()
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+        report = self.report(time.monotonic() - start_wall, backlog, drain_seconds, stats)
+        if self.report_path:
+            with open(self.report_path, 'w') as f:
+                json.dump({'parameters': self.parameters, 'runs': self.runs, 'summary': report}, f, indent=2)
+            logging.info(f"Replay report written to {self.report_path}.")
+        return report
+
+    def run_at(self, job_func, now, due):
+        self.source.now = now
+        stages_before = dict(metrics.summary()['stages'])
+        sent_before = self.sent()
+        backlog_before = self.backlog()
+        start = time.monotonic()
+        try:
+            result = job_func(self.config, enable_aqi=self.runtime.enable_aqi, enable_news=self.runtime.enable_news,
+                              runtime=self.runtime)
+        except Exception as e:
+            # Like the daemon, carry on with the next run
+            logging.error(f"Error during replayed run at {minute_label(now)}: {e}")
+            result = 'error'
+        seconds = time.monotonic() - start
+        stages = {
+            stage: total - stages_before.get(stage, 0.0)
+            for stage, total in metrics.summary()['stages'].items()
+            if total - stages_before.get(stage, 0.0) > 0
+        }
+        window = self.source.last_span
+        run = {
+            'simulated_time': minute_label(now),
+            'window_detections': int(window[1] - window[0]) if window else 0,
+            'result': result,
+            'seconds': seconds,
+            # Started after its slot, i.e. the previous run overran the interval
+            'late_seconds': max(start - due, 0.0),
+            'stages': stages,
+            'sent_since_last_run': self.sent() - sent_before,
+            'backlog_before': backlog_before,
+            'backlog_after': self.backlog(),
+        }
+        self.runs.append(run)
+        logging.info(
+            f"Replayed {run['simulated_time']}  {run['window_detections']:>7} detections  {result:<12} "
+            f"{seconds:7.2f}s  sent {run['sent_since_last_run']:>5}  backlog {run['backlog_after']:>5}"
+            + (f"  late {run['late_seconds']:.1f}s" if run['late_seconds'] > 0.5 else '')
+        )
+
+    def report(self, wall_seconds, backlog, drain_seconds, stats):
+        sent = sum(entry['sent'] for entry in stats)
+        stage_times = {}
+        for run in self.runs:
+            for stage, seconds in run['stages'].items():
+                stage_times.setdefault(stage, []).append(seconds)
+        # Wall seconds of transmit queueing, and what they stand for in
+        # simulated time
+        latency_max = max((entry['latency_max'] for entry in stats), default=0.0)
+        latency_avg = sum(entry['latency_avg'] * entry['sent'] for entry in stats) / sent if sent else 0.0
+        scale = self.speed if self.speed > 0 else 1
+        report = {
+            'runs': len(self.runs),
+            'wall_seconds': wall_seconds,
+            'simulated_hours': len(self.runs) * self.interval / 60,
+            'detections': len(self.source.detections),
+            'packets_sent': sent,
+            'packets_per_wall_second': sent / wall_seconds if wall_seconds else None,
+            'late_runs': sum(run['late_seconds'] > 0.5 for run in self.runs),
+            'max_backlog': max((run['backlog_after'] for run in self.runs), default=0),
+            'backlog_at_end': backlog,
+            'drain_seconds': drain_seconds,
+            'queue_latency_avg_simulated_seconds': latency_avg * scale,
+            'queue_latency_max_simulated_seconds': latency_max * scale,
+            'stages': {
+                stage: {'mean_seconds': sum(times) / len(times), 'max_seconds': max(times), 'runs': len(times)}
+                for stage, times in stage_times.items()
+            },
+        }
+        return report
+
+    def summary_lines(self, report):
+        # The report of run() as text, for the command line to print
+        lines = [
+            f"Replayed {report['simulated_hours']:.1f} simulated hours in {report['wall_seconds']:.1f}s "
+            f"({report['runs']} runs every {self.interval} min at {self.speed:g}x): "
+            f"{report['packets_sent']} packets, {report['packets_per_wall_second'] or 0:.1f} packets/s.",
+            f"Backlog: max {report['max_backlog']} after a run, {report['backlog_at_end']} at the end "
+            f"({report['drain_seconds']:.1f}s to drain); "
+            f"queue latency avg {report['queue_latency_avg_simulated_seconds']:.0f}s / "
+            f"max {report['queue_latency_max_simulated_seconds']:.0f}s simulated; {report['late_runs']} late run(s).",
+            f"  {'stage':<20}{'mean (s)':>10}{'max (s)':>10}{'runs':>6}",
+        ]
+        for stage, entry in report['stages'].items():
+            lines.append(f"  {stage:<20}{entry['mean_seconds']:>10.3f}{entry['max_seconds']:>10.3f}{entry['runs']:>6}")
+        return lines
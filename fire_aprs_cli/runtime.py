@@ -0,0 +1,274 @@
+# fire_aprs_cli/runtime.py
+
+import logging
+import threading
+import time
+
+import requests
+
+from fire_aprs_cli.breaker import RetryBudget, build_guards
+from fire_aprs_cli.downloader import VIIRSDownloader
+from fire_aprs_cli.ratelimit import build_limiters
+
+# The [region:*] sections to ingest: all of them, or with tenants only the
+# ones some tenant reports on
+def ingest_regions(config):
+    regions = config.get('regions')
+    if config.get('tenants'):
+        used = {name for tenant in config['tenants'] for name in tenant['regions']}
+        regions = [region for region in regions if region['name'] in used]
+    return regions
+
+def news_feed_key(config, settings):
+    return (
+        settings.get('link', config['newsfeed']['link']),
+        settings.get('keyword', config['newsfeed']['keyword']),
+    )
+
+# Everything a run needs that is worth keeping between runs: HTTP sessions,
+# the AQI and news clients with their caches, the reported-detection store
+# and the APRS-IS connection. A single run builds one and closes it at the
+# end; the daemon keeps one warm until shutdown or a config reload.
+#
+# Apart from the downloader, every component is built (and its module, with
+# heavy dependencies such as pandas, geopy, feedparser or aprslib, imported)
+# on first use, so a cron run that finds nothing new never loads them.
+#
+# With [tenant:*] sections the runtime also holds one TenantRuntime per
+# tenant. The tenants share its downloader, limiters, circuit breakers, HTTP
+# pools and AQI, geocode and news caches.
+class Runtime:
+    def __init__(self, config, enable_aqi=True, enable_news=True, persistent=False, downloader=None):
+        self.config = config
+        self.enable_aqi = enable_aqi
+        self.enable_news = enable_news
+        self.persistent = persistent
+
+        # One limiter per external service, shared by all pipeline workers.
+        # The circuit breakers live as long as the runtime, so in daemon mode
+        # an open circuit stays open across runs until its probe succeeds;
+        # the retry budget starts over every run.
+        self.limiters = build_limiters(config['pipeline']['services'])
+        self.retry_budget = RetryBudget(config['pipeline']['retry']['budget_seconds'])
+        self.guards = build_guards(config['pipeline']['services'], config['pipeline']['retry'], self.retry_budget)
+
+        # Anything with the downloader's run() and region_index can stand in
+        # for it, e.g. a replay of archived files
+        regions = ingest_regions(config)
+        self.session = requests.Session()
+        if downloader is not None:
+            self.downloader = downloader
+        elif config.get('sources'):
+            from fire_aprs_cli.sources import MultiSourceDownloader
+
+            self.downloader = MultiSourceDownloader(
+                config['viirs'], config['sources'], regions=regions, session=self.session,
+            )
+        else:
+            self.downloader = VIIRSDownloader(config['viirs'], regions=regions, session=self.session)
+
+        self.reported_store = None
+        self.aprs_sender = None
+        self.packet_budget = None
+        # Shared by the tenants, which build them from their own threads
+        self.lock = threading.RLock()
+        self.geocode_cache = None
+        self.aqi_fetchers = {}
+        self.stations_loaded = {}
+        self.news_fetchers = {}
+        self.tenants = [TenantRuntime(self, tenant) for tenant in config.get('tenants') or []]
+        if not enable_aqi:
+            logging.info("AQI fetching is disabled.")
+        if not enable_news:
+            logging.info("News fetching is disabled.")
+
+    def store(self):
+        if self.reported_store is None and self.config['state']['path']:
+            from fire_aprs_cli.state_store import ReportedStore
+
+            self.reported_store = ReportedStore(
+                self.config['state']['path'],
+                retention_hours=self.config['state']['retention_hours'],
+                precision=self.config['state']['precision'],
+                clock=self.now,
+            )
+        return self.reported_store
+
+    def aqi(self):
+        return self.aqi_client(self.config['aqi']) if self.enable_aqi else None
+
+    # One AQIFetcher per WAQI token, all sharing one geocode cache
+    def aqi_client(self, aqi_config):
+        key = (aqi_config['authtoken'], aqi_config['api_url'])
+        with self.lock:
+            if key not in self.aqi_fetchers:
+                from fire_aprs_cli.aqi_fetcher import AQIFetcher
+
+                config = self.config
+                if self.geocode_cache is None and config['geocode']['cache_path']:
+                    from fire_aprs_cli.geocode_cache import GeocodeCache
+
+                    self.geocode_cache = GeocodeCache(
+                        config['geocode']['cache_path'],
+                        precision=config['geocode']['precision'],
+                        ttl_days=config['geocode']['ttl_days'],
+                        max_entries=config['geocode']['max_entries'],
+                    )
+                self.aqi_fetchers[key] = AQIFetcher(
+                    aqi_config['authtoken'],
+                    geocode_cache=self.geocode_cache,
+                    max_station_km=aqi_config['max_station_km'],
+                    limiters=self.limiters,
+                    guards=self.guards,
+                    pool_size=config['pipeline']['workers'],
+                    api_url=aqi_config['api_url'],
+                    nominatim_url=config['geocode']['nominatim_url'],
+                    session=next(iter(self.aqi_fetchers.values())).session if self.aqi_fetchers else None,
+                )
+            return self.aqi_fetchers[key]
+
+    # Batch mode's station query, made once per run and AQI fetcher however
+    # many tenants use it. Returns whether the stations are loaded.
+    def load_stations(self, aqi_fetcher):
+        with self.lock:
+            if id(aqi_fetcher) not in self.stations_loaded:
+                self.stations_loaded[id(aqi_fetcher)] = aqi_fetcher.load_stations(self.downloader.region_index.bounds)
+            return self.stations_loaded[id(aqi_fetcher)]
+
+    def news(self):
+        if not self.enable_news:
+            return None
+        return self.news_clients(self.config, self.downloader.region_index.regions)
+
+    # One News Fetcher per (link, keyword) pair in use, since regions may
+    # point at different feeds. Each one downloads its feeds at most once
+    # per TTL and answers every record from memory.
+    def news_clients(self, config, regions):
+        from fire_aprs_cli.news_fetcher import NewsFetcher
+
+        with self.lock:
+            for region in regions:
+                feed_key = news_feed_key(config, region.settings)
+                if feed_key not in self.news_fetchers:
+                    self.news_fetchers[feed_key] = NewsFetcher(
+                        *feed_key,
+                        ttl_seconds=config['newsfeed']['ttl_minutes'] * 60,
+                        limiters=self.limiters,
+                    )
+            return self.news_fetchers
+
+    # Kept for the life of the runtime, so the daemon's hourly budget spans
+    # runs even without a reported store
+    def budget(self):
+        if self.packet_budget is None:
+            from fire_aprs_cli.priority import PacketBudget
+
+            self.packet_budget = PacketBudget(
+                per_run=self.config['priority']['max_packets_per_run'],
+                per_hour=self.config['priority']['max_packets_per_hour'],
+                store=self.store(),
+                clock=self.now,
+            )
+        return self.packet_budget
+
+    # Unix time the run's ranking, packet budget and reported store go by;
+    # a replay moves it along its simulated clock
+    def now(self):
+        return time.time()
+
+    def sender(self):
+        # Logged in on first use, so runs with nothing to send never connect.
+        # A failed login is retried by the next run.
+        if self.aprs_sender is None:
+            from fire_aprs_cli.aprs_sender import APRSSender
+
+            self.aprs_sender = APRSSender(self.config['aprssend'])
+        return self.aprs_sender
+
+    def log_cache_stats(self):
+        if self.geocode_cache:
+            stats = self.geocode_cache.stats()
+            logging.info(
+                f"Geocode cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_ratio']:.0%} of lookups served without calling Nominatim), {stats['entries']} entries."
+            )
+
+    def start_run(self):
+        self.retry_budget.reset()
+        self.stations_loaded = {}
+        for runtime in [self] + self.tenants:
+            if runtime.aprs_sender:
+                runtime.aprs_sender.start_run()
+
+    # Called at the end of every run. A persistent runtime leaves the APRS
+    # transmit queue draining in the background and keeps everything open.
+    def finish_run(self):
+        self.log_cache_stats()
+        if not self.persistent:
+            self.close()
+            return
+        for runtime in [self] + self.tenants:
+            if runtime.aprs_sender:
+                logging.info(
+                    f"APRS connection of {runtime.config['aprssend']['callsign']} kept open "
+                    f"({runtime.aprs_sender.queue_depth()} message(s) still queued)."
+                )
+
+    def close(self):
+        for tenant in self.tenants:
+            tenant.close_own()
+        self.close_own()
+        if self.aqi_fetchers:
+            next(iter(self.aqi_fetchers.values())).session.close()
+        self.aqi_fetchers = {}
+        if self.geocode_cache:
+            self.geocode_cache.close()
+            self.geocode_cache = None
+        self.news_fetchers = {}
+        self.session.close()
+
+    # The APRS connection, reported store and budget
+    def close_own(self):
+        # Disconnect APRS once everything queued has been transmitted
+        if self.aprs_sender:
+            self.aprs_sender.disconnect()
+            self.aprs_sender = None
+        if self.reported_store:
+            self.reported_store.close()
+            self.reported_store = None
+        self.packet_budget = None
+
+# One tenant of a shared Runtime: its own callsign's APRS-IS connection and
+# rate limit, reported store and packet budget, and the regions, AQI token
+# and news feeds of its config. The rest comes from the shared runtime.
+class TenantRuntime(Runtime):
+    def __init__(self, shared, tenant):
+        self.shared = shared
+        self.name = tenant['name']
+        self.regions = tenant['regions']
+        self.config = dict(shared.config, **{
+            key: tenant[key] for key in ('aprssend', 'aqi', 'newsfeed', 'priority', 'state')
+        })
+        self.enable_aqi = shared.enable_aqi
+        self.enable_news = shared.enable_news
+        self.persistent = shared.persistent
+        self.downloader = shared.downloader
+        self.tenants = []
+        self.reported_store = None
+        self.aprs_sender = None
+        self.packet_budget = None
+
+    def now(self):
+        return self.shared.now()
+
+    def aqi(self):
+        return self.shared.aqi_client(self.config['aqi']) if self.enable_aqi else None
+
+    def load_stations(self, aqi_fetcher):
+        return self.shared.load_stations(aqi_fetcher)
+
+    def news(self):
+        if not self.enable_news:
+            return None
+        region_index = self.downloader.region_index
+        return self.shared.news_clients(self.config, [region_index.by_name[name] for name in self.regions])
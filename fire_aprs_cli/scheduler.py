@@ -4,7 +4,7 @@ import logging
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 import signal
-import sys
+import threading
 
 class Scheduler:
     def __init__(self, interval_minutes, job_func, *args, **kwargs):
@@ -13,15 +13,16 @@ class Scheduler:
         self.job_func = job_func
         self.args = args
         self.kwargs = kwargs
+        self.stop_event = threading.Event()
 
     def start(self):
         trigger = IntervalTrigger(minutes=self.interval)
+        # First run one interval from now; the caller has just run the job
         self.scheduler.add_job(
             self.job_func,
             trigger,
             args=self.args,
             kwargs=self.kwargs,
-            next_run_time=None,
             max_instances=1,
             coalesce=True,
             name="process_fire_data"
@@ -29,12 +30,24 @@ class Scheduler:
         self.scheduler.start()
         logging.info(f"Scheduler started with interval: {self.interval} minutes.")
 
-        # Handle graceful shutdown
-        signal.signal(signal.SIGINT, self.shutdown)
-        signal.signal(signal.SIGTERM, self.shutdown)
+        # Handle graceful shutdown. The handlers only flag the request; the
+        # main thread does the actual shutdown once it wakes up.
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
 
-    def shutdown(self, signum, frame):
+    def request_stop(self, signum=None, frame=None):
+        logging.info("Shutdown requested.")
+        self.stop_event.set()
+
+    # Blocks the calling thread until a shutdown is requested, calling
+    # on_tick (if given) about once a second in between
+    def wait(self, on_tick=None):
+        while not self.stop_event.wait(timeout=1):
+            if on_tick:
+                on_tick()
+
+    def shutdown(self):
         logging.info("Shutting down scheduler...")
-        self.scheduler.shutdown()
+        # Lets a run in progress finish first
+        self.scheduler.shutdown(wait=True)
         logging.info("Scheduler shut down successfully.")
-        sys.exit(0)
@@ -0,0 +1,154 @@
+# fire_aprs_cli/sources.py
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fire_aprs_cli.downloader import VIIRSDownloader
+from fire_aprs_cli.metrics import metrics
+
+# Drops detections of a fire that a preferred source already saw: a
+# detection goes when a source listed earlier has one within radius_km and
+# time_window_minutes of it. Detections of the same source never drop each
+# other, and neither do detections in different regions. Expects the
+# 'source_rank' column added by MultiSourceDownloader.
+def dedup_cross_sensor(df, radius_km=1.0, time_window_minutes=60):
+    from fire_aprs_cli.clustering import acquisition_minutes, neighbour_pairs
+
+    if df.empty or df['source_rank'].nunique() < 2:
+        return df
+    df = df.reset_index(drop=True)
+    minutes = acquisition_minutes(df)
+    a, b = neighbour_pairs(df, radius_km, time_window_minutes, minutes)
+
+    rank = df['source_rank'].to_numpy()
+    cross = rank[a] != rank[b]
+    a, b = a[cross], b[cross]
+    # Of each pair, the detection from the later-listed source is dropped
+    dropped = np.unique(np.where(rank[a] > rank[b], a, b))
+    metrics.inc('fireaprs_cross_sensor_duplicates_total', len(dropped))
+    logging.info(
+        f"Cross-sensor dedup dropped {len(dropped)} of {len(df)} detections "
+        f"(radius {radius_km} km, window {time_window_minutes} min)."
+    )
+    keep = np.ones(len(df), dtype=bool)
+    keep[dropped] = False
+    return df[keep].reset_index(drop=True)
+
+# Downloads and filters several FIRMS feeds (e.g. Suomi NPP, NOAA-20 and
+# NOAA-21 VIIRS, MODIS) at once and merges them into one frame with the same
+# columns a single VIIRSDownloader returns, plus 'source' and 'sensor'. Each
+# source keeps its own cached file and validators, so an unchanged feed
+# costs a 304; the run is skipped only when every feed is unchanged.
+class MultiSourceDownloader:
+    def __init__(self, config, sources, regions=None, session=None):
+        self.sources = sources
+        self.radius_km = config.get('cross_sensor_radius_km', 1.0)
+        self.time_window_minutes = config.get('cross_sensor_window_minutes', 60)
+
+        # Every source shares the [viirs] parsing options, the HTTP session
+        # and one region index
+        self.downloaders = []
+        for source in sources:
+            source_config = dict(config, url=source['url'], filepath=source['filepath'])
+            if source.get('product'):
+                source_config['product'] = source['product']
+            if self.downloaders:
+                first = self.downloaders[0]
+                downloader = VIIRSDownloader(source_config, session=first.session, region_index=first.region_index)
+            else:
+                downloader = VIIRSDownloader(source_config, regions=regions, session=session)
+            self.downloaders.append(downloader)
+        self.session = self.downloaders[0].session
+        self.region_index = self.downloaders[0].region_index
+
+    def map(self, func, indexes):
+        # One thread per source. Downloads and file reads release the GIL, so
+        # the network transfers overlap and ingest waits about as long as the
+        # slowest feed. Parsing does not: re holds the GIL while matching and
+        # pandas for most of read_csv, so the sources' parses largely take
+        # turns, each starting as soon as its own download is done. Returns
+        # {index: (result, exception)}.
+        def timed(index):
+            start = time.monotonic()
+            try:
+                return func(self.downloaders[index]), None
+            except Exception as e:
+                return None, e
+            finally:
+                logging.info(f"Source '{self.sources[index]['name']}': {func.__name__} took {time.monotonic() - start:.2f}s.")
+
+        if not indexes:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(indexes), thread_name_prefix="source") as executor:
+            return dict(zip(indexes, executor.map(timed, indexes)))
+
+    def normalize(self, df, rank):
+        # Feeds without a satellite column are labelled with the source name
+        source = self.sources[rank]
+        df = df.assign(source=source['name'], sensor=source['sensor'], source_rank=rank)
+        if 'satellite' not in df:
+            df['satellite'] = source['name']
+        else:
+            df['satellite'] = df['satellite'].fillna(source['name'])
+        return df
+
+    # Same contract as VIIRSDownloader.run: the merged detections, or None
+    # when no source has new data (unless reprocess is set)
+    def run(self, force=False, reprocess=False):
+        logging.info(f"FIRMS ingest started for {len(self.sources)} sources.")
+        if force:
+            for downloader in self.downloaders:
+                downloader.remove_existing_file()
+
+        # A source with a new file is parsed right after its download, while
+        # slower sources are still transferring; the parses themselves mostly
+        # run one at a time
+        def fetch(downloader):
+            downloaded = downloader.download()
+            return downloaded, downloader.process_csv() if downloaded or reprocess else None
+
+        everything = list(range(len(self.sources)))
+        with metrics.stage('ingest'):
+            fetched = self.map(fetch, everything)
+            failed = [index for index in everything if fetched[index][1]]
+            for index in failed:
+                logging.error(f"Source '{self.sources[index]['name']}' failed: {fetched[index][1]}")
+            if len(failed) == len(everything):
+                raise fetched[0][1]
+            if not any(fetched[index][0][0] for index in everything if index not in failed) and not reprocess:
+                logging.info("FIRMS ingest finished: no new data from any source.")
+                return None
+
+            # Something changed, so unchanged sources are parsed from their
+            # cached files too, and a source that failed to download this time
+            # still contributes its last good file
+            frames = {index: result[0][1] for index, result in fetched.items() if index not in failed}
+            rest = [index for index in everything if frames.get(index) is None]
+            errors = [fetched[index][1] for index in failed]
+            for index, (df, error) in self.map(self.parse, rest).items():
+                if error:
+                    errors.append(error)
+                    logging.warning(f"Source '{self.sources[index]['name']}' skipped: {error}")
+                frames[index] = df
+            # Reporting "no fires" is only right if some source was readable
+            if all(df is None for df in frames.values()):
+                raise errors[0]
+
+        frames = [self.normalize(df, index) for index, df in sorted(frames.items()) if df is not None and len(df)]
+        if not frames:
+            return self.normalize(self.downloaders[0].empty_frame(), 0).drop(columns='source_rank')
+
+        import pandas as pd
+
+        merged = pd.concat(frames, ignore_index=True)
+        with metrics.stage('cross_sensor_dedup'):
+            merged = dedup_cross_sensor(merged, self.radius_km, self.time_window_minutes)
+        logging.info(f"FIRMS ingest finished: {len(merged)} detections from {len(frames)} sources.")
+        return merged.drop(columns='source_rank')
+
+    @staticmethod
+    def parse(downloader):
+        return downloader.process_csv()
@@ -0,0 +1,136 @@
+# fire_aprs_cli/state_store.py
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from fire_aprs_cli.metrics import metrics
+
+# Columns that identify a detection; missing ones simply don't take part
+KEY_COLUMNS = ['region', 'acq_date', 'acq_time', 'satellite']
+
+def detection_keys(df, precision=3):
+    # One string key per row: region|acq_date|acq_time|satellite|lat|lon, with
+    # coordinates quantized to integer units of 10**-precision degrees so the
+    # same pixel maps to the same key across runs
+    parts = [df[column].astype(str) if column in df else pd.Series('', index=df.index) for column in KEY_COLUMNS]
+    scale = 10 ** precision
+    parts.append((df['latitude'] * scale).round().astype('int64').astype(str))
+    parts.append((df['longitude'] * scale).round().astype('int64').astype(str))
+    keys = parts[0]
+    for part in parts[1:]:
+        keys = keys + '|' + part
+    return keys
+
+# Detections are marked reported once the packet carrying them has been
+# transmitted. Until then their keys are held as pending, so a later run of
+# a long-lived process doesn't queue them again, and a packet that is
+# dropped or never sent releases them for the next run to retry.
+#
+# clock gives the current Unix time for retention and the hourly budget; a
+# replay passes its simulated clock.
+class ReportedStore:
+    def __init__(self, path, retention_hours=48, precision=3, clock=time.time):
+        self.path = path
+        self.retention = retention_hours * 3600
+        self.precision = precision
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.pending = set()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS reported ("
+            " key TEXT PRIMARY KEY,"
+            " reported_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS reported_at_idx ON reported (reported_at)")
+        # One row per queued packet, for the hourly packet budget
+        self.conn.execute("CREATE TABLE IF NOT EXISTS transmissions (sent_at REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sent_at_idx ON transmissions (sent_at)")
+        self.expire()
+
+    def expire(self):
+        now = self.clock()
+        with self.lock, self.conn:
+            cursor = self.conn.execute("DELETE FROM reported WHERE reported_at < ?", (now - self.retention,))
+            self.conn.execute("DELETE FROM transmissions WHERE sent_at < ?", (now - 3600,))
+        if cursor.rowcount:
+            logging.info(f"Reported-detection store: expired {cursor.rowcount} entries.")
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM reported").fetchone()[0]
+
+    # Boolean mask over keys: True where the key was reported before. Keys are
+    # bulk-loaded into a temporary table and joined against the primary key
+    # index, so this stays fast with hundreds of thousands of stored keys.
+    def seen(self, keys):
+        keys = list(keys)
+        if not keys:
+            return []
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (key TEXT PRIMARY KEY) WITHOUT ROWID")
+            self.conn.execute("DELETE FROM lookup")
+            # Sorted inserts keep B-tree page splits down
+            self.conn.executemany("INSERT OR IGNORE INTO lookup (key) VALUES (?)", ((k,) for k in sorted(keys)))
+            found = {row[0] for row in self.conn.execute("SELECT lookup.key FROM lookup JOIN reported USING (key)")}
+            self.conn.execute("DELETE FROM lookup")
+        return [k in found for k in keys]
+
+    def mark(self, keys):
+        now = self.clock()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO reported (key, reported_at) VALUES (?, ?)",
+                ((k, now) for k in sorted(keys))
+            )
+
+    def hold(self, keys):
+        with self.lock:
+            self.pending.update(keys)
+
+    # Called once the packet for keys is sent, or dropped (sent=False)
+    def release(self, keys, sent):
+        with self.lock:
+            self.pending.difference_update(keys)
+        if sent:
+            self.mark(keys)
+
+    def record_transmissions(self, count):
+        now = self.clock()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO transmissions (sent_at) VALUES (?)", [(now,)] * count)
+
+    def transmissions_since(self, since):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM transmissions WHERE sent_at >= ?", (since,)).fetchone()[0]
+
+    # Splits detections into the ones not reported before, plus their keys
+    def filter_new(self, df):
+        if df.empty:
+            return df, []
+        keys = detection_keys(df, self.precision)
+        seen = self.seen(keys)
+        with self.lock:
+            queued = [k in self.pending for k in keys]
+        new_mask = [not s and not q for s, q in zip(seen, queued)]
+        new = df[new_mask]
+        metrics.inc('fireaprs_detections_total', len(new), status='new')
+        metrics.inc('fireaprs_detections_total', sum(seen), status='already_reported')
+        metrics.inc('fireaprs_detections_total', len(df) - len(new) - sum(seen), status='queued')
+        logging.info(f"{len(new)} of {len(df)} detections are new since the last run.")
+        return new, list(keys[new_mask])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
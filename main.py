@@ -2,15 +2,17 @@
 
 import logging
 import argparse
+import functools
+import math
 import sys
 import time
 
+# Only lightweight modules at the top: pandas, geopy, feedparser, aprslib
+# and apscheduler are imported by the subsystems that need them, when they
+# are first used, so cron runs with nothing to do start fast
 from fire_aprs_cli.config import Config
-from fire_aprs_cli.downloader import VIIRSDownloader
-from fire_aprs_cli.aqi_fetcher import AQIFetcher
-from fire_aprs_cli.news_fetcher import NewsFetcher
-from fire_aprs_cli.aprs_sender import APRSSender
-from fire_aprs_cli.scheduler import Scheduler
+from fire_aprs_cli.metrics import metrics, write_summary
+from fire_aprs_cli.pipeline import EnrichmentPipeline
 
 def setup_logging(logging_config):
     level = getattr(logging, logging_config['level'].upper(), logging.INFO)
@@ -24,95 +26,271 @@ def setup_logging(logging_config):
     )
     logging.info("Logging is set up.")
 
-def process_fire_data(config, enable_aqi=True, enable_news=True):
-    logging.info("Starting fire data processing...")
+# Runs on a pipeline worker thread. Returns (idx, region, latitude, longitude,
+# aprs_message), or None when the record has to be skipped.
+def enrich_record(idx, message, config, region_index, aqi_fetcher, news_fetchers):
+    # Already loaded by the runtime once records are being enriched; kept out
+    # of the module imports so --help and unchanged runs skip numpy
+    from fire_aprs_cli.regions import DEFAULT_REGION
+    from fire_aprs_cli.runtime import news_feed_key
+
+    latitude = message.get('latitude')
+    longitude = message.get('longitude')
+
+    if latitude is None or longitude is None:
+        logging.warning(f"Record {idx}: Missing latitude or longitude. Skipping.")
+        return None
 
-    # Initialize Downloader
-    downloader = VIIRSDownloader(config['viirs'])
-    downloader.run()
-    logging.info("Data downloaded and processed.")
+    # Region settings can switch enrichment off, but not back on when it
+    # was disabled on the command line
+    region = message.get('region', DEFAULT_REGION)
+    settings = region_index.settings(region)
 
-    # Initialize AQI Fetcher if enabled
-    if enable_aqi:
-        aqi_fetcher = AQIFetcher(config['aqi']['authtoken'])
+    # Fetch AQI Temperature if enabled. While WAQI's circuit is open the
+    # alert goes out without it instead of waiting on the lookup.
+    if aqi_fetcher and settings.get('aqi', True) and not aqi_fetcher.available():
+        metrics.inc('fireaprs_degraded_records_total', enrichment='aqi')
+        aqi_temp = None
+    elif aqi_fetcher and settings.get('aqi', True):
+        aqi_temp = aqi_fetcher.get_aqi_temperature(latitude, longitude)
+        if aqi_temp is None:
+            aqi_temp = "N/A"
+            logging.warning(f"Record {idx}: AQI temperature not available.")
     else:
-        aqi_fetcher = None
-        logging.info("AQI fetching is disabled.")
+        aqi_temp = None  # AQI data not included
 
-    # Initialize News Fetcher if enabled
-    if enable_news:
-        news_fetcher = NewsFetcher(config['newsfeed']['link'], config['newsfeed']['keyword'])
+    # Fetch News Link if enabled
+    if news_fetchers is not None and settings.get('news', True):
+        # Named regions double as place names to look for in headlines
+        place = region if region != DEFAULT_REGION else None
+        news_link = news_fetchers[news_feed_key(config, settings)].find_news_link(place=place)
+        if news_link == "No link found":
+            logging.warning(f"Record {idx}: No news link found.")
     else:
-        news_fetcher = None
-        logging.info("News fetching is disabled.")
+        news_link = None  # News data not included
+
+    # Compose APRS Message
+    aprs_message_parts = []
+    if settings.get('comment'):
+        aprs_message_parts.append(settings['comment'])
+    if message.get('pixel_count'):
+        incident = f"{message['pixel_count']} px"
+        if message.get('frp') is not None and not math.isnan(message['frp']):
+            incident += f" FRP {message['frp']:.0f}MW"
+        aprs_message_parts.append(incident)
+    if aqi_temp is not None:
+        aprs_message_parts.append(f"AQI Temp: {aqi_temp}°C")
+    if news_link is not None:
+        aprs_message_parts.append(f"News: {news_link}")
+
+    # If no AQI and news data, provide minimal info
+    if not aprs_message_parts:
+        aprs_message_parts.append("Fire detected")
 
-    # Initialize APRS Sender
-    aprs_sender = APRSSender(config['aprssend'])
+    return idx, region, latitude, longitude, ", ".join(aprs_message_parts)
 
-    # Load VIIRS JSON data
+# Returns how the run ended, as run_once() does
+def process_fire_data(config, enable_aqi=True, enable_news=True, force_download=False, reprocess=False, runtime=None):
+    logging.info("Starting fire data processing...")
+
+    # Without a long-lived runtime (daemon mode) everything is built for this
+    # run only and closed again at the end
+    if runtime is None:
+        from fire_aprs_cli.runtime import Runtime
+
+        runtime = Runtime(config, enable_aqi=enable_aqi, enable_news=enable_news)
+    start = time.monotonic()
+    result = 'error'
+    runtime.start_run()
     try:
-        import json
-        with open('viirs.json', 'r') as f:
-            fire_data = json.load(f)
-        logging.info(f"Loaded viirs.json with {len(fire_data)} records.")
-    except Exception as e:
-        logging.error(f"Failed to load 'viirs.json': {e}")
-        aprs_sender.disconnect()
-        return
+        result = run_once(config, runtime, force_download=force_download, reprocess=reprocess)
+    finally:
+        runtime.finish_run()
+        duration = time.monotonic() - start
+        metrics.observe('fireaprs_run_seconds', duration)
+        metrics.inc('fireaprs_runs_total', result=result)
+        metrics.set('fireaprs_last_run_timestamp_seconds', time.time())
+        # Single runs leave a JSON summary behind; the daemon serves its
+        # metrics over HTTP instead
+        if not runtime.persistent and config['metrics']['summary_path']:
+            write_summary(config['metrics']['summary_path'], result, duration,
+                          max_bytes=config['metrics']['summary_max_kb'] * 1024)
+    logging.info("Fire data processing completed.")
+    return result
+
+# Returns how the run ended: 'unchanged', 'nothing_new', 'over_budget',
+# 'no_fires' or 'sent'
+def run_once(config, runtime, force_download=False, reprocess=False):
+    # The filtered detections come back in memory
+    fire_data = runtime.downloader.run(force=force_download, reprocess=reprocess)
+    if fire_data is None:
+        logging.info("FIRMS data unchanged since last run. Nothing to process.")
+        return 'unchanged'
+    logging.info(f"Data downloaded and processed: {len(fire_data)} records.")
+    if runtime.tenants:
+        return deliver_tenants(runtime, fire_data)
+    return deliver(config, runtime, fire_data)
+
+# Outcomes from most to least done, for summing up several tenants
+RESULTS = ('sent', 'no_fires', 'over_budget', 'nothing_new')
+
+# One ingest, fanned out: every tenant gets the detections in its regions
+# and delivers them concurrently with the others, over its own APRS-IS
+# connection. A tenant that fails doesn't stop the rest.
+def deliver_tenants(runtime, fire_data):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def deliver_tenant(tenant):
+        try:
+            tenant_data = fire_data[fire_data['region'].isin(tenant.regions)].reset_index(drop=True)
+            result = deliver(tenant.config, tenant, tenant_data)
+        except Exception as e:
+            logging.error(f"Tenant '{tenant.name}' failed: {e}")
+            metrics.inc('fireaprs_tenant_runs_total', tenant=tenant.name, result='error')
+            return e
+        logging.info(f"Tenant '{tenant.name}': {result}.")
+        metrics.inc('fireaprs_tenant_runs_total', tenant=tenant.name, result=result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(runtime.tenants), thread_name_prefix="tenant") as executor:
+        results = list(executor.map(deliver_tenant, runtime.tenants))
+    done = [result for result in results if not isinstance(result, Exception)]
+    if not done:
+        raise results[0]
+    return min(done, key=RESULTS.index)
+
+# Everything after the ingest, for one set of detections: dedup against the
+# reported store, clustering, ranking, enrichment and APRS
+def deliver(config, runtime, fire_data):
+    downloader = runtime.downloader
+
+    # Only detections that earlier runs haven't reported go any further
+    reported_store = runtime.store() if not fire_data.empty else None
+    if reported_store:
+        with metrics.stage('dedup'):
+            reported_store.expire()
+            fire_data, new_keys = reported_store.filter_new(fire_data)
+        if fire_data.empty:
+            logging.info("All detections were already reported by earlier runs. Nothing to send.")
+            return 'nothing_new'
+        fire_data = fire_data.assign(detection_key=new_keys)
 
-    if not fire_data:
+    # Neighbouring pixels of the same fire become a single incident, so each
+    # fire is enriched and beaconed once
+    if not fire_data.empty and config['clustering']['enabled']:
+        from fire_aprs_cli.clustering import cluster_detections
+
+        with metrics.stage('cluster'):
+            fire_data = cluster_detections(
+                fire_data,
+                radius_km=config['clustering']['radius_km'],
+                time_window_minutes=config['clustering']['time_window_minutes'],
+            )
+
+    # Most important incidents first: they are enriched and queued ahead of
+    # minor ones, and the packet budget cuts from the bottom of the list
+    if not fire_data.empty and config['priority']['enabled']:
+        from fire_aprs_cli.priority import rank_incidents
+
+        with metrics.stage('prioritize'):
+            fire_data = rank_incidents(
+                fire_data, half_life_hours=config['priority']['half_life_hours'], now=runtime.now(),
+            )
+    # Incidents the budget leaves out stay unreported, so a later run with
+    # budget left sends them if they still rank high enough
+    if not fire_data.empty:
+        fire_data = runtime.budget().apply(fire_data)
+        if fire_data.empty:
+            logging.warning("Packet budget used up; nothing is sent this run.")
+            return 'over_budget'
+
+    aqi_fetcher = runtime.aqi() if not fire_data.empty else None
+    # Batch mode: one station query for the whole run instead of a geocode
+    # and feed request per record. Falls back to per-record lookups if the
+    # station query fails.
+    if aqi_fetcher and config['aqi']['batch'] and not fire_data.empty:
+        with metrics.stage('aqi_stations'):
+            loaded = runtime.load_stations(aqi_fetcher)
+        if not loaded:
+            logging.warning("AQI station query failed; falling back to per-record lookups.")
+    if aqi_fetcher and not aqi_fetcher.available():
+        logging.warning("WAQI is unavailable (circuit open); alerts are sent without AQI temperature.")
+
+    # Initialize APRS Sender (or reuse the daemon's open connection)
+    aprs_sender = runtime.sender()
+
+    if fire_data.empty:
         logging.info("No fire data available to process. Sending no-fire APRS message.")
         aprs_sender.send_no_fire_message()
-        aprs_sender.disconnect()
-        logging.info("Fire data processing completed.")
-        return
+        return 'no_fires'
 
-    # Iterate through each fire incident
-    for idx, message in enumerate(fire_data, start=1):
-        latitude = message.get('latitude')
-        longitude = message.get('longitude')
-
-        if latitude is None or longitude is None:
-            logging.warning(f"Record {idx}: Missing latitude or longitude. Skipping.")
-            continue
-
-        # Fetch AQI Temperature if enabled
-        if enable_aqi and aqi_fetcher:
-            aqi_temp = aqi_fetcher.get_aqi_temperature(latitude, longitude)
-            if aqi_temp is None:
-                aqi_temp = "N/A"
-                logging.warning(f"Record {idx}: AQI temperature not available.")
-        else:
-            aqi_temp = None  # AQI data not included
-
-        # Fetch News Link if enabled
-        if enable_news and news_fetcher:
-            news_link = news_fetcher.find_news_link()
-            if news_link == "No link found":
-                logging.warning(f"Record {idx}: No news link found.")
-        else:
-            news_link = None  # News data not included
-
-        # Compose APRS Message
-        aprs_message_parts = []
-        if aqi_temp is not None:
-            aprs_message_parts.append(f"AQI Temp: {aqi_temp}°C")
-        if news_link is not None:
-            aprs_message_parts.append(f"News: {news_link}")
-
-        # If no AQI and news data, provide minimal info
-        if not aprs_message_parts:
-            aprs_message_parts.append("Fire detected")
-
-        aprs_message = ", ".join(aprs_message_parts)
-
-        # Send APRS Message
-        aprs_sender.send_message(latitude, longitude, aprs_message)
-        logging.info(f"Record {idx}: APRS message sent.")
-
-    # Disconnect APRS
-    aprs_sender.disconnect()
-    logging.info("Fire data processing completed.")
+    news_fetchers = runtime.news()
+
+    # Positions (and object names) for every incident in one pass
+    with metrics.stage('aprs_encode'):
+        prefixes = aprs_sender.prepare(fire_data['latitude'].to_numpy(), fire_data['longitude'].to_numpy())
+    priorities = fire_data['priority'].tolist() if 'priority' in fire_data else [0.0] * len(fire_data)
+    keys = incident_keys(fire_data)
+
+    def enrich(item):
+        idx, message = item
+        return enrich_record(
+            idx, message, config, downloader.region_index,
+            aqi_fetcher, news_fetchers,
+        )
+
+    # Enrich many records at once; results come back in priority order
+    pipeline = EnrichmentPipeline(enrich, workers=config['pipeline']['workers'])
+    queued = 0
+    with metrics.stage('enrich'):
+        for result in pipeline.run(enumerate(fire_data.to_dict('records'), start=1)):
+            if result is None:
+                continue
+            idx, region, latitude, longitude, aprs_message = result
+
+            # Queue APRS Message; the sender paces and transmits in the background
+            # and marks the incident's detections reported once it is sent
+            on_done = None
+            if reported_store:
+                reported_store.hold(keys[idx - 1])
+                on_done = functools.partial(reported_store.release, keys[idx - 1])
+            aprs_sender.send_message(
+                latitude, longitude, aprs_message, prefix=prefixes[idx - 1], priority=priorities[idx - 1],
+                on_done=on_done,
+            )
+            queued += 1
+            logging.info(f"Record {idx} ({region}): APRS message queued (queue depth {aprs_sender.queue_depth()}).")
+    runtime.budget().spend(queued)
+    return 'sent'
+
+# The reported-store keys of the detections behind each incident
+def incident_keys(fire_data):
+    if 'detection_keys' in fire_data:
+        return fire_data['detection_keys'].tolist()
+    if 'detection_key' in fire_data:
+        return [[key] for key in fire_data['detection_key']]
+    return [[] for _ in range(len(fire_data))]
+
+# Reads config.ini into the per-section dicts the rest of the tool uses.
+# Raises on a missing file or invalid configuration.
+def load_config(config_path='config.ini'):
+    config_obj = Config(config_path)
+    return {
+        'viirs': config_obj.get_viirs_config(),
+        'regions': config_obj.get_region_configs(),
+        'sources': config_obj.get_source_configs(),
+        'tenants': config_obj.get_tenant_configs(),
+        'aprssend': config_obj.get_aprs_config(),
+        'aqi': config_obj.get_aqi_config(),
+        'geocode': config_obj.get_geocode_config(),
+        'newsfeed': config_obj.get_newsfeed_config(),
+        'pipeline': config_obj.get_pipeline_config(),
+        'clustering': config_obj.get_clustering_config(),
+        'priority': config_obj.get_priority_config(),
+        'state': config_obj.get_state_config(),
+        'metrics': config_obj.get_metrics_config(),
+        'logging': config_obj.get_logging_config(),
+    }
 
 def main():
     parser = argparse.ArgumentParser(description="Fire APRS CLI Tool")
@@ -120,7 +298,7 @@ def main():
         '-i', '--interval',
         type=int,
         default=60,
-        help='Interval in minutes between data fetches (default: 60, only used with --autoschedule)'
+        help='Interval in minutes between data fetches (default: 60, only used with --autoschedule and --replay)'
     )
     parser.add_argument(
         '--no-aqi',
@@ -132,6 +310,38 @@ def main():
         action='store_true',
         help='Disable fetching news links'
     )
+    parser.add_argument(
+        '--force-download',
+        action='store_true',
+        help='Ignore the cached FIRMS file and download it again even if unchanged upstream'
+    )
+    parser.add_argument(
+        '--reprocess',
+        action='store_true',
+        help='Filter and send the cached FIRMS file even if it is unchanged upstream (e.g. after editing regions)'
+    )
+    parser.add_argument(
+        '--replay',
+        nargs='+',
+        metavar='CSV',
+        help='Replay archived FIRMS CSV files through the pipeline instead of downloading, one run per --interval of simulated time'
+    )
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=1.0,
+        help='Replay speed as a multiple of real time (default: 1; 0 runs back to back)'
+    )
+    parser.add_argument(
+        '--sink',
+        default='file:data/replay_aprs.txt',
+        help='Where replayed APRS packets go: file:<path> or tcp:<host>:<port> (default: file:data/replay_aprs.txt)'
+    )
+    parser.add_argument(
+        '--replay-report',
+        metavar='PATH',
+        help='Write the replay report as JSON to this file'
+    )
     parser.add_argument(
         '--autoschedule',
         action='store_true',
@@ -141,14 +351,7 @@ def main():
 
     # Load Configuration
     try:
-        config_obj = Config()
-        config = {
-            'viirs': config_obj.get_viirs_config(),
-            'aprssend': config_obj.get_aprs_config(),
-            'aqi': config_obj.get_aqi_config(),
-            'newsfeed': config_obj.get_newsfeed_config(),
-            'logging': config_obj.get_logging_config(),
-        }
+        config = load_config()
     except Exception as e:
         print(f"Configuration Error: {e}")
         sys.exit(1)
@@ -156,42 +359,60 @@ def main():
     # Setup Logging
     setup_logging(config['logging'])
 
-    # Process Fire Data (runs once regardless of autoschedule setting)
-    try:
-        process_fire_data(
-            config,
-            enable_aqi=not args.no_aqi,
-            enable_news=not args.no_news
-        )
-    except Exception as e:
-        logging.error(f"Error during fire data processing: {e}")
-        sys.exit(1)
+    # Replays never touch the network for FIRMS or APRS-IS
+    if args.replay:
+        from fire_aprs_cli.replay import Replay
+
+        try:
+            replay = Replay(
+                config,
+                args.replay,
+                interval_minutes=args.interval,
+                speed=args.speed,
+                sink=args.sink,
+                enable_aqi=not args.no_aqi,
+                enable_news=not args.no_news,
+                report_path=args.replay_report,
+            )
+            report = replay.run(process_fire_data)
+        except Exception as e:
+            logging.error(f"Error during replay: {e}")
+            sys.exit(1)
+        print("\n".join(replay.summary_lines(report)))
+        sys.exit(0)
 
-    # If autoschedule is enabled, start the scheduler for periodic execution
+    # Autoschedule runs as a daemon: the first run happens right away and the
+    # connections and caches stay warm for the following ones
     if args.autoschedule:
+        from fire_aprs_cli.daemon import Daemon
+
         logging.info("Autoschedule enabled. Starting periodic scheduler...")
-        
-        # Initialize Scheduler for Periodic Execution
-        scheduler = Scheduler(
+        daemon = Daemon(
+            load_config,
+            process_fire_data,
             interval_minutes=args.interval,
-            job_func=process_fire_data,
             config=config,
             enable_aqi=not args.no_aqi,
             enable_news=not args.no_news
         )
+        daemon.serve(force_download=args.force_download, reprocess=args.reprocess)
+        return
 
-        # Start Scheduler
-        scheduler.start()
+    # Process Fire Data once
+    try:
+        process_fire_data(
+            config,
+            enable_aqi=not args.no_aqi,
+            enable_news=not args.no_news,
+            force_download=args.force_download,
+            reprocess=args.reprocess
+        )
+    except Exception as e:
+        logging.error(f"Error during fire data processing: {e}")
+        sys.exit(1)
 
-        # Keep the main thread alive for scheduled execution
-        try:
-            while True:
-                time.sleep(1)
-        except (KeyboardInterrupt, SystemExit):
-            scheduler.shutdown(None, None)
-    else:
-        logging.info("Single run completed. Use crontab or --autoschedule for periodic execution.")
-        sys.exit(0)
+    logging.info("Single run completed. Use crontab or --autoschedule for periodic execution.")
+    sys.exit(0)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,69 @@
+# tests/test_aprs_sender.py
+#
+# Source callsigns of the packets APRSSender writes, through a file sink,
+# checked with aprslib's own parser.
+#
+#   python -m pytest tests
+
+import os
+import sys
+
+import aprslib
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+
+from fire_aprs_cli.aprs_sender import FIRST_SSID, MAX_SSID, APRSSender
+
+@pytest.fixture
+def sink(tmp_path):
+    return tmp_path / 'packets.txt'
+
+def sender(sink, **options):
+    config = {
+        'callsign': 'N0CALL',
+        'password': '-1',
+        'comment': 'test',
+        'symbol': 'T',
+        'port': 14580,
+        'sink': f"file:{sink}",
+        'packets_per_minute': 0,
+    }
+    config.update(options)
+    return APRSSender(config)
+
+def sources(sink):
+    with open(sink) as f:
+        return [aprslib.parse(line.rstrip('\n'))['from'] for line in f]
+
+def test_ssids_wrap_and_every_run_starts_over(sink):
+    aprs = sender(sink)
+    count = MAX_SSID + 5
+    for index in range(count):
+        aprs.send_message(35.0, 33.0 + index / 1000, "Fire detected")
+    aprs.send_no_fire_message()
+    aprs.start_run()
+    aprs.send_message(35.0, 33.0, "Fire detected")
+    aprs.disconnect()
+
+    ssids = [int(source.split('-')[1]) for source in sources(sink)]
+    assert len(ssids) == count + 2
+    assert all(1 <= ssid <= MAX_SSID for ssid in ssids)
+    assert ssids[:2] == [FIRST_SSID, FIRST_SSID + 1]
+    assert ssids[-1] == FIRST_SSID
+
+def test_position_ssid_replaces_the_callsign_ssid(sink):
+    aprs = sender(sink, callsign='N0CALL-1')
+    aprs.send_message(35.0, 33.0, "Fire detected")
+    aprs.send_no_fire_message()
+    aprs.disconnect()
+
+    assert sources(sink) == [f"N0CALL-{FIRST_SSID}", f"N0CALL-{FIRST_SSID + 1}"]
+
+def test_objects_keep_the_callsign_ssid(sink):
+    aprs = sender(sink, callsign='N0CALL-1', report='object')
+    aprs.send_message(35.0, 33.0, "Fire detected")
+    aprs.disconnect()
+
+    assert sources(sink) == ['N0CALL-1']
@@ -0,0 +1,176 @@
+# tests/test_firms_download.py
+#
+# FIRMS downloads against the local HTTP stand-in in benchmarks/fakes.py:
+# area API queries and their fallback to the file URL, the digest check
+# for unchanged area answers, gzip transfers and resumes.
+#
+#   python -m pytest tests
+
+import gzip
+import os
+import sys
+
+import pytest
+import requests
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+
+from fakes import FakeServices
+from fire_aprs_cli.downloader import VIIRSDownloader
+from fire_aprs_cli.metrics import metrics
+
+HEADER = "latitude,longitude,bright_ti4,acq_date,acq_time,satellite,confidence,frp\n"
+
+# Two boxes overlapping between latitude 35-36 and longitude 33-34
+REGIONS = [
+    {'name': 'west', 'box': (34.0, 36.0, 32.0, 34.0)},
+    {'name': 'east', 'box': (35.0, 37.0, 33.0, 35.0)},
+]
+WEST_ONLY = (34.5, 32.5)
+OVERLAP = (35.5, 33.5)
+EAST_ONLY = (36.5, 34.5)
+OUTSIDE = (10.0, 10.0)
+# Three boxes apart from each other and from the ones above
+SCATTERED = [
+    {'name': 'north', 'box': (50.0, 51.0, 10.0, 11.0)},
+    {'name': 'south', 'box': (-31.0, -30.0, 20.0, 21.0)},
+    {'name': 'far', 'box': (-31.0, -30.0, 150.0, 151.0)},
+]
+SCATTERED_POINTS = [(50.5, 10.5), (-30.5, 20.5), (-30.5, 150.5)]
+BETWEEN = (-30.5, 80.0)
+
+def row(lat, lon, minute=0):
+    return f"{lat:.4f},{lon:.4f},330.5,2026-10-18,{minute:04d},N,n,12.5\n"
+
+@pytest.fixture(scope='module')
+def fakes(tmp_path_factory):
+    # Plenty of repeated background rows, so gzip makes a visible difference
+    path = tmp_path_factory.mktemp('firms') / 'global_24h.csv'
+    with open(path, 'w') as f:
+        f.write(HEADER)
+        f.writelines(row(*OUTSIDE, minute % 60) for minute in range(2000))
+        for point in (WEST_ONLY, OVERLAP, EAST_ONLY, *SCATTERED_POINTS, BETWEEN):
+            f.write(row(*point))
+    services = FakeServices(str(path)).start()
+    yield services
+    services.stop()
+
+@pytest.fixture(autouse=True)
+def reset(fakes):
+    fakes.reset()
+    metrics.reset()
+
+def downloader(fakes, tmp_path, regions=REGIONS, **options):
+    config = {
+        'url': f"{fakes.http_url}/firms/global_24h.csv",
+        'filepath': str(tmp_path / 'firms.csv'),
+        'area_url': f"{fakes.http_url}/firms/api/area/csv",
+        'map_key': fakes.map_key,
+    }
+    config.update(options)
+    return VIIRSDownloader(config, regions=regions, session=requests.Session())
+
+def data_rows(path):
+    with open(path) as f:
+        return f.readlines()[1:]
+
+def test_area_mode_writes_each_in_box_row_once(fakes, tmp_path):
+    area = downloader(fakes, tmp_path, mode='area')
+    assert area.download() is True
+    assert sorted(data_rows(area.file_path)) == sorted(row(*point) for point in (WEST_ONLY, OVERLAP, EAST_ONLY))
+    assert [path for path, _ in fakes.requests if 'global_24h' in path] == []
+    # The overlapping boxes are asked for as one
+    assert len(fakes.requests) == 1
+    assert '/32.0000,34.0000,35.0000,37.0000/' in fakes.requests[0][0]
+
+def test_separate_boxes_are_queried_separately(fakes, tmp_path):
+    area = downloader(fakes, tmp_path, regions=SCATTERED, mode='area')
+    assert area.download() is True
+    assert sorted(data_rows(area.file_path)) == sorted(row(*point) for point in SCATTERED_POINTS)
+    assert len(fakes.requests) == len(SCATTERED)
+
+def test_area_queries_are_capped(fakes, tmp_path):
+    area = downloader(fakes, tmp_path, regions=SCATTERED, mode='area', max_area_queries=2)
+    assert area.download() is True
+    assert len(fakes.requests) == 2
+    # The two southern boxes are closest together and share a query, which
+    # also returns the detection between them; filtering drops it
+    boxes = [path.split('/')[-2] for path, _ in fakes.requests]
+    assert sorted(boxes) == ['10.0000,50.0000,11.0000,51.0000', '20.0000,-31.0000,151.0000,-30.0000']
+    assert row(*BETWEEN) in data_rows(area.file_path)
+    assert sorted(area.process_csv()['region']) == ['far', 'north', 'south']
+
+def test_unchanged_area_answer_is_not_rewritten(fakes, tmp_path):
+    area = downloader(fakes, tmp_path, mode='area')
+    assert area.download() is True
+    mtime = os.stat(area.file_path).st_mtime_ns
+    assert area.download() is False
+    assert os.stat(area.file_path).st_mtime_ns == mtime
+
+def test_bad_map_key_falls_back_to_file_url(fakes, tmp_path):
+    area = downloader(fakes, tmp_path, mode='area', map_key='wrong', fallback=True)
+    assert area.download() is True
+    assert fakes.requests[-1][0] == '/firms/global_24h.csv'
+    with open(area.file_path, 'rb') as f, open(fakes.firms_path, 'rb') as source:
+        assert f.read() == source.read()
+
+def test_bad_map_key_raises_without_fallback(fakes, tmp_path):
+    area = downloader(fakes, tmp_path, mode='area', map_key='wrong', fallback=False)
+    with pytest.raises(requests.HTTPError):
+        area.download()
+    assert not os.path.exists(area.file_path)
+    assert all('global_24h' not in path for path, _ in fakes.requests)
+
+def test_file_download_asks_for_gzip(fakes, tmp_path):
+    firms = downloader(fakes, tmp_path)
+    assert firms.download() is True
+    assert fakes.requests[-1][1]['Accept-Encoding'] == 'gzip'
+    with open(firms.file_path, 'rb') as f, open(fakes.firms_path, 'rb') as source:
+        assert f.read() == source.read()
+
+def test_resumed_download_asks_for_identity(fakes, tmp_path):
+    firms = downloader(fakes, tmp_path)
+    with open(firms.part_path, 'wb') as f:
+        f.write(HEADER.encode())
+    firms.save_metadata({'partial': {'etag': '"interrupted"'}})
+
+    assert firms.download() is True
+    headers = fakes.requests[-1][1]
+    assert headers['Range'] == f"bytes={len(HEADER)}-"
+    assert headers['If-Range'] == '"interrupted"'
+    assert headers['Accept-Encoding'] == 'identity'
+    # The partial came from an older version, so the whole current file
+    # comes back and replaces it instead of being appended to it
+    with open(firms.file_path, 'rb') as f, open(fakes.firms_path, 'rb') as source:
+        assert f.read() == source.read()
+
+def test_interrupted_download_is_resumed(fakes, tmp_path):
+    firms = downloader(fakes, tmp_path)
+    with open(fakes.firms_path, 'rb') as source:
+        original = source.read()
+    with open(firms.part_path, 'wb') as f:
+        f.write(original[:len(original) // 3])
+    firms.save_metadata({'partial': {'etag': fakes.firms_etag()}})
+
+    assert firms.download() is True
+    assert fakes.requests[-1][1]['Range'] == f"bytes={len(original) // 3}-"
+    assert fakes.snapshot()['requests']['firms']['bytes'] == len(original) - len(original) // 3
+    with open(firms.file_path, 'rb') as f:
+        assert f.read() == original
+    assert not os.path.exists(firms.part_path)
+    assert 'partial' not in firms.load_metadata()
+
+def test_wire_bytes_are_counted_apart_from_csv_bytes(fakes, tmp_path):
+    firms = downloader(fakes, tmp_path)
+    assert firms.download() is True
+    wire = metrics.get('fireaprs_download_bytes_total')
+    with open(fakes.firms_path, 'rb') as source:
+        assert wire == len(gzip.compress(source.read(), compresslevel=6))
+    assert wire < os.path.getsize(firms.file_path)
+
+def test_area_wire_bytes_are_the_compressed_answers(fakes, tmp_path):
+    area = downloader(fakes, tmp_path, mode='area')
+    assert area.download() is True
+    assert metrics.get('fireaprs_download_bytes_total') == fakes.snapshot()['requests']['firms']['bytes']